@@ -0,0 +1,69 @@
+"""Measure file index scans and fuzzy finder latency.
+
+DIRECTORY is scanned twice against a fresh cache, once cold and once with
+every directory unchanged. The finder is then queried over its files
+repeated COPIES times under distinct prefixes, so a small tree can stand in
+for a large repository.
+
+Run with:
+
+    python benchmarks/file_finder.py [DIRECTORY] [--copies N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+for entry in (PROJECT_ROOT, PROJECT_ROOT / "frontend"):
+    if str(entry) not in sys.path:
+        sys.path.insert(0, str(entry))
+
+from code_browser.file_index import FileIndex  # noqa: E402
+from code_browser.fuzzy import FuzzyMatcher  # noqa: E402
+
+# Each query is timed as typed, one keystroke at a time.
+QUERIES = ["widgets", "cbwat", "readme", "gen.py", "zzq"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", nargs="?", default=str(PROJECT_ROOT))
+    parser.add_argument("--copies", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache:
+        cache_path = Path(cache, "files.json")
+        for label in ("cold", "warm"):
+            index = FileIndex(args.directory, cache_path)
+            index.load()
+            stats = index.scan()
+            print(
+                f"{label} scan: {stats.files} files, {stats.directories} directories,"
+                f" {stats.listed} listed, {stats.seconds * 1e3:.1f} ms"
+            )
+
+    paths = [f"copy{copy}/{path}" for copy in range(args.copies) for path in index.paths]
+    started = time.perf_counter()
+    matcher = FuzzyMatcher(paths)
+    print(f"matcher over {len(matcher)} paths built in {time.perf_counter() - started:.2f} s")
+
+    for query in QUERIES:
+        timings = []
+        for length in range(1, len(query) + 1):
+            started = time.perf_counter()
+            matcher.match(query[:length])
+            timings.append(time.perf_counter() - started)
+        print(
+            f"{query:<10} median {statistics.median(timings) * 1e3:6.2f} ms,"
+            f" max {max(timings) * 1e3:6.2f} ms per keystroke"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Compare location/offset conversion with and without the line index.
+
+Run with:
+
+    python benchmarks/line_index.py [LINES]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+for entry in (PROJECT_ROOT, PROJECT_ROOT / "frontend"):
+    if str(entry) not in sys.path:
+        sys.path.insert(0, str(entry))
+
+from code_browser.document import PieceTable  # noqa: E402
+
+
+def _split_cursor_to_index(text: str, cursor: tuple[int, int]) -> int:
+    """The previous ActionsMixin._cursor_to_index implementation."""
+    lines = text.split("\n")
+    row, col = cursor
+    row = max(0, min(row, len(lines) - 1))
+    col = max(0, min(col, len(lines[row])))
+    return sum(len(lines[line_index]) + 1 for line_index in range(row)) + col
+
+
+def _prefix_index_to_cursor(text: str, index: int) -> tuple[int, int]:
+    """The previous ActionsMixin._index_to_cursor implementation."""
+    index = max(0, min(index, len(text)))
+    prefix = text[:index]
+    row = prefix.count("\n")
+    last_newline = prefix.rfind("\n")
+    if last_newline == -1:
+        return row, len(prefix)
+    return row, len(prefix) - last_newline - 1
+
+
+def _per_call(func, args: list, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for arg in args:
+            func(*arg)
+    return (time.perf_counter() - started) / (repeat * len(args))
+
+
+def _format(seconds: float) -> str:
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:9.3f} ms"
+    return f"{seconds * 1e6:9.3f} us"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("lines", nargs="?", type=int, default=100_000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    text = "\n".join("x" * rng.randint(0, 80) for _ in range(args.lines))
+    locations = [(rng.randrange(args.lines), rng.randint(0, 40)) for _ in range(50)]
+    offsets = [rng.randrange(len(text)) for _ in range(50)]
+
+    document = PieceTable(text)
+    started = time.perf_counter()
+    document.lines
+    build = time.perf_counter() - started
+
+    rows = [
+        (
+            "location -> offset",
+            _per_call(_split_cursor_to_index, [(text, loc) for loc in locations], 1),
+            _per_call(document.offset_of, [(loc,) for loc in locations], 100),
+        ),
+        (
+            "offset -> location",
+            _per_call(_prefix_index_to_cursor, [(text, off) for off in offsets], 1),
+            _per_call(document.location_of, [(off,) for off in offsets], 100),
+        ),
+    ]
+
+    edits = [(rng.randrange(len(document)), "ab\ncd") for _ in range(200)]
+    started = time.perf_counter()
+    for offset, insert in edits:
+        document.replace_span(offset, offset, insert)
+    edit = (time.perf_counter() - started) / len(edits)
+
+    print(f"{args.lines} lines, {len(text)} characters")
+    print(f"index build (once per buffer): {_format(build)}")
+    print(f"edit incl. index update:       {_format(edit)}")
+    print()
+    print(f"{'conversion':<20} {'full scan':>12} {'line index':>12} {'speedup':>9}")
+    for name, before, after in rows:
+        print(f"{name:<20} {_format(before)} {_format(after)} {before / after:8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
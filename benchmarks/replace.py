@@ -0,0 +1,76 @@
+"""Measure project-wide replace: finding the replacements and applying them to text.
+
+Nothing is written; the edits are applied to the files' text in memory.
+
+Run with:
+
+    python benchmarks/replace.py [DIRECTORY] [--query TEXT] [--replacement TEXT]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+for entry in (PROJECT_ROOT, PROJECT_ROOT / "frontend"):
+    if str(entry) not in sys.path:
+        sys.path.insert(0, str(entry))
+
+from code_browser.file_index import FileIndex  # noqa: E402
+from code_browser.files import read_text_file  # noqa: E402
+from code_browser.parallel import process_pool  # noqa: E402
+from code_browser.replace import (  # noqa: E402
+    apply_edits,
+    find_replacements,
+    replacement_template,
+)
+from code_browser.search import SearchIndex, parse_query  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", nargs="?", default=str(PROJECT_ROOT))
+    parser.add_argument("--query", default="self")
+    parser.add_argument("--replacement", default="this")
+    args = parser.parse_args()
+
+    files = FileIndex(args.directory)
+    files.scan()
+    process_pool()
+    query = parse_query(args.query)
+    template = replacement_template(args.query, args.replacement, query.pattern)
+    for label, index in (("scan", None), ("indexed", SearchIndex(args.directory))):
+        if index is not None:
+            index.refresh(files.paths)
+        found = []
+        batches = 0
+        first = None
+        started = time.perf_counter()
+
+        def collect(replacements: list) -> None:
+            nonlocal batches, first
+            batches += 1
+            if first is None:
+                first = time.perf_counter() - started
+            found.extend(replacements)
+
+        find_replacements(files.root, files.paths, query, template, collect, index=index)
+        seconds = time.perf_counter() - started
+        edits = sum(len(replacement.edits) for replacement in found)
+        print(
+            f"{label:<8} {edits} replacements in {len(found)} files in {seconds * 1e3:.0f} ms"
+            f" ({batches} batches, first after {(first or 0) * 1e3:.0f} ms)"
+        )
+
+    started = time.perf_counter()
+    for replacement in found:
+        text = read_text_file(Path(files.root, replacement.path), lambda: False)
+        apply_edits(text, replacement.edits)
+    print(f"apply    {len(found)} files read and edited in {time.perf_counter() - started:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Measure project index build time and query latency.
+
+The files under DIRECTORY are indexed COPIES times under distinct paths, so
+a small tree can stand in for a large repository.
+
+Run with:
+
+    python benchmarks/retrieval.py [DIRECTORY] [--copies N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+for entry in (PROJECT_ROOT, PROJECT_ROOT / "frontend"):
+    if str(entry) not in sys.path:
+        sys.path.insert(0, str(entry))
+
+from code_browser.language import LanguageMixin  # noqa: E402
+from code_browser.file_index import FileIndex  # noqa: E402
+from code_browser.retrieval import ProjectIndex  # noqa: E402
+
+QUERIES = [
+    "save all buffers atomically with fsync",
+    "token bucket rate limit",
+    "parse http request headers",
+    "read file lines into a list",
+    "retry with exponential backoff",
+    "cache responses on disk",
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", nargs="?", default=str(PROJECT_ROOT))
+    parser.add_argument("--copies", type=int, default=1)
+    args = parser.parse_args()
+
+    files = FileIndex(args.directory)
+    files.scan()
+    texts = []
+    for relative in files.paths:
+        path = str(Path(args.directory, relative))
+        text = ProjectIndex._read(path)
+        if text is not None:
+            texts.append((path, text))
+
+    index = ProjectIndex(args.directory, LanguageMixin._language_from_path)
+    started = time.perf_counter()
+    for copy in range(args.copies):
+        for path, text in texts:
+            relative = Path(path).relative_to(args.directory)
+            index.update_file(str(Path(args.directory, f"copy{copy}", relative)), text)
+    build = time.perf_counter() - started
+
+    timings: dict[str, list[float]] = {query: [] for query in QUERIES}
+    for _ in range(5):
+        for query in QUERIES:
+            started = time.perf_counter()
+            index.search(query, 4)
+            timings[query].append(time.perf_counter() - started)
+
+    print(f"{index.file_count} files, {index.chunk_count} chunks")
+    print(f"build:  {build:.1f} s ({build / max(1, index.file_count) * 1e3:.2f} ms per file)")
+    for query, seconds in timings.items():
+        print(f"{query:<40} median {statistics.median(seconds) * 1e3:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Measure project search: trigram index build and load, and query latency.
+
+Each query is timed against the index and as a plain scan of every file,
+which is what searches fall back to for files that are not indexed.
+
+Run with:
+
+    python benchmarks/search.py [DIRECTORY]
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+for entry in (PROJECT_ROOT, PROJECT_ROOT / "frontend"):
+    if str(entry) not in sys.path:
+        sys.path.insert(0, str(entry))
+
+from code_browser.file_index import FileIndex  # noqa: E402
+from code_browser.parallel import process_pool  # noqa: E402
+from code_browser.search import SearchIndex, parse_query, search  # noqa: E402
+
+QUERIES = ["save_texts", "Lock()", "retry", "/def \\w+_index/", "zzqzzq"]
+
+
+def _time_query(root: str, paths: list[str], text: str, index: SearchIndex | None) -> tuple:
+    hits = []
+    timings = []
+    for _ in range(3):
+        hits = []
+        started = time.perf_counter()
+        read = search(root, paths, parse_query(text), hits.extend, index=index)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), read, len(hits)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", nargs="?", default=str(PROJECT_ROOT))
+    args = parser.parse_args()
+
+    files = FileIndex(args.directory)
+    files.scan()
+    paths = files.paths
+    process_pool()
+
+    with tempfile.TemporaryDirectory() as cache:
+        cache_path = Path(cache, "search.pickle")
+        index = SearchIndex(args.directory, cache_path)
+        started = time.perf_counter()
+        index.refresh(paths)
+        print(f"build:  {index.file_count} files in {time.perf_counter() - started:.2f} s")
+        print(f"size:   {cache_path.stat().st_size / 1e6:.1f} MB on disk")
+        index = SearchIndex(args.directory, cache_path)
+        started = time.perf_counter()
+        index.load()
+        index.refresh(paths)
+        print(f"reload: {time.perf_counter() - started:.2f} s (load and check for changes)")
+
+    for text in QUERIES:
+        indexed = _time_query(files.root, paths, text, index)
+        scanned = _time_query(files.root, paths, text, None)
+        print(
+            f"{text:<18} indexed {indexed[0] * 1e3:7.1f} ms ({indexed[1]} files read),"
+            f" scan {scanned[0] * 1e3:7.1f} ms ({scanned[1]} files), {indexed[2]} hits"
+        )
+
+
+if __name__ == "__main__":
+    main()
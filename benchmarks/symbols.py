@@ -0,0 +1,77 @@
+"""Measure the symbol index: build and incremental refresh, and lookup latency.
+
+Run with:
+
+    python benchmarks/symbols.py [DIRECTORY]
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+for entry in (PROJECT_ROOT, PROJECT_ROOT / "frontend"):
+    if str(entry) not in sys.path:
+        sys.path.insert(0, str(entry))
+
+from code_browser.file_index import FileIndex  # noqa: E402
+from code_browser.language import LanguageMixin  # noqa: E402
+from code_browser.parallel import process_pool  # noqa: E402
+from code_browser.symbols import SymbolIndex  # noqa: E402
+
+QUERIES = ["save_texts", "SymbolIndex", "get", "Thread", "index", "zzqzzq"]
+
+
+def _median_ms(call) -> tuple[float, int]:
+    timings = []
+    found = 0
+    for _ in range(5):
+        started = time.perf_counter()
+        found = len(call())
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1e3, found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", nargs="?", default=str(PROJECT_ROOT))
+    args = parser.parse_args()
+
+    files = FileIndex(args.directory)
+    files.scan()
+    paths = files.paths
+    process_pool()
+
+    with tempfile.TemporaryDirectory() as cache:
+        db_path = Path(cache, "symbols.sqlite3")
+        index = SymbolIndex(args.directory, db_path, LanguageMixin._language_from_path)
+        started = time.perf_counter()
+        parsed = index.refresh(paths)
+        print(
+            f"build:   {parsed} files, {index.symbol_count} symbols"
+            f" in {time.perf_counter() - started:.2f} s"
+        )
+        print(f"size:    {db_path.stat().st_size / 1e6:.1f} MB on disk")
+        index.close()
+        index = SymbolIndex(args.directory, db_path, LanguageMixin._language_from_path)
+        started = time.perf_counter()
+        index.refresh(paths)
+        print(f"refresh: {time.perf_counter() - started:.2f} s (check for changes)")
+
+        for text in QUERIES:
+            exact = _median_ms(lambda: index.definitions(text))
+            lookup = _median_ms(lambda: index.lookup(text))
+            print(
+                f"{text:<12} definition {exact[0]:6.2f} ms ({exact[1]} found),"
+                f" lookup {lookup[0]:6.2f} ms ({lookup[1]} found)"
+            )
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import json
+import os
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import NamedTuple, Protocol
+
+import httpx
+from google import genai
+
+
+class GenerationRequest(NamedTuple):
+    prompt: str
+    language: str
+    system_instruction: str
+
+
+class GenerationBackend(Protocol):
+    """A model that turns a `GenerationRequest` into code.
+
+    `name` and `model` identify the backend in cache keys, so two backends
+    or models never share cached responses.
+    """
+
+    name: str
+    model: str
+
+    def generate(self, request: GenerationRequest) -> str: ...
+
+    async def generate_async(self, request: GenerationRequest) -> str: ...
+
+    def stream(self, request: GenerationRequest) -> AsyncIterator[str]: ...
+
+    async def warm_up(self) -> None:
+        """Open a connection with a cheap request, raising if the backend is unreachable."""
+
+
+class GeminiBackend:
+    """Google Gemini through the `google-genai` SDK."""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str | None = None, model: str | None = None):
+        if api_key is None:
+            api_key = self._load_api_key()
+        if not api_key:
+            raise ValueError("Missing Gemini API key in .env (GEMINI_API_KEY or GOOGLE_API_KEY)")
+        self.client = genai.Client(api_key=api_key)
+        self.model = model or os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+    @staticmethod
+    def _load_api_key() -> str | None:
+        env_api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+        if env_api_key:
+            return env_api_key
+
+        env_path = Path(__file__).resolve().parents[1] / ".env"
+        if not env_path.exists():
+            return None
+
+        for raw_line in env_path.read_text(encoding="utf-8").splitlines():
+            line = raw_line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            key = key.strip()
+            value = value.strip().strip('"').strip("'")
+            if key in {"GEMINI_API_KEY", "GOOGLE_API_KEY"} and value:
+                return value
+        return None
+
+    def generate(self, request: GenerationRequest) -> str:
+        response = self.client.models.generate_content(
+            model=self.model,
+            contents=request.prompt,
+            config={"system_instruction": request.system_instruction},
+        )
+        return getattr(response, "text", None) or ""
+
+    async def generate_async(self, request: GenerationRequest) -> str:
+        response = await self.client.aio.models.generate_content(
+            model=self.model,
+            contents=request.prompt,
+            config={"system_instruction": request.system_instruction},
+        )
+        return getattr(response, "text", None) or ""
+
+    async def warm_up(self) -> None:
+        # Model metadata costs no tokens but goes through the same
+        # connection pool as generation.
+        await self.client.aio.models.get(model=self.model)
+
+    async def stream(self, request: GenerationRequest) -> AsyncIterator[str]:
+        stream = await self.client.aio.models.generate_content_stream(
+            model=self.model,
+            contents=request.prompt,
+            config={"system_instruction": request.system_instruction},
+        )
+        async for chunk in stream:
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
+
+
+class OpenAICompatibleBackend:
+    """Any server speaking the OpenAI chat completions API, e.g. a local one."""
+
+    name = "openai"
+
+    def __init__(
+        self,
+        base_url: str = "http://127.0.0.1:8089/v1",
+        model: str = "local",
+        api_key: str | None = None,
+        timeout: float = 120.0,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self._headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._timeout = timeout
+        self._client = httpx.Client(base_url=self.base_url, headers=self._headers, timeout=timeout)
+        self._async_client: httpx.AsyncClient | None = None
+
+    def _payload(self, request: GenerationRequest, stream: bool) -> dict:
+        return {
+            "model": self.model,
+            "stream": stream,
+            "messages": [
+                {"role": "system", "content": request.system_instruction},
+                {"role": "user", "content": request.prompt},
+            ],
+        }
+
+    def _async(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url, headers=self._headers, timeout=self._timeout
+            )
+        return self._async_client
+
+    @staticmethod
+    def _message_text(body: dict) -> str:
+        choices = body.get("choices") or [{}]
+        return (choices[0].get("message") or {}).get("content") or ""
+
+    def generate(self, request: GenerationRequest) -> str:
+        response = self._client.post("/chat/completions", json=self._payload(request, False))
+        response.raise_for_status()
+        return self._message_text(response.json())
+
+    async def generate_async(self, request: GenerationRequest) -> str:
+        response = await self._async().post(
+            "/chat/completions", json=self._payload(request, False)
+        )
+        response.raise_for_status()
+        return self._message_text(response.json())
+
+    async def warm_up(self) -> None:
+        # Any HTTP response means the pooled connection is up, so the status
+        # is not checked; servers without /models still answer.
+        await self._async().get("/models")
+
+    async def stream(self, request: GenerationRequest) -> AsyncIterator[str]:
+        async with self._async().stream(
+            "POST", "/chat/completions", json=self._payload(request, True)
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                text = (choices[0].get("delta") or {}).get("content")
+                if text:
+                    yield text
+
+
+def backend_from_env(api_key: str | None = None) -> GenerationBackend:
+    """Build the backend named by GAGGLE_BACKEND (gemini, openai or fake)."""
+    kind = os.getenv("GAGGLE_BACKEND", "gemini").strip().lower()
+    model = os.getenv("GAGGLE_MODEL") or None
+    if kind == "gemini":
+        return GeminiBackend(api_key, model)
+    if kind == "openai":
+        return OpenAICompatibleBackend(
+            os.getenv("OPENAI_BASE_URL", "http://127.0.0.1:8089/v1"),
+            model or "local",
+            api_key or os.getenv("OPENAI_API_KEY"),
+        )
+    if kind == "fake":
+        from bot.fake import FakeBackend
+
+        return FakeBackend(
+            first_delay=float(os.getenv("GAGGLE_FAKE_LATENCY", "0.2")),
+            chunk_delay=float(os.getenv("GAGGLE_FAKE_CHUNK_DELAY", "0.05")),
+        )
+    raise ValueError(f"Unknown GAGGLE_BACKEND: {kind!r}")
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator
+
+from bot.backends import GenerationRequest
+
+_COMMENT_PREFIXES = {
+    "python": "#",
+    "bash": "#",
+    "ruby": "#",
+    "yaml": "#",
+    "toml": "#",
+    "sql": "--",
+    "html": "<!--",
+    "xml": "<!--",
+    "markdown": "<!--",
+    "css": "/*",
+}
+_COMMENT_SUFFIXES = {"<!--": " -->", "/*": " */"}
+
+
+def fake_response(prompt: str, language: str) -> str:
+    """The deterministic response: the prompt as a comment in `language`."""
+    prefix = _COMMENT_PREFIXES.get(language, "//")
+    suffix = _COMMENT_SUFFIXES.get(prefix, "")
+    lines = [f"{prefix} {line}{suffix}" for line in prompt.splitlines() or [""]]
+    return "\n".join(lines) + "\n"
+
+
+class FakeBackend:
+    """In-process stand-in for a model with configurable latency.
+
+    The response is `response` if given, otherwise `fake_response`. It is
+    split into `chunk_size` character chunks, with `first_delay` seconds
+    before the first chunk and `chunk_delay` seconds between the rest.
+    """
+
+    name = "fake"
+    model = "fake"
+
+    def __init__(
+        self,
+        response: str | None = None,
+        chunk_size: int = 16,
+        first_delay: float = 0.2,
+        chunk_delay: float = 0.05,
+    ):
+        self.response = response
+        self.chunk_size = max(1, chunk_size)
+        self.first_delay = first_delay
+        self.chunk_delay = chunk_delay
+
+    def _response_for(self, request: GenerationRequest) -> str:
+        if self.response is not None:
+            return self.response
+        return fake_response(request.prompt, request.language)
+
+    def _total_delay(self, text: str) -> float:
+        chunks = max(1, -(-len(text) // self.chunk_size))
+        return self.first_delay + (chunks - 1) * self.chunk_delay
+
+    def generate(self, request: GenerationRequest) -> str:
+        text = self._response_for(request)
+        time.sleep(self._total_delay(text))
+        return text
+
+    async def generate_async(self, request: GenerationRequest) -> str:
+        text = self._response_for(request)
+        await asyncio.sleep(self._total_delay(text))
+        return text
+
+    async def warm_up(self) -> None:
+        await asyncio.sleep(0)
+
+    async def stream(self, request: GenerationRequest) -> AsyncIterator[str]:
+        text = self._response_for(request)
+        await asyncio.sleep(self.first_delay)
+        for start in range(0, len(text), self.chunk_size):
+            if start:
+                await asyncio.sleep(self.chunk_delay)
+            yield text[start : start + self.chunk_size]
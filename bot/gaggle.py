@@ -1,51 +1,216 @@
+import hashlib
+import json
+import logging
 import os
+import sqlite3
+import threading
+import time
+from collections.abc import AsyncIterator
 from pathlib import Path
 
-from google import genai
+from bot.backends import GenerationBackend, GenerationRequest, backend_from_env
 
+log = logging.getLogger(__name__)
 
-class Gaggle:
-    def __init__(self, api_key: str | None = None):
-        if api_key is None:
-            api_key = self._load_api_key()
-        if not api_key:
-            raise ValueError("Missing Gemini API key in .env (GEMINI_API_KEY or GOOGLE_API_KEY)")
-        self.client = genai.Client(api_key=api_key)
 
-    @staticmethod
-    def _load_api_key() -> str | None:
-        env_api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-        if env_api_key:
-            return env_api_key
+def _default_cache_path() -> Path:
+    cache_home = os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "gaggle" / "responses.sqlite3"
+
+
+class ResponseCache:
+    """Content-addressed store of model responses in a sqlite file.
+
+    Entries are keyed by a hash of everything that determines a response,
+    evicted least-recently-used first once their total size passes
+    `max_bytes`, and treated as missing once older than `ttl` seconds.
+    """
 
-        env_path = Path(__file__).resolve().parents[1] / ".env"
-        if not env_path.exists():
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float | None = None,
+    ):
+        self.path = Path(path) if path is not None else _default_cache_path()
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache | None":
+        """Build the cache described by the GAGGLE_CACHE* variables, or None if disabled.
+
+        Off unless GAGGLE_CACHE is set, since cached prompts hold source excerpts.
+        A cache file that cannot be opened is logged and leaves caching off.
+        """
+        if os.getenv("GAGGLE_CACHE", "0").strip().lower() in {"", "0", "false", "no", "off"}:
+            return None
+        max_mb = float(os.getenv("GAGGLE_CACHE_MAX_MB", "64"))
+        ttl = os.getenv("GAGGLE_CACHE_TTL")
+        try:
+            return cls(
+                os.getenv("GAGGLE_CACHE_PATH") or None,
+                max_bytes=int(max_mb * 1024 * 1024),
+                ttl=float(ttl) if ttl else None,
+            )
+        except (OSError, sqlite3.Error) as error:
+            log.warning("response cache disabled: %s", error)
             return None
 
-        for raw_line in env_path.read_text(encoding="utf-8").splitlines():
-            line = raw_line.strip()
-            if not line or line.startswith("#") or "=" not in line:
-                continue
-            key, value = line.split("=", 1)
-            key = key.strip()
-            value = value.strip().strip('"').strip("'")
-            if key in {"GEMINI_API_KEY", "GOOGLE_API_KEY"} and value:
-                return value
-        return None
-
-    def generate_response(self, prompt: str, language: str) -> str:
-        model = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+    @staticmethod
+    def key(model: str, system_instruction: str, language: str, prompt: str) -> str:
+        payload = json.dumps([model, system_instruction, language, prompt])
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=20).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total <= self.max_bytes:
+            return
+        oldest = self._db.execute("SELECT key, size FROM responses ORDER BY accessed")
+        doomed = []
+        for key, size in oldest:
+            doomed.append((key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            entries, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class Gaggle:
+    """Code generation through a pluggable backend, with a response cache."""
+
+    _UNSET = object()
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        cache: ResponseCache | None = _UNSET,
+        backend: GenerationBackend | None = None,
+    ):
+        self.backend = backend if backend is not None else backend_from_env(api_key)
+        self.cache = ResponseCache.from_env() if cache is Gaggle._UNSET else cache
+
+    @staticmethod
+    def _request(prompt: str, language: str) -> GenerationRequest:
         system_instruction = (
             "You are a code generation engine. Return only raw code as plain text. "
             "Do not use markdown. Do not use code fences. Do not add explanations, "
             f"labels, or surrounding text. Output only valid {language} code."
         )
-        response = self.client.models.generate_content(
-            model=model,
-            contents=prompt,
-            config={"system_instruction": system_instruction},
-        )
-        text = getattr(response, "text", None)
-        if text is None:
-            return ""
-        return text
\ No newline at end of file
+        return GenerationRequest(prompt, language, system_instruction)
+
+    def _cache_key(self, request: GenerationRequest) -> str | None:
+        if self.cache is None:
+            return None
+        model = f"{self.backend.name}:{self.backend.model}"
+        return ResponseCache.key(model, request.system_instruction, request.language, request.prompt)
+
+    def _cached(self, key: str | None, use_cache: bool) -> str | None:
+        if key is None or not use_cache:
+            return None
+        return self.cache.get(key)
+
+    def _store(self, key: str | None, text: str) -> None:
+        # Empty responses are usually failures, so they are not worth keeping.
+        if key is not None and text:
+            self.cache.put(key, text)
+
+    async def warm_up(self) -> float:
+        """Open the backend's connection ahead of the first request; returns seconds taken."""
+        started = time.perf_counter()
+        await self.backend.warm_up()
+        return time.perf_counter() - started
+
+    def generate_response(self, prompt: str, language: str, use_cache: bool = True) -> str:
+        request = self._request(prompt, language)
+        key = self._cache_key(request)
+        cached = self._cached(key, use_cache)
+        if cached is not None:
+            return cached
+        text = self.backend.generate(request)
+        self._store(key, text)
+        return text
+
+    async def generate_response_async(
+        self, prompt: str, language: str, use_cache: bool = True
+    ) -> str:
+        """Like `generate_response`, but awaitable and cancellable."""
+        request = self._request(prompt, language)
+        key = self._cache_key(request)
+        cached = self._cached(key, use_cache)
+        if cached is not None:
+            return cached
+        text = await self.backend.generate_async(request)
+        self._store(key, text)
+        return text
+
+    async def stream_response(
+        self, prompt: str, language: str, use_cache: bool = True
+    ) -> AsyncIterator[str]:
+        """Yield the response text in chunks as the model produces it.
+
+        A cached response is yielded as a single chunk. A streamed response
+        is only cached once it has been received completely.
+        """
+        request = self._request(prompt, language)
+        key = self._cache_key(request)
+        cached = self._cached(key, use_cache)
+        if cached is not None:
+            yield cached
+            return
+        parts: list[str] = []
+        async for text in self.backend.stream(request):
+            parts.append(text)
+            yield text
+        self._store(key, "".join(parts))
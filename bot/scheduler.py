@@ -0,0 +1,170 @@
+import asyncio
+import os
+import random
+import time
+from collections.abc import Callable
+from typing import NamedTuple
+
+import httpx
+
+from bot.gaggle import Gaggle
+
+# HTTP statuses worth retrying: timeouts, rate limiting and server errors.
+RETRYABLE_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether `error` is transient, e.g. a dropped connection or a 429/503."""
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+    else:
+        # google-genai's APIError carries the HTTP status as `code`.
+        status = getattr(error, "code", None)
+    return isinstance(status, int) and status in RETRYABLE_STATUSES
+
+
+class RetryPolicy(NamedTuple):
+    attempts: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+
+    def delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before retry number `attempt` (from 0)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, in bursts of up to `capacity`.
+
+    A rate of 0 or less means no limit.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """Wait for a token; returns how long the caller was throttled."""
+        waited = 0.0
+        if self.rate <= 0:
+            return waited
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class GenerationQueue:
+    """Runs generation requests with bounded concurrency, a rate limit and retries.
+
+    Requests wait for a concurrency slot and then a rate-limit token.
+    Retryable failures are retried with jittered exponential backoff, but
+    only until the first chunk is streamed. After that a retry would repeat
+    text the caller already received.
+    """
+
+    def __init__(
+        self,
+        gaggle: Gaggle,
+        concurrency: int = 4,
+        requests_per_minute: float = 60.0,
+        burst: int | None = None,
+        retry: RetryPolicy = RetryPolicy(),
+    ):
+        self.gaggle = gaggle
+        self.retry = retry
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._bucket = TokenBucket(
+            requests_per_minute / 60.0, burst if burst is not None else max(1, concurrency)
+        )
+        self.waiting = 0
+        self.running = 0
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "retries": 0,
+            "throttled": 0.0,
+        }
+
+    @classmethod
+    def from_env(cls, gaggle: Gaggle) -> "GenerationQueue":
+        """Configure from GAGGLE_CONCURRENCY, GAGGLE_RPM and GAGGLE_RETRIES."""
+        return cls(
+            gaggle,
+            concurrency=int(os.getenv("GAGGLE_CONCURRENCY", "4")),
+            requests_per_minute=float(os.getenv("GAGGLE_RPM", "60")),
+            retry=RetryPolicy(attempts=int(os.getenv("GAGGLE_RETRIES", "4"))),
+        )
+
+    async def run(
+        self,
+        prompt: str,
+        language: str,
+        on_chunk: Callable[[str], None] | None = None,
+        use_cache: bool = True,
+    ) -> str:
+        """Generate a response, passing each streamed chunk to `on_chunk`.
+
+        Returns the whole response. Raises the last error if every attempt
+        fails, or the first non-retryable one.
+        """
+        self.stats["submitted"] += 1
+        self.waiting += 1
+        started = False
+        try:
+            async with self._slots:
+                self.waiting -= 1
+                started = True
+                self.running += 1
+                try:
+                    text = await self._run_with_retries(prompt, language, on_chunk, use_cache)
+                finally:
+                    self.running -= 1
+        except asyncio.CancelledError:
+            if not started:
+                self.waiting -= 1
+            self.stats["cancelled"] += 1
+            raise
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        self.stats["completed"] += 1
+        return text
+
+    async def _run_with_retries(
+        self,
+        prompt: str,
+        language: str,
+        on_chunk: Callable[[str], None] | None,
+        use_cache: bool,
+    ) -> str:
+        attempt = 0
+        while True:
+            self.stats["throttled"] += await self._bucket.acquire()
+            parts: list[str] = []
+            try:
+                async for chunk in self.gaggle.stream_response(prompt, language, use_cache):
+                    parts.append(chunk)
+                    if on_chunk is not None:
+                        on_chunk(chunk)
+                return "".join(parts)
+            except Exception as error:
+                attempt += 1
+                if parts or attempt >= self.retry.attempts or not is_retryable(error):
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(self.retry.delay(attempt - 1))
@@ -0,0 +1,148 @@
+"""Local OpenAI-compatible stand-in server for offline benchmarks and load tests.
+
+Run with:
+
+    python -m bot.stub_server [--port 8089] [--latency 0.2] [--chunk-delay 0.05]
+
+and point the app at it with GAGGLE_BACKEND=openai. Responses are the
+deterministic `fake_response` for the request, streamed as server-sent
+events when the request asks for a stream.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from bot.fake import fake_response  # noqa: E402
+
+_LANGUAGE = re.compile(r"Output only valid (\S+) code")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "StubServer"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") != "/v1/models":
+            self.send_error(404)
+            return
+        self._send_json({"object": "list", "data": [{"id": "local", "object": "model"}]})
+
+    def do_POST(self) -> None:
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        messages = body.get("messages") or []
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        prompt = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        match = _LANGUAGE.search(system)
+        text = fake_response(prompt, match.group(1) if match else "text")
+        model = body.get("model", "local")
+        time.sleep(self.server.latency)
+        if body.get("stream"):
+            self._stream(model, text)
+        else:
+            self._send_json(
+                {
+                    "object": "chat.completion",
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                }
+            )
+
+    def _send_json(self, payload: dict) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, model: str, text: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        size = self.server.chunk_size
+        for start in range(0, len(text), size):
+            if start:
+                time.sleep(self.server.chunk_delay)
+            delta = {"content": text[start : start + size]}
+            self._write_event(
+                json.dumps(
+                    {
+                        "object": "chat.completion.chunk",
+                        "model": model,
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                    }
+                )
+            )
+        self._write_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_event(self, data: str) -> None:
+        event = f"data: {data}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int] = ("127.0.0.1", 8089),
+        latency: float = 0.2,
+        chunk_size: int = 16,
+        chunk_delay: float = 0.05,
+        verbose: bool = False,
+    ):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.chunk_size = max(1, chunk_size)
+        self.chunk_delay = chunk_delay
+        self.verbose = verbose
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve fake chat completions locally.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first byte.")
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--chunk-delay", type=float, default=0.05)
+    parser.add_argument("--verbose", action="store_true", help="Log every request.")
+    args = parser.parse_args()
+    server = StubServer(
+        (args.host, args.port), args.latency, args.chunk_size, args.chunk_delay, args.verbose
+    )
+    print(f"Serving on http://{args.host}:{server.server_port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
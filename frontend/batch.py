@@ -0,0 +1,355 @@
+"""Headless batch code generation.
+
+Run with:
+
+    python batch.py JOBS.jsonl [--output RESULTS.jsonl] [--workers N] [--write]
+
+Each line of JOBS.jsonl is one job:
+
+    {"path": "src/app.py", "prompt": "add a main()", "language": "python", "anchor": "end"}
+
+`language` defaults to the one implied by the file name. `anchor` says
+where the code goes: "start", "end" (the default), a row number, a
+[row, column] pair (both from 0), or a string, in which case the code goes
+after the first line containing it. Anchors are resolved against each
+file as it was when the run started. An optional `id` names the job in
+the results; otherwise one is derived from its fields.
+
+One JSON line per finished job is appended to the results file as soon
+as it completes. Running the same command again skips every job that
+already has an "ok" result, so an interrupted run can be resumed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from bot.gaggle import Gaggle  # noqa: E402
+from bot.scheduler import GenerationQueue, RetryPolicy  # noqa: E402
+from code_browser.context import (  # noqa: E402
+    build_code_prompt,
+    default_context_budget,
+    estimate_tokens,
+    pack_context,
+)
+from code_browser.document import normalize_newlines  # noqa: E402
+from code_browser.file_index import FileIndex  # noqa: E402
+from code_browser.ignore import default_exclude_patterns  # noqa: E402
+from code_browser.language import LanguageMixin  # noqa: E402
+from code_browser.retrieval import (  # noqa: E402
+    RETRIEVAL_SNIPPETS,
+    ProjectIndex,
+    default_retrieval_budget,
+    pack_snippets,
+)
+from code_browser.saving import save_texts  # noqa: E402
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run code generation jobs from a JSONL file.")
+    parser.add_argument("jobs", type=Path, help="JSONL file with one job per line.")
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        default=None,
+        help="Results JSONL to append to (defaults to JOBS with a .results.jsonl suffix).",
+    )
+    parser.add_argument(
+        "--root",
+        type=Path,
+        default=Path.cwd(),
+        help="Directory that relative job paths are resolved against (defaults to the cwd).",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=int(os.getenv("GAGGLE_CONCURRENCY", "4")),
+        help="Requests in flight at once (defaults to GAGGLE_CONCURRENCY or 4).",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=float,
+        default=float(os.getenv("GAGGLE_RPM", "60")),
+        help="Requests started per minute at most, 0 for no limit (defaults to GAGGLE_RPM or 60).",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=int(os.getenv("GAGGLE_RETRIES", "4")),
+        help="Attempts per job for transient errors (defaults to GAGGLE_RETRIES or 4).",
+    )
+    parser.add_argument(
+        "--write",
+        action="store_true",
+        help="Insert the generated code into the target files at their anchors.",
+    )
+    parser.add_argument(
+        "--related",
+        action="store_true",
+        help="Index --root first and add related code from other files to each prompt.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always ask the model, even for a request answered before.",
+    )
+    return parser.parse_args()
+
+
+def _job_id(job: dict) -> str:
+    if job.get("id") is not None:
+        return str(job["id"])
+    key = json.dumps(
+        [job.get("path"), job.get("language"), job.get("prompt"), job.get("anchor")],
+        sort_keys=True,
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def load_jobs(path: Path) -> list[dict]:
+    jobs = []
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as error:
+                raise SystemExit(f"{path}:{number}: invalid JSON: {error}") from error
+            if not isinstance(job, dict) or not job.get("path") or not job.get("prompt"):
+                raise SystemExit(f"{path}:{number}: a job needs a path and a prompt")
+            job["id"] = _job_id(job)
+            jobs.append(job)
+    return jobs
+
+
+def finished_ids(results: Path) -> set[str]:
+    """Ids of jobs with an "ok" result, ignoring a line cut short by an interruption."""
+    done: set[str] = set()
+    if not results.exists():
+        return done
+    with open(results, encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                done.add(record.get("id"))
+    return done
+
+
+def resolve_anchor(text: str, anchor) -> int:
+    """Offset in `text` where code for `anchor` is inserted."""
+    if anchor is None or anchor == "end":
+        return len(text)
+    if anchor == "start":
+        return 0
+    lines = text.split("\n")
+    if isinstance(anchor, int):
+        anchor = [anchor, 0]
+    if isinstance(anchor, list) and len(anchor) == 2 and all(isinstance(v, int) for v in anchor):
+        row = max(0, min(anchor[0], len(lines) - 1))
+        column = max(0, min(anchor[1], len(lines[row])))
+        return sum(len(line) + 1 for line in lines[:row]) + column
+    if isinstance(anchor, str):
+        offset = 0
+        for line in lines:
+            offset += len(line) + 1
+            if anchor in line:
+                return min(offset, len(text))
+        raise ValueError(f"anchor not found: {anchor!r}")
+    raise ValueError(f"invalid anchor: {anchor!r}")
+
+
+class _TargetFile:
+    """A job target, read once so every anchor refers to the original text.
+
+    A file that does not exist yet starts out empty and is created by the
+    first insertion.
+
+    Insertions are applied in completion order. Each is shifted by the
+    length of earlier insertions at or before its original offset, so jobs
+    sharing an anchor land one after another.
+    """
+
+    def __init__(self, path: Path) -> None:
+        raw = path.read_bytes().decode("utf-8") if path.exists() else ""
+        self.path = path
+        self.newline = "\r\n" if "\r\n" in raw else "\n"
+        self.original = raw.replace("\r\n", "\n").replace("\r", "\n")
+        self.text = self.original
+        self.lock = asyncio.Lock()
+        self._inserted: list[tuple[int, int]] = []
+
+    async def insert(self, offset: int, code: str) -> None:
+        code = normalize_newlines(code, "\n")
+        at_line_start = offset == 0 or self.original[offset - 1] == "\n"
+        if at_line_start and offset < len(self.original) and not code.endswith("\n"):
+            code += "\n"
+        elif offset == len(self.original) and self.original and not at_line_start:
+            code = "\n" + code
+        async with self.lock:
+            position = offset + sum(length for start, length in self._inserted if start <= offset)
+            text = self.text[:position] + code + self.text[position:]
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            (result,) = await asyncio.to_thread(
+                save_texts, [(str(self.path), normalize_newlines(text, self.newline))]
+            )
+            if result.status == "failed":
+                raise OSError(result.error)
+            self.text = text
+            self._inserted.append((offset, len(code)))
+
+
+class BatchRunner:
+    def __init__(self, args: argparse.Namespace, gaggle: Gaggle, output: Path) -> None:
+        self.args = args
+        self.output = output
+        self.root = args.root.resolve()
+        self.queue = GenerationQueue(
+            gaggle,
+            concurrency=args.workers,
+            requests_per_minute=args.rpm,
+            retry=RetryPolicy(attempts=args.retries),
+        )
+        self.context_budget = default_context_budget()
+        self.retrieval_budget = default_retrieval_budget() if args.related else 0
+        self.index = ProjectIndex(str(self.root), LanguageMixin._language_from_path)
+        self.language_from_path = LanguageMixin._language_from_path
+        self.files: dict[Path, _TargetFile] = {}
+        self.counts = {"ok": 0, "error": 0}
+
+    def _language(self, job: dict, path: Path) -> str:
+        if job.get("language"):
+            return job["language"]
+        return self.language_from_path(str(path)) or path.suffix.lower().lstrip(".") or "text"
+
+    def _target(self, path: Path) -> _TargetFile:
+        target = self.files.get(path)
+        if target is None:
+            target = self.files[path] = _TargetFile(path)
+        return target
+
+    def _prompt(self, job: dict, path: Path, target: _TargetFile, offset: int) -> str:
+        language = self._language(job, path)
+        row = target.original.count("\n", 0, offset)
+        column = offset - (target.original.rfind("\n", 0, offset) + 1)
+        context = None
+        if self.context_budget > 0:
+            context = pack_context(target.original, language, (row, column), self.context_budget)
+        related = ""
+        if self.retrieval_budget > 0:
+            lines = target.original.split("\n")
+            nearby = "\n".join(lines[max(0, row - 3) : row + 4])
+            snippets = self.index.search(
+                f"{job['prompt']}\n{nearby}", RETRIEVAL_SNIPPETS, exclude=str(path)
+            )
+            related = pack_snippets(
+                snippets, self._snippet_lines, str(self.root), self.retrieval_budget
+            )
+        return build_code_prompt(job["prompt"], language, context, related)
+
+    @staticmethod
+    def _snippet_lines(path: str) -> list[str] | None:
+        try:
+            return Path(path).read_text(encoding="utf-8").split("\n")
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    async def run_job(self, job: dict, out) -> None:
+        path = Path(job["path"])
+        if not path.is_absolute():
+            path = self.root / path
+        record: dict = {"id": job["id"], "path": job["path"]}
+        submitted = time.monotonic()
+        first_chunk: list[float] = []
+
+        def on_chunk(chunk: str) -> None:
+            if not first_chunk:
+                first_chunk.append(time.monotonic() - submitted)
+
+        try:
+            target = self._target(path)
+            offset = resolve_anchor(target.original, job.get("anchor"))
+            prompt = self._prompt(job, path, target, offset)
+            record["prompt_tokens"] = estimate_tokens(prompt)
+            code = await self.queue.run(
+                prompt, self._language(job, path), on_chunk, use_cache=not self.args.no_cache
+            )
+            record["latency"] = round(time.monotonic() - submitted, 3)
+            record["first_chunk"] = round(first_chunk[0], 3) if first_chunk else None
+            if self.args.write and code:
+                await target.insert(offset, code)
+            record.update(status="ok", written=bool(self.args.write and code), output=code)
+        except Exception as error:
+            record.setdefault("latency", round(time.monotonic() - submitted, 3))
+            record.update(status="error", error=str(error).strip() or type(error).__name__)
+        self.counts[record["status"]] += 1
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+
+    async def run(self, jobs: list[dict], out) -> None:
+        if self.retrieval_budget > 0:
+            started = time.perf_counter()
+            # The same file list as the code browser, so ignored files stay out of prompts.
+            files = FileIndex(str(self.root), extra_ignores=default_exclude_patterns())
+            await asyncio.to_thread(files.scan)
+            await asyncio.to_thread(self.index.build, files.paths)
+            for own_file in (self.args.jobs, self.output):
+                self.index.update_file(str(own_file.resolve()), None)
+            print(
+                f"indexed {self.index.file_count} files in {time.perf_counter() - started:.1f}s",
+                file=sys.stderr,
+            )
+        await asyncio.gather(*(self.run_job(job, out) for job in jobs))
+
+
+def main() -> int:
+    args = _parse_args()
+    jobs = load_jobs(args.jobs)
+    output = args.output or args.jobs.with_suffix(".results.jsonl")
+    done = finished_ids(output)
+    pending = [job for job in jobs if job["id"] not in done]
+    skipped = len(jobs) - len(pending)
+    if skipped:
+        print(f"skipping {skipped} finished job(s) recorded in {output}", file=sys.stderr)
+
+    try:
+        gaggle = Gaggle()
+    except ValueError as error:
+        print(f"generation unavailable: {error}", file=sys.stderr)
+        return 2
+
+    runner = BatchRunner(args, gaggle, output)
+    started = time.monotonic()
+    with open(output, "a", encoding="utf-8") as out:
+        try:
+            asyncio.run(runner.run(pending, out))
+        except KeyboardInterrupt:
+            print("interrupted; run again to resume", file=sys.stderr)
+            return 130
+    counts = runner.counts
+    print(
+        f"{counts['ok']} ok, {counts['error']} failed, {skipped} skipped"
+        f" in {time.monotonic() - started:.1f}s",
+        file=sys.stderr,
+    )
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,77 +1,67 @@
 from __future__ import annotations
 
+import os
+import re
+from collections.abc import Callable
 from pathlib import Path
 
-from textual.highlight import highlight
-from textual.widgets import Static, Tabs, TextArea
+from textual import work
+from textual.worker import get_current_worker
+from textual.widgets import Input, Tabs, TextArea
 from textual.widgets.text_area import Selection
 
-from .widgets import ConfirmSaveScreen, FileTab, path_to_tab_id
+from .document import PieceTable, text_digest
+from .files import UnsupportedFileError, read_text_file
+from .replace import FileReplacement, apply_edits
+from .saving import SaveResult, save_texts
+from .widgets import CodeEditor, ConfirmSaveScreen, FileTab, path_to_tab_id
 
+_IDENTIFIER = re.compile(r"\w+")
+# Files read and edited off the event loop before their buffers are handed over.
+REPLACE_BATCH_FILES = 100
 
-class ActionsMixin:
-    @staticmethod
-    def _cursor_to_index(text: str, cursor: tuple[int, int]) -> int:
-        lines = text.split("\n")
-        if not lines:
-            return 0
-        row, col = cursor
-        row = max(0, min(row, len(lines) - 1))
-        col = max(0, min(col, len(lines[row])))
-        return sum(len(lines[line_index]) + 1 for line_index in range(row)) + col
-
-    @staticmethod
-    def _index_to_cursor(text: str, index: int) -> tuple[int, int]:
-        index = max(0, min(index, len(text)))
-        prefix = text[:index]
-        row = prefix.count("\n")
-        last_newline = prefix.rfind("\n")
-        if last_newline == -1:
-            col = len(prefix)
-        else:
-            col = len(prefix) - last_newline - 1
-        return row, col
 
+class ActionsMixin:
     def _selection_span(self) -> tuple[int, int] | None:
         if not self.selection_mode or self._selection_anchor is None or self.path is None:
             return None
+        document = self._record_editor_edits()
+        if document is None:
+            return None
         code_view = self.query_one("#code-editor", TextArea)
-        text = code_view.text
-        start = self._cursor_to_index(text, code_view.selection.start)
-        end = self._cursor_to_index(text, code_view.selection.end)
+        start = document.offset_of(code_view.selection.start)
+        end = document.offset_of(code_view.selection.end)
         if start == end:
             return None
         if start > end:
             start, end = end, start
         return start, end
 
-    def _sync_active_buffer_from_editor(self) -> None:
+    def _record_editor_edits(self) -> PieceTable | None:
+        """Replay the edits made in the editor into the active file's buffer."""
         if self.path is None:
+            return None
+        code_view = self.query_one("#code-editor", CodeEditor)
+        edits = code_view.take_edits()
+        document = self.buffers.get(self.path)
+        if document is None:
+            return None
+        for start, end, text in edits:
+            document.replace(start, end, text)
+        return document
+
+    def _sync_active_buffer_from_editor(self) -> None:
+        document = self._record_editor_edits()
+        if document is None:
             return
-        code_view = self.query_one("#code-editor", TextArea)
-        current_text = code_view.text
-        self.buffers[self.path] = current_text
-        self._apply_editor_language(self.path, current_text)
-        if current_text == self.saved_buffers.get(self.path, ""):
+        self._apply_editor_language(self.path, document)
+        if not document.dirty:
             self.dirty_buffers.discard(self.path)
         else:
             self.dirty_buffers.add(self.path)
-        self.query_one("#code-static", Static).update(highlight(current_text, path=self.path))
+        self._render_code_static()
         self._update_tab_label(self.path)
 
-    def _replace_editor_text(self, text: str, cursor: tuple[int, int]) -> None:
-        code_view = self.query_one("#code-editor", TextArea)
-        was_read_only = code_view.read_only
-        if was_read_only:
-            code_view.read_only = False
-        self._loading_buffer = True
-        code_view.text = text
-        self._loading_buffer = False
-        code_view.cursor_location = cursor
-        if was_read_only:
-            code_view.read_only = True
-        self._sync_active_buffer_from_editor()
-
     def action_toggle_files(self) -> None:
         """Called in response to key binding."""
         self.show_tree = not self.show_tree
@@ -83,6 +73,9 @@ class ActionsMixin:
         if not self.insert_mode and self.path is None:
             self.sub_title = "NO FILE OPEN"
             return
+        if not self.insert_mode and self.path not in self.buffers:
+            self.sub_title = "FILE NOT LOADED"
+            return
         if not self.insert_mode:
             self.selection_mode = False
         self.insert_mode = not self.insert_mode
@@ -96,9 +89,262 @@ class ActionsMixin:
             self.sub_title = "OPEN A FILE FIRST"
             return
         code_view = self.query_one("#code-editor", TextArea)
+        self._request_path = self.path
         self._request_insert_location = code_view.cursor_location
         self.request_mode = True
 
+    def action_toggle_finder(self) -> None:
+        """Show/hide the fuzzy file finder."""
+        if self.finder_mode:
+            self.finder_mode = False
+            return
+        if self.insert_mode or self.request_mode:
+            return
+        self.finder_mode = True
+
+    def action_toggle_search(self) -> None:
+        """Show/hide the project search panel."""
+        if self.search_mode:
+            self.search_mode = False
+            return
+        if self.insert_mode or self.request_mode or self.finder_mode:
+            return
+        self.search_mode = True
+
+    def action_toggle_symbols(self) -> None:
+        """Show/hide the workspace symbol panel."""
+        if self.symbol_mode:
+            self.symbol_mode = False
+            return
+        if self.insert_mode or self.request_mode or self.finder_mode or self.search_mode:
+            return
+        self.symbol_mode = True
+
+    def action_toggle_replace(self) -> None:
+        """Show/hide the project search-and-replace panel."""
+        if self.replace_mode:
+            self.replace_mode = False
+            return
+        if (
+            self.insert_mode
+            or self.request_mode
+            or self.finder_mode
+            or self.search_mode
+            or self.symbol_mode
+        ):
+            return
+        self.replace_mode = True
+
+    def _apply_replacements(self) -> None:
+        """Make the accepted replacements in the buffers, then save the clean ones.
+
+        Files without a buffer are read and edited in a worker and only get
+        a buffer, not an editor document, so no TextArea is built per file.
+        A file whose text changed since the preview, or that a generation is
+        still writing into, is left alone.
+        """
+        if self._replace_timer is not None or self._replace_previewing:
+            self.sub_title = "PREVIEW STILL RUNNING"
+            return
+        accepted = [
+            replacement
+            for number, replacement in enumerate(self._replacements)
+            if number not in self._rejected_replacements
+        ]
+        if not accepted:
+            self.sub_title = "NOTHING TO REPLACE"
+            return
+        self._record_editor_edits()
+        root = os.path.abspath(self.root_path)
+        buffer_paths = {os.path.relpath(path, root): path for path in self.buffers}
+        jobs = []
+        skipped = 0
+        for replacement in accepted:
+            path = buffer_paths.get(replacement.path, str(Path(self.root_path, replacement.path)))
+            if path in self._large_files:
+                skipped += 1
+                continue
+            document = self.buffers.get(path)
+            jobs.append((path, replacement, document.snapshot() if document else None))
+        self.replace_mode = False
+        self.sub_title = f"REPLACING IN {len(jobs)} FILES..."
+        self._prepare_replacements(jobs, skipped)
+
+    @work(thread=True, exclusive=True, group="replace")
+    def _prepare_replacements(
+        self,
+        jobs: list[tuple[str, FileReplacement, PieceTable | None]],
+        skipped: int,
+    ) -> None:
+        """Read and edit the files off the event loop, handing buffers over in batches."""
+        worker = get_current_worker()
+        applied: list[tuple[str, bool]] = []
+        counts: dict[str, int] = {}
+        ready = []
+        for number, (path, replacement, snapshot) in enumerate(jobs, 1):
+            if worker.is_cancelled:
+                return
+            document = None
+            if snapshot is not None:
+                text = snapshot.text
+            else:
+                try:
+                    text = read_text_file(path, lambda: worker.is_cancelled)
+                except (OSError, UnsupportedFileError):
+                    text = None
+                if text is not None:
+                    document = PieceTable(text)
+            if text is None or text_digest(text) != replacement.digest:
+                skipped += 1
+            else:
+                generation = snapshot.generation if snapshot is not None else None
+                ready.append(
+                    (path, document, generation, apply_edits(text, replacement.edits))
+                )
+                counts[path] = len(replacement.edits)
+            if len(ready) == REPLACE_BATCH_FILES or number == len(jobs):
+                installed = self.call_from_thread(self._install_replacements, ready)
+                skipped += len(ready) - len(installed)
+                applied.extend(installed)
+                ready = []
+        edits = sum(counts[path] for path, _ in applied)
+        self.call_from_thread(self._replacements_applied, applied, edits, skipped)
+
+    def _install_replacements(
+        self, ready: list[tuple[str, PieceTable | None, int | None, tuple[int, int, str]]]
+    ) -> list[tuple[str, bool]]:
+        """Apply prepared edits to the buffers.
+
+        Returns each changed path with whether its buffer already held
+        unsaved edits.
+
+        An existing buffer is only changed if it was not edited since its
+        snapshot was taken, and a new one only if no buffer was opened for
+        the file meanwhile. Files a generation is still writing into are
+        left alone. The active file is edited through the editor, so the
+        replacement can be undone like any other edit.
+        """
+        code_view = self.query_one("#code-editor", CodeEditor)
+        self._record_editor_edits()
+        generating = {job.path for job in self._generation_jobs}
+        installed = []
+        for path, document, generation, (start, end, middle) in ready:
+            if path in generating:
+                continue
+            if document is None:
+                document = self.buffers.get(path)
+                if document is None or document.generation != generation:
+                    continue
+            elif path in self.buffers:
+                continue
+            else:
+                self.buffers[path] = document
+            was_dirty = document.dirty
+            if path == self.path:
+                was_read_only = code_view.read_only
+                code_view.read_only = False
+                code_view.replace(
+                    middle,
+                    document.location_of(start),
+                    document.location_of(end),
+                    maintain_selection_offset=True,
+                )
+                code_view.read_only = was_read_only
+                self._record_editor_edits()
+                self._apply_editor_language(path, document)
+                self._render_code_static()
+            else:
+                document.replace_span(start, end, middle)
+                # The editor rebuilds the document from the buffer when it is shown.
+                code_view.forget_document(path)
+            if document.dirty:
+                self.dirty_buffers.add(path)
+            else:
+                self.dirty_buffers.discard(path)
+            self._update_tab_label(path)
+            installed.append((path, was_dirty))
+        return installed
+
+    def _replacements_applied(
+        self, applied: list[tuple[str, bool]], edits: int, skipped: int
+    ) -> None:
+        """Save the files the replacement changed.
+
+        Buffers that already held unsaved edits are left dirty for the user
+        to save, so the replacement never writes out work they had not saved.
+        """
+        summary = f"REPLACED {edits} IN {len(applied)} FILES"
+        if skipped:
+            summary += f", {skipped} SKIPPED AS CHANGED OR BEING GENERATED INTO"
+        unsaved = sum(was_dirty for _, was_dirty in applied)
+        if unsaved:
+            summary += f", {unsaved} WITH EARLIER EDITS LEFT UNSAVED"
+        self.sub_title = summary
+        paths = [path for path, was_dirty in applied if not was_dirty]
+        if not paths:
+            return
+
+        def saved(results: list[SaveResult]) -> None:
+            # Buffers made only for the replacement are not kept once saved.
+            for path in paths:
+                if path not in self.open_tabs and path not in self.dirty_buffers:
+                    self.buffers.pop(path, None)
+            if all(result.status != "failed" for result in results):
+                self.sub_title = f"{summary}, SAVED"
+
+        self._save_paths(paths, saved)
+
+    def action_goto_definition(self) -> None:
+        """Jump to the definition of the identifier under the cursor.
+
+        With several definitions of the name, the symbol panel lists them.
+        """
+        if self.path is None or self.path not in self.buffers:
+            return
+        code_view = self.query_one("#code-editor", CodeEditor)
+        row, column = code_view.cursor_location
+        line = code_view.document.get_line(row)
+        word = next(
+            (
+                match.group()
+                for match in _IDENTIFIER.finditer(line)
+                if match.start() <= column <= match.end()
+            ),
+            None,
+        )
+        if word is None:
+            self.sub_title = "NO IDENTIFIER AT CURSOR"
+            return
+        definitions = self._symbol_index.definitions(word)
+        if not definitions:
+            self.sub_title = f"NO DEFINITION OF {word[:40]}"
+            return
+        if len(definitions) == 1:
+            symbol = definitions[0]
+            self._open_file(str(Path(self.root_path, symbol.path)), (symbol.row, symbol.column))
+            return
+        self.symbol_mode = True
+        self.query_one("#symbol-input", Input).value = word
+
+    def _open_file(self, file_path: str, location: tuple[int, int] | None = None) -> None:
+        """Open `file_path` in a tab, or switch to its tab if it is already open.
+
+        With `location`, the cursor is put there once the file is shown.
+        """
+        code_view = self.query_one("#code-editor", CodeEditor)
+        if self.path is not None:
+            self.cursor_positions[self.path] = code_view.cursor_location
+            self._record_editor_edits()
+        if location is not None:
+            self.cursor_positions[file_path] = location
+        if file_path not in self.open_tabs:
+            self.open_tabs.append(file_path)
+            self._add_file_tab(file_path)
+        self.path = file_path
+        if location is not None and file_path in self.buffers:
+            code_view.cursor_location = location
+            code_view.scroll_cursor_visible(center=True, animate=False)
+
     def action_toggle_selection(self) -> None:
         """Toggle visual selection anchored at current cursor location."""
         if self.path is None or self.request_mode or self.insert_mode:
@@ -134,13 +380,13 @@ class ActionsMixin:
             self.sub_title = "YANK BUFFER EMPTY"
             return
         code_view = self.query_one("#code-editor", TextArea)
-        current_text = code_view.text
-        cursor_index = self._cursor_to_index(current_text, code_view.cursor_location)
-        new_text = (
-            current_text[:cursor_index] + self._yank_buffer + current_text[cursor_index:]
-        )
-        new_cursor = self._index_to_cursor(new_text, cursor_index + len(self._yank_buffer))
-        self._replace_editor_text(new_text, new_cursor)
+        was_read_only = code_view.read_only
+        if was_read_only:
+            code_view.read_only = False
+        code_view.insert(self._yank_buffer, maintain_selection_offset=False)
+        if was_read_only:
+            code_view.read_only = True
+        self._sync_active_buffer_from_editor()
         self.selection_mode = False
         self.sub_title = "PASTED"
 
@@ -173,35 +419,112 @@ class ActionsMixin:
         if not self.dirty_buffers:
             self.sub_title = "NO CHANGES"
             return
-
-        failed: list[str] = []
-        saved: list[str] = []
-        for file_path in list(self.dirty_buffers):
-            buffer_text = self.buffers.get(file_path)
-            if buffer_text is None:
+        self._save_paths(list(self.dirty_buffers))
+
+    def _save_paths(
+        self,
+        paths: list[str],
+        on_complete: Callable[[list[SaveResult]], None] | None = None,
+    ) -> None:
+        """Save the buffers for `paths` in the background.
+
+        Snapshots are taken here, so editing can continue while the files are
+        written. Only one batch runs at a time; requests made meanwhile are
+        merged into the next batch.
+        """
+        if self._save_in_progress:
+            self._queued_saves.append((paths, on_complete))
+            return
+        self._record_editor_edits()
+        jobs = [
+            (path, self.buffers[path].snapshot()) for path in paths if path in self.buffers
+        ]
+        if not jobs:
+            if on_complete is not None:
+                on_complete([])
+            return
+        self._save_in_progress = True
+        self.sub_title = f"SAVING {len(jobs)}..."
+        self._write_snapshots(jobs, on_complete)
+
+    @work(thread=True, group="save")
+    def _write_snapshots(
+        self,
+        jobs: list[tuple[str, PieceTable]],
+        on_complete: Callable[[list[SaveResult]], None] | None,
+    ) -> None:
+        """Flatten and write the snapshots off the event loop."""
+        results = save_texts([(path, snapshot.text) for path, snapshot in jobs])
+        for (_, snapshot), result in zip(jobs, results):
+            if result.status != "failed":
+                snapshot.compact()
+                snapshot.mark_saved()
+        self.call_from_thread(self._saves_finished, jobs, results, on_complete)
+
+    def _saves_finished(
+        self,
+        jobs: list[tuple[str, PieceTable]],
+        results: list[SaveResult],
+        on_complete: Callable[[list[SaveResult]], None] | None,
+    ) -> None:
+        saved = []
+        written = []
+        written_snapshots = []
+        for (path, snapshot), result in zip(jobs, results):
+            if result.status == "saved":
+                relative = os.path.relpath(path, self._search_index.root)
+                written.append(relative)
+                written_snapshots.append((relative, snapshot))
+                if self._retrieval_token_budget > 0:
+                    saved.append((path, snapshot))
+            document = self.buffers.get(path)
+            if result.status == "failed" or document is None:
                 continue
-            try:
-                Path(file_path).write_text(buffer_text, encoding="utf-8")
-            except Exception:
-                failed.append(file_path)
+            document.adopt_saved(snapshot)
+            if document.dirty:
+                self.dirty_buffers.add(path)
             else:
-                self.saved_buffers[file_path] = buffer_text
-                self.dirty_buffers.discard(file_path)
-                saved.append(file_path)
-
-        for file_path in saved:
-            self._update_tab_label(file_path)
-
-        if self.path is not None and self.path in self.buffers:
-            self.query_one("#code-static", Static).update(
-                highlight(self.buffers[self.path], path=self.path)
-            )
-
+                self.dirty_buffers.discard(path)
+            self._update_tab_label(path)
+
+        if saved:
+            self._reindex_saved(saved)
+        if written:
+            self._search_index.invalidate(written)
+            self._refresh_search_index()
+            self._update_saved_symbols(written_snapshots)
+        self._render_code_static()
+        failed = [result for result in results if result.status == "failed"]
         if failed:
-            self.sub_title = f"FAILED TO SAVE: {len(failed)}"
+            self.sub_title = f"FAILED TO SAVE: {len(failed)} ({failed[0].error[:40]})"
         else:
             self.sub_title = "SAVED ALL"
 
+        self._save_in_progress = False
+        if on_complete is not None:
+            on_complete(results)
+        if self._queued_saves:
+            queued, self._queued_saves = self._queued_saves, []
+            paths = list(dict.fromkeys(path for batch, _ in queued for path in batch))
+            callbacks = [callback for _, callback in queued if callback is not None]
+
+            def run_callbacks(results: list[SaveResult]) -> None:
+                for callback in callbacks:
+                    callback(results)
+
+            self._save_paths(paths, run_callbacks)
+
+    def action_edit_large_file(self) -> None:
+        """Load the current large file fully into the editor."""
+        if self.path is None or self.insert_mode or self.request_mode:
+            return
+        mapped = self._large_files.pop(self.path, None)
+        if mapped is None:
+            return
+        mapped.close()
+        self.set_class(False, "-large-file")
+        self._start_file_load(self.path, full=True)
+
     # ── Tab helpers ──────────────────────────────────────────────
 
     def _add_file_tab(self, path: str) -> None:
@@ -221,20 +544,6 @@ class ActionsMixin:
         prefix = "● " if path in self.dirty_buffers else ""
         tab.label = f"{prefix}{name}"
 
-    def _save_file(self, path: str) -> bool:
-        """Save a single file buffer to disk. Returns True on success."""
-        buffer_text = self.buffers.get(path)
-        if buffer_text is None:
-            return False
-        try:
-            Path(path).write_text(buffer_text, encoding="utf-8")
-        except Exception:
-            return False
-        self.saved_buffers[path] = buffer_text
-        self.dirty_buffers.discard(path)
-        self._update_tab_label(path)
-        return True
-
     def _close_tab(self, path: str) -> None:
         """Close a tab and switch to an adjacent one."""
         if path not in self.open_tabs:
@@ -242,9 +551,14 @@ class ActionsMixin:
         idx = self.open_tabs.index(path)
         self.open_tabs.remove(path)
         self.buffers.pop(path, None)
-        self.saved_buffers.pop(path, None)
         self.dirty_buffers.discard(path)
         self.cursor_positions.pop(path, None)
+        self.query_one("#code-editor", CodeEditor).forget_document(path)
+        mapped = self._large_files.pop(path, None)
+        if mapped is not None:
+            mapped.close()
+        self._highlights.forget(path)
+        self._detected_languages.pop(path, None)
         tabs = self.query_one("#file-tabs", Tabs)
         tab_id = path_to_tab_id(path)
         tabs.remove_tab(tab_id)
@@ -256,18 +570,24 @@ class ActionsMixin:
 
     def _handle_quit_confirm(self, result: str) -> None:
         if result == "save":
-            self.action_save_all()
-            self.exit()
+            self._save_paths(list(self.dirty_buffers), self._exit_if_saved)
         elif result == "discard":
             self.exit()
 
     def _handle_close_tab_confirm(self, path: str, result: str) -> None:
         if result == "save":
-            self._save_file(path)
-            self._close_tab(path)
+            self._save_paths([path], lambda results: self._close_tab_if_saved(path, results))
         elif result == "discard":
             self._close_tab(path)
 
+    def _exit_if_saved(self, results: list[SaveResult]) -> None:
+        if all(result.status != "failed" for result in results):
+            self.exit()
+
+    def _close_tab_if_saved(self, path: str, results: list[SaveResult]) -> None:
+        if all(result.status != "failed" for result in results if result.path == path):
+            self._close_tab(path)
+
     # ── Undo / Redo ─────────────────────────────────────────────
 
     def action_undo(self) -> None:
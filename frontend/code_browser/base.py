@@ -1,15 +1,33 @@
 from __future__ import annotations
 
+import os
 import sys
+from collections.abc import Callable
 from pathlib import Path
 
 from textual.app import App, ComposeResult
 from textual.binding import Binding
 from textual.containers import Container
 from textual.reactive import reactive, var
-from textual.widgets import DirectoryTree, Footer, Header, Input, Static, Tabs, TextArea
+from textual.widgets import DirectoryTree, Footer, Header, Input, OptionList, Static, Tabs
 
-from .widgets import FileTab, path_to_tab_id
+from bot.scheduler import GenerationQueue
+
+from .context import default_context_budget
+from .document import PieceTable
+from .file_index import FileIndex, default_cache_path
+from .fuzzy import FuzzyMatcher
+from .generation import GenerationJob
+from .highlighting import HighlightCache
+from .ignore import default_exclude_patterns
+from .language import GAGGLE_PREWARM_DELAY
+from .large_file import MappedFile
+from .replace import FileReplacement
+from .retrieval import ProjectIndex, default_retrieval_budget
+from .saving import SaveResult
+from .search import SearchHit, SearchIndex
+from .symbols import Symbol, SymbolIndex
+from .widgets import CodeEditor, FileTab, LargeFileView, ProjectTree, path_to_tab_id
 
 
 def _resolve_css_path() -> str:
@@ -32,12 +50,25 @@ def _resolve_css_path() -> str:
     return str(source_default)
 
 
+def _default_large_file_threshold() -> int:
+    """Size in bytes above which files open in read-only large-file mode."""
+    try:
+        megabytes = float(os.getenv("CODE_BROWSER_LARGE_FILE_MB", "16"))
+    except ValueError:
+        megabytes = 16
+    return int(megabytes * 1024 * 1024)
+
+
 class CodeBrowserBase(App):
     """Textual code browser app."""
 
     CSS_PATH = _resolve_css_path()
     BINDINGS = [
         Binding("c", "toggle_request", "Code Request", priority=True),
+        Binding("f", "toggle_finder", "Find File", priority=True),
+        Binding("slash", "toggle_search", "Search", priority=True),
+        Binding("t", "toggle_symbols", "Symbols", priority=True),
+        Binding("R", "toggle_replace", "Replace", priority=True),
         Binding("q", "quit", "Quit", priority=True),
         Binding("i", "toggle_insert", "Toggle Insert Mode"),
         Binding("v", "toggle_selection", "Toggle Selection"),
@@ -48,23 +79,90 @@ class CodeBrowserBase(App):
         Binding("u", "undo", "Undo"),
         Binding("r", "redo", "Redo"),
         Binding("w", "close_tab", "Close Tab"),
+        Binding("e", "edit_large_file", "Edit Large File"),
+        Binding("g", "goto_definition", "Go to Definition"),
         Binding("escape", "exit_insert", "Exit Insert Mode", priority=True),
     ]
 
     show_tree = var(True)
     insert_mode = var(False)
     request_mode = var(False)
+    finder_mode = var(False)
+    search_mode = var(False)
+    symbol_mode = var(False)
+    replace_mode = var(False)
     selection_mode = var(False)
     path: reactive[str | None] = reactive(None)
 
-    def __init__(self, root_path: str | Path, *args, **kwargs) -> None:
+    def __init__(
+        self,
+        root_path: str | Path,
+        *args,
+        large_file_threshold: int | None = None,
+        exclude: list[str] | None = None,
+        **kwargs,
+    ) -> None:
         super().__init__(*args, **kwargs)
         self.root_path = str(Path(root_path))
-        self.buffers: dict[str, str] = {}
-        self.saved_buffers: dict[str, str] = {}
+        if large_file_threshold is None:
+            large_file_threshold = _default_large_file_threshold()
+        self.large_file_threshold = large_file_threshold
+        if exclude is None:
+            exclude = default_exclude_patterns()
+        self.exclude = exclude
+        self._large_files: dict[str, MappedFile] = {}
+        self._save_in_progress = False
+        self._queued_saves: list[
+            tuple[list[str], Callable[[list[SaveResult]], None] | None]
+        ] = []
+        self.buffers: dict[str, PieceTable] = {}
         self.dirty_buffers: set[str] = set()
         self._loading_buffer = False
+        self._request_path: str | None = None
         self._request_insert_location: tuple[int, int] | None = None
+        self._generation_queue: GenerationQueue | None = None
+        self._generation_jobs: list[GenerationJob] = []
+        self._generation_timer = None
+        self._context_token_budget = default_context_budget()
+        self._retrieval_token_budget = default_retrieval_budget()
+        self._project_index = ProjectIndex(self.root_path, self._language_from_path)
+        self._file_index = FileIndex(
+            self.root_path, default_cache_path(self.root_path), self.exclude
+        )
+        self._file_matcher: FuzzyMatcher | None = None
+        self._file_matcher_generation = 0
+        self._search_index = SearchIndex(
+            self.root_path, default_cache_path(self.root_path, "search", ".pickle")
+        )
+        self._search_hits: list[SearchHit] = []
+        self._search_timer = None
+        self._symbol_index = SymbolIndex(
+            self.root_path,
+            default_cache_path(self.root_path, "symbols", ".sqlite3"),
+            self._language_from_path,
+        )
+        self._symbol_results: list[Symbol] = []
+        self._replacements: list[FileReplacement] = []
+        self._replacement_options: list[int] = []
+        self._rejected_replacements: set[int] = set()
+        self._replace_timer = None
+        self._replace_previewing = False
+        self._replace_preview_lines = 0
+        self._gaggle_health: dict[str, object] = {
+            "ok": None,
+            "checked": None,
+            "seconds": None,
+            "error": None,
+        }
+        self._generation_stats: dict[str, object] = {
+            "requests": 0,
+            "first_request_seconds": None,
+            "last_first_chunk_seconds": None,
+            "last_total_seconds": None,
+            "last_prompt_tokens": None,
+            "last_context_seconds": None,
+            "last_retrieval_seconds": None,
+        }
         self._gaggle = None
         self._selection_anchor: tuple[int, int] | None = None
         self._yank_buffer = ""
@@ -72,18 +170,38 @@ class CodeBrowserBase(App):
         self.open_tabs: list[str] = []
         self.cursor_positions: dict[str, tuple[int, int]] = {}
         self._switching_tab = False
+        self._highlights = HighlightCache()
+        self._static_window: tuple[str, int, int] | None = None
+        self._detected_languages: dict[str, tuple[int, bytes, str | None]] = {}
+        self._language_detection_stats = {"runs": 0, "hits": 0, "seconds": 0.0}
+        self._buffer_sync_batch = 0
+        self._buffer_sync_stats = {"events": 0, "merged": 0, "passes": 0}
 
     def compose(self) -> ComposeResult:
         """Compose our UI."""
         yield Header()
         yield Tabs(id="file-tabs")
         with Container():
-            yield DirectoryTree(self.root_path, id="tree-view")
+            yield ProjectTree(self.root_path, exclude=self.exclude, id="tree-view")
             yield Static(id="code-static", expand=True)
-            yield TextArea.code_editor(id="code-editor", read_only=True)
+            yield CodeEditor.code_editor(id="code-editor", read_only=True)
+            yield LargeFileView(id="large-file-view")
         with Container(id="request-panel"):
             yield Static("Describe the code to generate:", id="request-label")
             yield Input(placeholder="Ask for code...", id="request-input")
+        with Container(id="finder-panel"):
+            yield Input(placeholder="Find file...", id="finder-input")
+            yield OptionList(id="finder-results")
+        with Container(id="search-panel"):
+            yield Input(placeholder="Search the project (/regex/)...", id="search-input")
+            yield OptionList(id="search-results")
+        with Container(id="symbol-panel"):
+            yield Input(placeholder="Go to symbol...", id="symbol-input")
+            yield OptionList(id="symbol-results")
+        with Container(id="replace-panel"):
+            yield Input(placeholder="Replace in the project (/regex/)...", id="replace-input")
+            yield Input(placeholder="Replace with (\\1 for a group)...", id="replace-with")
+            yield OptionList(id="replace-results")
         yield Footer()
 
     def on_mount(self) -> None:
@@ -91,9 +209,11 @@ class CodeBrowserBase(App):
         tree.focus()
         self.call_after_refresh(tree.focus)
 
-        register_languages = getattr(self, "_register_optional_languages", None)
-        if callable(register_languages):
-            register_languages()
+        code_view = self.query_one("#code-editor", CodeEditor)
+        self.watch(code_view, "scroll_y", self._watch_editor_scroll, init=False)
+        self.set_timer(GAGGLE_PREWARM_DELAY, self._start_gaggle_prewarm)
+        self.call_after_refresh(self._start_project_index)
+        self.call_after_refresh(self._scan_files)
 
         def theme_change(_signal) -> None:
             """Force the syntax to use a different theme."""
@@ -103,8 +223,20 @@ class CodeBrowserBase(App):
 
     def check_action(self, action: str, parameters: tuple[object, ...]) -> bool | None:
         """Enable/disable actions based on current mode and state."""
-        if action == "toggle_request":
-            return self.path is not None and not self.insert_mode and not self.request_mode
+        loaded = self.path is not None and self.path in self.buffers
+        panel_open = (
+            self.request_mode
+            or self.finder_mode
+            or self.search_mode
+            or self.symbol_mode
+            or self.replace_mode
+        )
+        if action in {"toggle_symbols", "goto_definition"} and self._symbol_index.error:
+            return False
+        if action in {"toggle_request", "goto_definition"}:
+            return loaded and not self.insert_mode and not panel_open
+        if action in {"toggle_finder", "toggle_search", "toggle_symbols", "toggle_replace"}:
+            return not self.insert_mode and not panel_open
         if action == "quit":
             return not self.insert_mode
         if action == "exit_insert":
@@ -112,14 +244,18 @@ class CodeBrowserBase(App):
         if action == "save_all":
             return not self.insert_mode
         if action == "toggle_insert":
-            return self.path is not None or self.insert_mode
+            return loaded or self.insert_mode
         if action in {
             "toggle_selection",
             "yank_selection",
             "paste_yank",
             "delete_selection",
+            "undo",
+            "redo",
         }:
-            return self.path is not None and not self.insert_mode and not self.request_mode
-        if action in {"undo", "redo", "close_tab"}:
+            return loaded and not self.insert_mode and not self.request_mode
+        if action == "edit_large_file":
+            return self.path in self._large_files and not self.insert_mode and not self.request_mode
+        if action == "close_tab":
             return self.path is not None and not self.insert_mode and not self.request_mode
         return None
@@ -0,0 +1,259 @@
+"""Choosing which parts of a buffer to send along with a generation request."""
+
+from __future__ import annotations
+
+import os
+import re
+import time
+from typing import NamedTuple
+
+from .grammars import load_language
+
+CURSOR_MARKER = "<|cursor|>"
+# Lines always sent either side of the insertion point.
+CURSOR_WINDOW_LINES = 3
+# Share of the budget the enclosing definition may use before nearby
+# definitions get a look in.
+ENCLOSING_SHARE = 0.6
+
+_IMPORT_TYPES = frozenset(
+    {
+        "import_statement",
+        "import_from_statement",
+        "future_import_statement",
+        "import_declaration",
+        "preproc_include",
+        "using_directive",
+        "use_declaration",
+        "namespace_use_declaration",
+        "package_clause",
+        "package_declaration",
+        "extern_crate_declaration",
+    }
+)
+_DEFINITION_TYPE = re.compile(
+    r"(function|method|class|struct|impl|interface|enum|trait|module|namespace|type)"
+    r"_(definition|declaration|item|specifier)$|^decorated_definition$"
+)
+
+
+class PackedContext(NamedTuple):
+    text: str
+    """Selected lines in file order, with gaps shown as `...`."""
+    tokens: int
+    lines: int
+    seconds: float
+    parsed: bool
+    """Whether the selection used a syntax tree or fell back to a line window."""
+
+
+def is_definition(node) -> bool:
+    """Whether a tree-sitter node is a function, class or similar definition."""
+    return _DEFINITION_TYPE.search(node.type) is not None
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting: about four characters per token."""
+    return (len(text) + 3) // 4
+
+
+def default_context_budget() -> int:
+    """Token budget for prompt context, from GAGGLE_CONTEXT_TOKENS (0 disables it)."""
+    try:
+        return max(0, int(os.getenv("GAGGLE_CONTEXT_TOKENS", "1500")))
+    except ValueError:
+        return 1500
+
+
+def tree_sitter_language(name: str | None):
+    """The tree-sitter Language for an editor language name, or None."""
+    if not name:
+        return None
+    return load_language(name)
+
+
+class _Selection:
+    """Line numbers picked so far and the tokens they cost."""
+
+    def __init__(self, lines: list[str], budget: int) -> None:
+        self.lines = lines
+        self.budget = budget
+        self.rows: set[int] = set()
+        self.tokens = 0
+
+    def cost(self, first: int, last: int) -> int:
+        return sum(
+            estimate_tokens(self.lines[row]) + 1
+            for row in range(first, last + 1)
+            if row not in self.rows
+        )
+
+    def add(self, first: int, last: int, limit: int | None = None) -> bool:
+        """Add rows `first`..`last` if they fit in `limit` (default: the budget)."""
+        first, last = max(0, first), min(len(self.lines) - 1, last)
+        if first > last:
+            return True
+        cost = self.cost(first, last)
+        if self.tokens + cost > (self.budget if limit is None else limit):
+            return False
+        self.rows.update(range(first, last + 1))
+        self.tokens += cost
+        return True
+
+    def grow(self, row: int, first: int, last: int, limit: int) -> None:
+        """Add rows outward from `row`, alternating below and above, until `limit`."""
+        below, above = row + 1, row - 1
+        while below <= last or above >= first:
+            if below <= last:
+                if not self.add(below, below, limit):
+                    break
+                below += 1
+            if above >= first:
+                if not self.add(above, above, limit):
+                    break
+                above -= 1
+
+
+def _rows(node) -> tuple[int, int]:
+    last = node.end_point[0]
+    if node.end_point[1] == 0 and last > node.start_point[0]:
+        last -= 1
+    return node.start_point[0], last
+
+
+def _enclosing_definitions(root, point: tuple[int, int]) -> list:
+    """Definition nodes containing `point`, innermost first."""
+    node = root.named_descendant_for_point_range(point, point)
+    found = []
+    while node is not None and node != root:
+        if is_definition(node):
+            found.append(node)
+        node = node.parent
+    return found
+
+
+def _definitions_in(container) -> list:
+    return [child for child in container.named_children if is_definition(child)]
+
+
+def _select_from_tree(selection: _Selection, root, row: int, column: int) -> None:
+    lines = selection.lines
+    point = (row, len(lines[row][:column].encode("utf-8")) if row < len(lines) else 0)
+    enclosing = _enclosing_definitions(root, point)
+
+    for definition in enclosing:
+        first, _ = _rows(definition)
+        selection.add(first, first)
+
+    for child in root.named_children:
+        if child.type in _IMPORT_TYPES:
+            selection.add(*_rows(child))
+
+    if enclosing:
+        first, last = _rows(enclosing[0])
+        limit = selection.tokens + int(
+            (selection.budget - selection.tokens) * ENCLOSING_SHARE
+        )
+        if not selection.add(first, last, limit):
+            selection.grow(row, first, last, limit)
+        container = enclosing[0].parent
+    else:
+        container = root
+
+    siblings = [
+        node for node in _definitions_in(container) if not enclosing or node != enclosing[0]
+    ]
+    siblings.sort(
+        key=lambda node: min(abs(node.start_point[0] - row), abs(node.end_point[0] - row))
+    )
+    for node in siblings:
+        first, last = _rows(node)
+        if not selection.add(first, last):
+            selection.add(first, first)
+
+
+def _render(lines: list[str], rows: set[int], row: int, column: int) -> str:
+    out: list[str] = []
+    previous = -1
+    for index in sorted(rows):
+        if index != previous + 1:
+            out.append("...")
+        line = lines[index]
+        if index == row:
+            line = line[:column] + CURSOR_MARKER + line[column:]
+        out.append(line)
+        previous = index
+    if previous != len(lines) - 1:
+        out.append("...")
+    return "\n".join(out)
+
+
+def pack_context(
+    text: str,
+    language: str | None,
+    location: tuple[int, int],
+    budget: int,
+) -> PackedContext:
+    """Pick the parts of `text` most useful for code inserted at `location`.
+
+    With a tree-sitter grammar the selection is, in priority order: the
+    lines around the insertion point, the first line of every enclosing
+    definition, the file's imports, as much of the innermost enclosing
+    definition as fits in `ENCLOSING_SHARE` of what is left, then sibling
+    definitions nearest the insertion point, whole or as their first line.
+    Without one it is a window of lines around the insertion point.
+    """
+    started = time.perf_counter()
+    lines = text.split("\n")
+    row = min(location[0], len(lines) - 1)
+    column = min(location[1], len(lines[row]))
+    selection = _Selection(lines, budget)
+    selection.add(row - CURSOR_WINDOW_LINES, row + CURSOR_WINDOW_LINES)
+
+    parsed = False
+    tree = None
+    ts_language = tree_sitter_language(language)
+    if ts_language is not None:
+        from tree_sitter import Parser
+
+        tree = Parser(ts_language).parse(text.encode("utf-8"))
+    if tree is not None:
+        _select_from_tree(selection, tree.root_node, row, column)
+        parsed = True
+    else:
+        selection.grow(row, 0, len(lines) - 1, budget)
+
+    packed = _render(lines, selection.rows, row, column) if selection.rows else ""
+    return PackedContext(
+        packed,
+        estimate_tokens(packed),
+        len(selection.rows),
+        time.perf_counter() - started,
+        parsed,
+    )
+
+
+def build_code_prompt(
+    request_text: str,
+    language: str,
+    context: PackedContext | None = None,
+    related: str = "",
+) -> str:
+    """The generation prompt for `request_text`, with the file excerpt and related code."""
+    prompt = (
+        f"Generate only {language} code. "
+        "Return plain code text only. "
+    )
+    if context is not None and context.text:
+        prompt += (
+            f"The code is inserted into an existing file at the {CURSOR_MARKER} marker. "
+            "Do not repeat imports or definitions that already exist.\n"
+            "Excerpt of the file (... marks omitted lines):\n"
+            f"{context.text}\n"
+        )
+    if related:
+        prompt += (
+            "Related code elsewhere in the project, which can be used but not redefined:\n"
+            f"{related}\n"
+        )
+    return prompt + f"Request: {request_text}"
@@ -0,0 +1,292 @@
+"""Piece-table document model used for the open file buffers."""
+
+from __future__ import annotations
+
+import hashlib
+from bisect import bisect_left
+from typing import NamedTuple
+
+from .line_index import LineIndex, Location
+
+# Typed runs are appended to the previous insertion instead of creating a
+# new piece per keystroke, as long as that insertion stays this small.
+_COALESCE_LIMIT = 1024
+
+
+def normalize_newlines(text: str, newline: str) -> str:
+    """Convert every line ending in `text` to `newline`, as the editor does."""
+    lines = text.splitlines()
+    if text.endswith(("\r\n", "\n", "\r")):
+        lines.append("")
+    return newline.join(lines)
+
+
+def text_digest(text: str) -> bytes:
+    """The hash `PieceTable.digest` gives for a table holding `text`."""
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+class _Source:
+    """An immutable chunk of text that pieces point into."""
+
+    __slots__ = ("text", "newline", "_breaks")
+
+    def __init__(self, text: str, newline: str) -> None:
+        self.text = text
+        self.newline = newline
+        self._breaks: list[int] | None = None
+
+    @property
+    def breaks(self) -> list[int]:
+        """Offsets of every newline in the source, computed on first use."""
+        if self._breaks is None:
+            breaks: list[int] = []
+            find = self.text.find
+            newline = self.newline
+            step = len(newline)
+            position = find(newline)
+            while position != -1:
+                breaks.append(position)
+                position = find(newline, position + step)
+            self._breaks = breaks
+        return self._breaks
+
+
+class _Piece(NamedTuple):
+    source: _Source
+    start: int
+    length: int
+
+
+class PieceTable:
+    """Editable text stored as pieces over immutable source strings.
+
+    Edits never copy the untouched parts of the document: the original file
+    text stays in a single source and each insertion adds a small one.
+    Snapshots share every source with the table they were taken from, and
+    the flat string is only built when `text` is read. Location lookups go
+    through a `LineIndex` that is built on first use and then kept up to
+    date by every edit.
+
+    Dirty state is tracked without keeping the saved text around: every edit
+    bumps `generation`, and only an edit that brings the length back to the
+    saved length pays for hashing the content against the saved digest.
+
+    `anchors` holds objects with an `offset` attribute that every edit keeps
+    pointing at the same place in the text. Text inserted at an anchor goes
+    after it, and an anchor inside replaced text ends up after the new text.
+    """
+
+    def __init__(self, text: str = "", newline: str = "\n") -> None:
+        self.newline = newline
+        self._pieces: list[_Piece] = []
+        self._length = 0
+        self._text: str | None = text
+        self._lines: LineIndex | None = None
+        if text:
+            self._pieces.append(_Piece(_Source(text, newline), 0, len(text)))
+            self._length = len(text)
+        self.generation = 0
+        self._saved_generation = 0
+        self._saved_length = self._length
+        self._saved_digest = self.digest()
+        self._mismatch_generation = -1
+        self.anchors: list = []
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def text(self) -> str:
+        """The full document text, flattened on demand and cached."""
+        if self._text is None:
+            self._text = "".join(
+                piece.source.text[piece.start : piece.start + piece.length]
+                for piece in self._pieces
+            )
+        return self._text
+
+    def get_text(self, start: int, end: int) -> str:
+        """Return the text between two offsets without flattening the document."""
+        if self._text is not None:
+            return self._text[start:end]
+        parts: list[str] = []
+        offset = 0
+        for piece in self._pieces:
+            piece_end = offset + piece.length
+            if piece_end > start and offset < end:
+                begin = piece.start + max(start - offset, 0)
+                finish = piece.start + min(end, piece_end) - offset
+                parts.append(piece.source.text[begin:finish])
+            if piece_end >= end:
+                break
+            offset = piece_end
+        return "".join(parts)
+
+    @property
+    def piece_count(self) -> int:
+        return len(self._pieces)
+
+    @property
+    def lines(self) -> LineIndex:
+        """The line-start index, built from the pieces' newline tables on first use."""
+        if self._lines is None:
+            starts = [0]
+            step = len(self.newline)
+            offset = 0
+            for piece in self._pieces:
+                breaks = piece.source.breaks
+                first = bisect_left(breaks, piece.start)
+                last = bisect_left(breaks, piece.start + piece.length)
+                shift = offset - piece.start + step
+                starts.extend(position + shift for position in breaks[first:last])
+                offset += piece.length
+            self._lines = LineIndex(starts, self._length, self.newline)
+        return self._lines
+
+    def snapshot(self) -> PieceTable:
+        """Return a copy that shares all source text with this table."""
+        copy = PieceTable.__new__(PieceTable)
+        copy.__dict__.update(self.__dict__)
+        copy._pieces = list(self._pieces)
+        copy._lines = None
+        copy.anchors = []
+        return copy
+
+    def digest(self) -> bytes:
+        """Hash of the current text, streamed piece by piece unless already flat."""
+        if self._text is not None:
+            return text_digest(self._text)
+        content = hashlib.blake2b(digest_size=16)
+        for piece in self._pieces:
+            chunk = piece.source.text[piece.start : piece.start + piece.length]
+            content.update(chunk.encode("utf-8", "surrogatepass"))
+        return content.digest()
+
+    @property
+    def dirty(self) -> bool:
+        """Whether the text differs from the last saved version."""
+        if self.generation == self._saved_generation:
+            return False
+        if self._length != self._saved_length:
+            return True
+        if self.generation == self._mismatch_generation:
+            return True
+        if self.digest() == self._saved_digest:
+            self._saved_generation = self.generation
+            return False
+        self._mismatch_generation = self.generation
+        return True
+
+    def mark_saved(self) -> None:
+        """Record the current text as the saved version."""
+        self._saved_generation = self.generation
+        self._saved_length = self._length
+        self._saved_digest = self.digest()
+
+    def adopt_saved(self, snapshot: PieceTable) -> None:
+        """Take over the saved state of a snapshot of this table that was saved.
+
+        If nothing was edited since the snapshot, its flattened pieces are
+        adopted as well so the save's compaction is not repeated here.
+        """
+        if snapshot.generation < self._saved_generation:
+            return
+        self._saved_generation = snapshot._saved_generation
+        self._saved_length = snapshot._saved_length
+        self._saved_digest = snapshot._saved_digest
+        if snapshot.generation == self.generation:
+            self._pieces = list(snapshot._pieces)
+            self._text = snapshot._text
+
+    def compact(self) -> None:
+        """Collapse the pieces into a single source holding the current text."""
+        if len(self._pieces) <= 1:
+            return
+        text = self.text
+        self._pieces = [_Piece(_Source(text, self.newline), 0, len(text))]
+
+    def offset_of(self, location: Location) -> int:
+        """Convert a (row, column) location into an offset in the text."""
+        return self.lines.offset_of(location)
+
+    def location_of(self, offset: int) -> Location:
+        """Convert an offset in the text into a (row, column) location."""
+        return self.lines.location_of(offset)
+
+    def replace(self, start: Location, end: Location, text: str) -> None:
+        """Replace the text between two (row, column) locations."""
+        start, end = sorted((start, end))
+        self.replace_span(self.offset_of(start), self.offset_of(end), text)
+
+    def replace_span(self, start: int, end: int, text: str) -> None:
+        """Replace the text between two offsets."""
+        start = max(0, min(start, self._length))
+        end = max(start, min(end, self._length))
+        if start == end and not text:
+            return
+        self._text = None
+        self.generation += 1
+        if self._lines is not None:
+            self._lines.replace(start, end, text)
+        for anchor in self.anchors:
+            if anchor.offset is not None and anchor.offset > start:
+                anchor.offset = max(anchor.offset, end) + len(text) - (end - start)
+
+        pieces = self._pieces
+        index, offset = self._locate(start)
+        if (
+            start == end
+            and index > 0
+            and offset == 0
+            and self._extend_piece(index - 1, text)
+        ):
+            self._length += len(text)
+            return
+
+        replacement: list[_Piece] = []
+        if index < len(pieces) and offset > 0:
+            replacement.append(self._slice(pieces[index], 0, offset))
+
+        stop_index, stop_offset = self._locate(end)
+        if stop_index < len(pieces) and stop_offset > 0:
+            piece = pieces[stop_index]
+            tail = self._slice(piece, stop_offset, piece.length)
+            stop_index += 1
+        else:
+            tail = None
+
+        if text:
+            replacement.append(_Piece(_Source(text, self.newline), 0, len(text)))
+        if tail is not None and tail.length:
+            replacement.append(tail)
+
+        pieces[index:stop_index] = replacement
+        self._length += len(text) - (end - start)
+
+    def _locate(self, position: int) -> tuple[int, int]:
+        """Return the index of the piece containing `position` and the offset into it."""
+        offset = 0
+        for index, piece in enumerate(self._pieces):
+            if position < offset + piece.length:
+                return index, position - offset
+            offset += piece.length
+        return len(self._pieces), 0
+
+    def _slice(self, piece: _Piece, start: int, end: int) -> _Piece:
+        return _Piece(piece.source, piece.start + start, end - start)
+
+    def _extend_piece(self, index: int, text: str) -> bool:
+        """Append `text` to a small trailing insertion piece in place."""
+        piece = self._pieces[index]
+        source = piece.source
+        if piece.start + piece.length != len(source.text):
+            return False
+        if len(source.text) + len(text) > _COALESCE_LIMIT:
+            return False
+        self._pieces[index] = _Piece(
+            _Source(source.text + text, self.newline),
+            piece.start,
+            piece.length + len(text),
+        )
+        return True
@@ -1,10 +1,18 @@
 from __future__ import annotations
 
-from textual import events
-from textual.widgets import DirectoryTree, Input, Tabs, TextArea
+import time
+from pathlib import Path
+
+from textual import events, work
+from textual.widgets import DirectoryTree, Input, OptionList, Tabs, TextArea
 from textual.widgets.text_area import Selection
 
-from .widgets import FileTab, path_to_tab_id
+from bot.scheduler import GenerationQueue
+
+from .context import estimate_tokens
+from .document import normalize_newlines
+from .generation import GenerationJob, TabClosedError, shift_anchors
+from .widgets import CodeEditor, FileTab, path_to_tab_id
 
 
 class EventsMixin:
@@ -13,15 +21,7 @@ class EventsMixin:
     ) -> None:
         """Called when the user click a file in the directory tree."""
         event.stop()
-        file_path = str(event.path)
-        if self.path is not None:
-            code_view = self.query_one("#code-editor", TextArea)
-            self.cursor_positions[self.path] = code_view.cursor_location
-            self.buffers[self.path] = code_view.text
-        if file_path not in self.open_tabs:
-            self.open_tabs.append(file_path)
-            self._add_file_tab(file_path)
-        self.path = file_path
+        self._open_file(str(event.path))
 
     def on_tabs_tab_activated(self, event: Tabs.TabActivated) -> None:
         """Switch to the file associated with the activated tab."""
@@ -36,7 +36,7 @@ class EventsMixin:
         if self.path is not None:
             code_view = self.query_one("#code-editor", TextArea)
             self.cursor_positions[self.path] = code_view.cursor_location
-            self.buffers[self.path] = code_view.text
+            self._record_editor_edits()
         self.path = file_path
 
     def on_text_area_selection_changed(self, event: TextArea.SelectionChanged) -> None:
@@ -61,6 +61,8 @@ class EventsMixin:
     def on_key(self, event: events.Key) -> None:
         """Fallback for Escape when focused widgets consume key bindings."""
         if event.key == "c" and not self.request_mode and not self.insert_mode:
+            if self.finder_mode or self.search_mode or self.symbol_mode or self.replace_mode:
+                return
             event.stop()
             self.action_toggle_request()
             return
@@ -68,63 +70,276 @@ class EventsMixin:
             event.stop()
             self.request_mode = False
             return
+        panels = [
+            name
+            for name, is_open in (
+                ("finder", self.finder_mode),
+                ("search", self.search_mode),
+                ("symbol", self.symbol_mode),
+                ("replace", self.replace_mode),
+            )
+            if is_open
+        ]
+        if panels and event.key in {"escape", "up", "down"}:
+            if event.key != "escape" and not isinstance(self.focused, Input):
+                # The results list has focus and moves its own cursor.
+                return
+            event.stop()
+            if event.key == "escape":
+                self.finder_mode = False
+                self.search_mode = False
+                self.symbol_mode = False
+                self.replace_mode = False
+            else:
+                results = self.query_one(f"#{panels[0]}-results", OptionList)
+                if event.key == "up":
+                    results.action_cursor_up()
+                else:
+                    results.action_cursor_down()
+            return
+        if self.replace_mode and event.key in {"tab", "shift+tab"}:
+            event.stop()
+            focused = self.focused.id if self.focused is not None else None
+            target = "replace-input" if focused == "replace-with" else "replace-with"
+            self.query_one(f"#{target}", Input).focus()
+            return
+        if self.replace_mode and event.key == "ctrl+t":
+            event.stop()
+            option = self.query_one("#replace-results", OptionList).highlighted_option
+            if option is not None and option.id is not None:
+                self._toggle_replacement(int(option.id.removeprefix("file-")))
+            return
         if event.key == "escape" and self.insert_mode:
             event.stop()
             self.action_exit_insert()
+            return
+        if event.key == "escape" and self._generation_jobs:
+            event.stop()
+            self._cancel_generations()
+
+    def on_input_changed(self, event: Input.Changed) -> None:
+        """Re-rank the file finder's results as the query is typed."""
+        if event.input.id == "finder-input" and self.finder_mode:
+            self._show_finder_results(event.value)
+        elif event.input.id == "search-input" and self.search_mode:
+            self._schedule_search(event.value)
+        elif event.input.id == "symbol-input" and self.symbol_mode:
+            self._show_symbol_results(event.value)
+        elif event.input.id in {"replace-input", "replace-with"} and self.replace_mode:
+            self._schedule_replace_preview()
+
+    def on_option_list_option_selected(self, event: OptionList.OptionSelected) -> None:
+        """Open the file picked from a panel's results, or toggle a file in the replace preview."""
+        if event.option_list.id == "finder-results":
+            event.stop()
+            self._open_finder_result(event.option.id)
+        elif event.option_list.id == "search-results":
+            event.stop()
+            self._open_search_hit(event.option_index)
+        elif event.option_list.id == "symbol-results":
+            event.stop()
+            self._open_symbol(event.option_index)
+        elif event.option_list.id == "replace-results":
+            event.stop()
+            if event.option.id is not None and event.option.id.startswith("file-"):
+                self._toggle_replacement(int(event.option.id.removeprefix("file-")))
+
+    def _open_search_hit(self, index: int | None) -> None:
+        if index is None or index >= len(self._search_hits):
+            self.sub_title = "NO SEARCH HIT"
+            return
+        hit = self._search_hits[index]
+        self.search_mode = False
+        self._open_file(str(Path(self.root_path, hit.path)), (hit.row, hit.column))
+
+    def _open_symbol(self, index: int | None) -> None:
+        if index is None or index >= len(self._symbol_results):
+            self.sub_title = "NO MATCHING SYMBOL"
+            return
+        symbol = self._symbol_results[index]
+        self.symbol_mode = False
+        self._open_file(str(Path(self.root_path, symbol.path)), (symbol.row, symbol.column))
+
+    def _open_finder_result(self, relative: str | None) -> None:
+        self.finder_mode = False
+        if relative is not None:
+            self._open_file(str(Path(self.root_path, relative)))
 
     def on_input_submitted(self, event: Input.Submitted) -> None:
-        """Generate code from Gemini and insert it at cursor location."""
+        """Queue a code generation request for the file the request panel was opened on."""
+        if event.input.id == "finder-input":
+            results = self.query_one("#finder-results", OptionList)
+            if results.highlighted is None:
+                self.sub_title = "NO MATCHING FILE"
+                return
+            self._open_finder_result(results.get_option_at_index(results.highlighted).id)
+            return
+        if event.input.id == "search-input":
+            self._open_search_hit(self.query_one("#search-results", OptionList).highlighted)
+            return
+        if event.input.id == "symbol-input":
+            self._open_symbol(self.query_one("#symbol-results", OptionList).highlighted)
+            return
+        if event.input.id in {"replace-input", "replace-with"}:
+            self._apply_replacements()
+            return
         if event.input.id != "request-input":
             return
         request_text = event.value.strip()
         if not request_text:
             self.sub_title = "EMPTY REQUEST"
             return
-        if self.path is None:
+        path = self._request_path
+        if path is None:
             self.sub_title = "NO FILE OPEN"
             self.request_mode = False
             return
+        document = self.buffers.get(path)
+        if document is None:
+            self.sub_title = "FILE NOT LOADED"
+            self.request_mode = False
+            return
 
         gaggle = self._get_gaggle()
         if gaggle is None:
             self.request_mode = False
             return
+        if self._generation_queue is None:
+            self._generation_queue = GenerationQueue.from_env(gaggle)
+
+        language = self._resolved_language_for_path(path)
+        job = GenerationJob(path, self._request_insert_location or (0, 0))
+        job.offset = document.offset_of(job.location)
+        document.anchors.append(job)
+        started = time.perf_counter()
+        context = self._pack_request_context(path, document, job.location, language)
+        related = self._related_snippets(path, document, job.location, request_text)
+        prompt = self._build_code_prompt(request_text, language, context, related)
+        job.prompt_tokens = estimate_tokens(prompt)
+        job.context_seconds = time.perf_counter() - started
+        self._generation_jobs.append(job)
+        job.worker = self._generate_code(self._generation_queue, prompt, language, job)
+        self.request_mode = False
+        if self._generation_timer is None:
+            self._generation_timer = self.set_interval(0.5, self._show_generation_progress)
+        self._show_generation_progress()
 
-        self.sub_title = "GENERATING..."
-        language = self._resolved_language_for_path(self.path)
-        prompt = self._build_code_prompt(request_text)
+    @work(group="generation")
+    async def _generate_code(
+        self, queue: GenerationQueue, prompt: str, language: str, job: GenerationJob
+    ) -> None:
+        """Stream the model's output into the job's buffer as it arrives.
+
+        Code inserted before a cancel or failure is kept and can be undone.
+        """
         try:
-            generated = gaggle.generate_response(prompt, language=language)
+            await queue.run(
+                prompt, language, lambda chunk: self._insert_generated_chunk(job, chunk)
+            )
+        except TabClosedError:
+            self._finish_generation(job)
+            self.sub_title = "TAB CLOSED, CODE DISCARDED"
+            return
         except Exception as error:
+            self._finish_generation(job)
             message = str(error).strip() or type(error).__name__
             self.sub_title = f"GEN FAIL: {message[:60]}"
-            self.request_mode = False
             return
-        if not generated:
+        self._finish_generation(job)
+        if job.first_chunk_at is None:
             self.sub_title = "EMPTY RESPONSE"
-            self.request_mode = False
             return
+        first_chunk = job.first_chunk_at - job.submitted
+        total = time.monotonic() - job.submitted
+        stats = self._generation_stats
+        stats["requests"] += 1
+        if stats["first_request_seconds"] is None:
+            stats["first_request_seconds"] = first_chunk
+        stats["last_first_chunk_seconds"] = first_chunk
+        stats["last_total_seconds"] = total
+        stats["last_prompt_tokens"] = job.prompt_tokens
+        stats["last_context_seconds"] = job.context_seconds
+        self.log.debug(
+            f"generation for {job.path}: ~{job.prompt_tokens} prompt tokens"
+            f" (context in {job.context_seconds * 1000:.1f} ms),"
+            f" first chunk after {first_chunk:.2f}s, done after {total:.2f}s"
+        )
+        where = "" if job.path == self.path else f" IN {Path(job.path).name}"
+        self.sub_title = (
+            f"CODE INSERTED{where} ({first_chunk:.1f}s TO FIRST CHUNK,"
+            f" ~{job.prompt_tokens} PROMPT TOKENS)"
+        )
+
+    def _show_generation_progress(self) -> None:
+        queue = self._generation_queue
+        if not self._generation_jobs or queue is None:
+            return
+        chars = sum(job.chars for job in self._generation_jobs)
+        self.sub_title = (
+            f"GENERATING: {queue.running} RUNNING, {queue.waiting} QUEUED,"
+            f" {chars} CHARS (ESC TO CANCEL)"
+        )
 
-        code_view = self.query_one("#code-editor", TextArea)
-        if self._request_insert_location is not None:
-            code_view.cursor_location = self._request_insert_location
-        was_insert_mode = self.insert_mode
-        if not was_insert_mode:
+    def _finish_generation(self, job: GenerationJob) -> None:
+        """Stop tracking `job`, and the progress display once no jobs are left."""
+        if job in self._generation_jobs:
+            self._generation_jobs.remove(job)
+        document = self.buffers.get(job.path)
+        if document is not None and job in document.anchors:
+            document.anchors.remove(job)
+        if not self._generation_jobs and self._generation_timer is not None:
+            self._generation_timer.stop()
+            self._generation_timer = None
+
+    def _cancel_generations(self) -> None:
+        """Cancel every queued and running generation request."""
+        jobs = list(self._generation_jobs)
+        for job in jobs:
+            if job.worker is not None:
+                job.worker.cancel()
+            self._finish_generation(job)
+        self.sub_title = f"CANCELLED {len(jobs)} GENERATION{'S' if len(jobs) != 1 else ''}"
+
+    def _insert_generated_chunk(self, job: GenerationJob, chunk: str) -> None:
+        """Insert `chunk` at the job's offset in its buffer and advance the offset.
+
+        Chunks for a tab that is not active go straight into its buffer, and
+        its editor document is rebuilt when the tab is shown. Raises
+        TabClosedError if the tab is gone, or was closed and opened again.
+        """
+        path = job.path
+        document = self.buffers.get(path)
+        if document is None or path not in self.open_tabs or job not in document.anchors:
+            raise TabClosedError(path)
+        if job.first_chunk_at is None:
+            job.first_chunk_at = time.monotonic()
+        text = normalize_newlines(chunk, document.newline)
+        if path != self.path:
+            offset = job.offset
+            document.replace_span(offset, offset, text)
+            self.query_one("#code-editor", CodeEditor).forget_document(path)
+        else:
+            code_view = self.query_one("#code-editor", CodeEditor)
+            # Edits typed since the last chunk move the job's anchor.
+            self._record_editor_edits()
+            offset = job.offset
+            was_read_only = code_view.read_only
             code_view.read_only = False
-        code_view.insert(generated)
-        if not was_insert_mode:
-            code_view.read_only = True
-        if self.path is not None:
-            current_text = code_view.text
-            self.buffers[self.path] = current_text
-            self._apply_editor_language(self.path, current_text)
-            if current_text == self.saved_buffers.get(self.path, ""):
-                self.dirty_buffers.discard(self.path)
-            else:
-                self.dirty_buffers.add(self.path)
-            self._update_tab_label(self.path)
-        self.request_mode = False
-        self.sub_title = "CODE INSERTED"
+            code_view.insert(text, document.location_of(offset), maintain_selection_offset=True)
+            code_view.read_only = was_read_only
+            self._record_editor_edits()
+            self._apply_editor_language(path, document)
+            self._render_code_static()
+        was_dirty = path in self.dirty_buffers
+        if document.dirty:
+            self.dirty_buffers.add(path)
+        else:
+            self.dirty_buffers.discard(path)
+        if was_dirty != (path in self.dirty_buffers):
+            self._update_tab_label(path)
+        shift_anchors(self._generation_jobs, job, len(text))
+        job.offset = offset + len(text)
+        job.chars += len(chunk)
 
     def on_text_area_changed(self, event: TextArea.Changed) -> None:
         """Track unsaved changes for the active file while in insert mode."""
@@ -134,11 +349,30 @@ class EventsMixin:
             return
         if not self.insert_mode or self.path is None:
             return
-        new_text = event.text_area.text
-        self.buffers[self.path] = new_text
-        self._apply_editor_language(self.path, new_text)
-        if new_text == self.saved_buffers.get(self.path, ""):
+        self._buffer_sync_stats["events"] += 1
+        self._buffer_sync_batch += 1
+        if self._buffer_sync_batch == 1:
+            self.call_after_refresh(self._flush_buffer_sync)
+
+    def _flush_buffer_sync(self) -> None:
+        """Sync the active buffer once for all changes made since the last refresh."""
+        merged = self._buffer_sync_batch - 1
+        self._buffer_sync_batch = 0
+        stats = self._buffer_sync_stats
+        stats["passes"] += 1
+        if merged > 0:
+            stats["merged"] += merged
+            self.log.debug(f"buffer sync: merged {merged} change events into one pass")
+        if self.path is None:
+            return
+        document = self._record_editor_edits()
+        if document is None:
+            return
+        self._apply_editor_language(self.path, document)
+        was_dirty = self.path in self.dirty_buffers
+        if not document.dirty:
             self.dirty_buffers.discard(self.path)
         else:
             self.dirty_buffers.add(self.path)
-        self._update_tab_label(self.path)
+        if was_dirty != (self.path in self.dirty_buffers):
+            self._update_tab_label(self.path)
@@ -0,0 +1,190 @@
+"""A persistent list of the files under the project root."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import NamedTuple
+
+from .ignore import IgnoreRules
+from .saving import save_texts
+
+_CACHE_VERSION = 1
+
+
+def default_cache_path(root: str, kind: str = "files", suffix: str = ".json") -> Path:
+    cache_home = os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache"
+    digest = hashlib.blake2b(os.path.abspath(root).encode("utf-8"), digest_size=8).hexdigest()
+    return Path(cache_home) / "code-browser" / f"{kind}-{digest}{suffix}"
+
+
+class _Listing(NamedTuple):
+    mtime_ns: int
+    files: list[str]
+    directories: list[str]
+
+
+class ScanStats(NamedTuple):
+    directories: int
+    listed: int
+    """Directories whose mtime had changed, so they were read again."""
+    files: int
+    seconds: float
+
+
+class FileIndex:
+    """Relative paths of the files under `root`, minus ignored ones.
+
+    The raw listing of every directory is cached on disk with the
+    directory's mtime. A rescan stats each directory and only lists the
+    ones whose mtime changed, then re-applies the ignore rules to the
+    cached names, so editing a .gitignore takes effect without a full
+    rescan. `paths` is replaced as a whole once a scan finishes, so
+    readers on other threads never see a partial list.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        cache_path: Path | None = None,
+        extra_ignores: list[str] | tuple[str, ...] = (),
+    ) -> None:
+        self.root = os.path.abspath(root)
+        self.cache_path = cache_path
+        self.extra_ignores = tuple(extra_ignores)
+        self.paths: list[str] = []
+        self.generation = 0
+        self.scanned = False
+        self._listings: dict[str, _Listing] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> bool:
+        """Read the cached listings and publish the paths they hold."""
+        if self.cache_path is None:
+            return False
+        try:
+            with open(self.cache_path, encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("version") != _CACHE_VERSION or data.get("root") != self.root:
+                return False
+            listings = {
+                relative: _Listing(mtime_ns, files, directories)
+                for relative, (mtime_ns, files, directories) in data["directories"].items()
+            }
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        with self._lock:
+            self._listings = listings
+            self._publish(self._walk(lambda relative, absolute: listings.get(relative))[0])
+        return True
+
+    def scan(self, is_cancelled: Callable[[], bool] = lambda: False) -> ScanStats | None:
+        """Bring the paths up to date with the disk. Returns None if cancelled."""
+        started = time.perf_counter()
+        with self._lock:
+            previous = self._listings
+        listings: dict[str, _Listing] = {}
+        listed = 0
+
+        def listing(relative: str, absolute: str) -> _Listing | None:
+            nonlocal listed
+            if is_cancelled():
+                raise _Cancelled
+            try:
+                mtime_ns = os.stat(absolute).st_mtime_ns
+            except OSError:
+                return None
+            cached = previous.get(relative)
+            if cached is None or cached.mtime_ns != mtime_ns:
+                cached = _read_directory(absolute, mtime_ns)
+                if cached is None:
+                    return None
+                listed += 1
+            listings[relative] = cached
+            return cached
+
+        try:
+            paths, directories = self._walk(listing)
+        except _Cancelled:
+            return None
+        with self._lock:
+            self._listings = listings
+            if paths != self.paths:
+                self._publish(paths)
+            self.scanned = True
+        if listed or listings.keys() != previous.keys():
+            self._save(listings)
+        return ScanStats(directories, listed, len(paths), time.perf_counter() - started)
+
+    def _walk(self, listing: Callable[[str, str], _Listing | None]) -> tuple[list[str], int]:
+        paths: list[str] = []
+        directories = 0
+        stack = [("", self.root, IgnoreRules.for_root(self.root, self.extra_ignores))]
+        while stack:
+            relative, absolute, rules = stack.pop()
+            entry = listing(relative, absolute)
+            if entry is None:
+                continue
+            directories += 1
+            if relative and ".gitignore" in entry.files:
+                rules = rules.extended(absolute, relative)
+            prefix = f"{relative}/" if relative else ""
+            for name in entry.files:
+                child = prefix + name
+                if not rules.ignored(child, False):
+                    paths.append(child)
+            for name in reversed(entry.directories):
+                child = prefix + name
+                if not rules.ignored(child, True):
+                    stack.append((child, os.path.join(absolute, name), rules))
+        return paths, directories
+
+    def _publish(self, paths: list[str]) -> None:
+        self.paths = paths
+        self.generation += 1
+
+    def _save(self, listings: dict[str, _Listing]) -> None:
+        if self.cache_path is None:
+            return
+        data = {
+            "version": _CACHE_VERSION,
+            "root": self.root,
+            "directories": {
+                relative: [entry.mtime_ns, entry.files, entry.directories]
+                for relative, entry in listings.items()
+            },
+        }
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            return
+        save_texts([(str(self.cache_path), json.dumps(data, separators=(",", ":")))])
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def _read_directory(absolute: str, mtime_ns: int) -> _Listing | None:
+    files: list[str] = []
+    directories: list[str] = []
+    try:
+        with os.scandir(absolute) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.name)
+                    elif entry.is_file(follow_symlinks=False):
+                        files.append(entry.name)
+                except OSError:
+                    continue
+    except OSError:
+        return None
+    files.sort()
+    directories.sort()
+    return _Listing(mtime_ns, files, directories)
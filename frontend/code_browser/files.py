@@ -0,0 +1,54 @@
+"""Reading files for the editor off the UI thread."""
+
+from __future__ import annotations
+
+import codecs
+from collections.abc import Callable
+from pathlib import Path
+
+SNIFF_BYTES = 8192
+READ_CHUNK_BYTES = 1 << 20
+
+
+class UnsupportedFileError(ValueError):
+    """Raised for files the editor cannot show as UTF-8 text."""
+
+
+def check_text_head(head: bytes) -> None:
+    """Reject content whose first bytes show it is binary or not UTF-8."""
+    if b"\0" in head:
+        raise UnsupportedFileError("binary file")
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head)
+    except UnicodeDecodeError as error:
+        raise UnsupportedFileError("not valid UTF-8") from error
+
+
+def sniff_text_file(path: str | Path) -> None:
+    """Check the start of a file with `check_text_head` without reading the rest."""
+    with open(path, "rb") as file:
+        check_text_head(file.read(SNIFF_BYTES))
+
+
+def read_text_file(path: str | Path, is_cancelled: Callable[[], bool]) -> str | None:
+    """Read a UTF-8 text file in chunks, returning None if cancelled.
+
+    The first chunk is checked for NUL bytes and invalid UTF-8 before the
+    rest of the file is read, so binary files are rejected almost for free.
+    Line endings are normalised the same way `Path.read_text` does.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parts: list[str] = []
+    with open(path, "rb") as file:
+        head = file.read(SNIFF_BYTES)
+        check_text_head(head)
+        try:
+            parts.append(decoder.decode(head))
+            while chunk := file.read(READ_CHUNK_BYTES):
+                if is_cancelled():
+                    return None
+                parts.append(decoder.decode(chunk))
+            parts.append(decoder.decode(b"", final=True))
+        except UnicodeDecodeError as error:
+            raise UnsupportedFileError("not valid UTF-8") from error
+    return "".join(parts).replace("\r\n", "\n").replace("\r", "\n")
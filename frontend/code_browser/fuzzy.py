@@ -0,0 +1,131 @@
+"""Fuzzy matching of file paths against a few typed characters."""
+
+from __future__ import annotations
+
+import heapq
+import os
+import re
+
+# Matches collected from each of the two passes before ranking. Paths are
+# stored shortest-name first, so stopping early keeps the likeliest ones.
+MATCH_LIMIT = 500
+# Selected strings checked against the pattern in each pass. A query whose
+# characters are common but rarely in order would otherwise test most of a
+# large tree on every keystroke; this keeps a pass to a few milliseconds.
+SCAN_LIMIT = 10_000
+
+
+def _char_masks(strings: list[str]) -> dict[str, int]:
+    """For each character, an int with byte i set to 1 if strings[i] contains it."""
+    arrays: dict[str, bytearray] = {}
+    for index, string in enumerate(strings):
+        for char in set(string):
+            array = arrays.get(char)
+            if array is None:
+                array = arrays[char] = bytearray(len(strings))
+            array[index] = 1
+    return {char: int.from_bytes(array, "little") for char, array in arrays.items()}
+
+
+class FuzzyMatcher:
+    """Ranks paths whose characters contain the query in order.
+
+    For every character there is a mask with one byte per path, stored as
+    an int so masks can be ANDed at C speed. A query's mask picks out the
+    paths that contain all its characters, and an anchored regex made of
+    negated character classes then checks the order without backtracking.
+    Basenames have masks of their own and are matched in a separate pass,
+    since they are what people usually type.
+    """
+
+    def __init__(self, paths: list[str]) -> None:
+        self.paths = sorted(paths, key=lambda path: (len(os.path.basename(path)), len(path)))
+        self._lower = [path.lower() for path in self.paths]
+        self._names = [path[path.rfind("/") + 1 :] for path in self._lower]
+        # Many files share a name (__init__.py, index.ts), so the name pass
+        # runs over the distinct names and expands each match to its paths.
+        members: dict[str, list[int]] = {}
+        for index, name in enumerate(self._names):
+            members.setdefault(name, []).append(index)
+        self._distinct_names = list(members)
+        self._name_members = list(members.values())
+        self._path_masks = _char_masks(self._lower)
+        self._name_masks = _char_masks(self._distinct_names)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    @staticmethod
+    def _select(masks: dict[str, int], query: str, size: int) -> bytes | None:
+        mask = None
+        for char in set(query):
+            char_mask = masks.get(char)
+            if char_mask is None:
+                return None
+            mask = char_mask if mask is None else mask & char_mask
+        return mask.to_bytes(size, "little")
+
+    @staticmethod
+    def _scan(strings: list[str], selected: bytes | None, pattern: re.Pattern) -> list[int]:
+        """Indexes of up to MATCH_LIMIT strings that `pattern` matches.
+
+        Only the first SCAN_LIMIT selected strings are tried.
+        """
+        found: list[int] = []
+        if selected is None:
+            return found
+        find, match = selected.find, pattern.match
+        position = find(1)
+        for _ in range(SCAN_LIMIT):
+            if position == -1:
+                break
+            if match(strings[position]):
+                found.append(position)
+                if len(found) == MATCH_LIMIT:
+                    break
+            position = find(1, position + 1)
+        return found
+
+    def match(self, query: str, limit: int = 50) -> list[str]:
+        """The best `limit` paths for `query`, best first."""
+        query = query.lower().replace(" ", "")
+        if not query:
+            return self.paths[:limit]
+        in_path = re.compile("".join(f"[^{re.escape(c)}]*{re.escape(c)}" for c in query))
+        names = self._distinct_names
+        matched = self._scan(names, self._select(self._name_masks, query, len(names)), in_path)
+
+        def name_tier(name: int) -> tuple[bool, bool]:
+            return query not in names[name], not names[name].startswith(query)
+
+        # Every path of a better tier of names outranks the rest, so names
+        # are expanded tier by tier until there are enough paths. Paths
+        # sharing a name are stored shortest first, so `limit` of each is
+        # all the ranking can use.
+        candidates: list[int] = []
+        last_tier = None
+        for name in sorted(matched, key=name_tier):
+            tier = name_tier(name)
+            if len(candidates) >= MATCH_LIMIT or (len(candidates) >= limit and tier != last_tier):
+                break
+            candidates.extend(self._name_members[name][:limit])
+            last_tier = tier
+        # A match in the basename always outranks one spread over the
+        # directories, so those are only looked for if there is room.
+        if len(candidates) < limit:
+            selected = self._select(self._path_masks, query, len(self.paths))
+            candidates.extend(set(self._scan(self._lower, selected, in_path)) - set(candidates))
+        lower, path_names = self._lower, self._names
+
+        def rank(index: int) -> tuple:
+            name = path_names[index]
+            return (
+                query not in name,
+                not name.startswith(query),
+                in_path.match(name) is None,
+                query not in lower[index],
+                len(lower[index]),
+                index,
+            )
+
+        return [self.paths[index] for index in heapq.nsmallest(limit, candidates, key=rank)]
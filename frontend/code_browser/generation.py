@@ -0,0 +1,61 @@
+"""Book-keeping for code generation requests running in the background."""
+
+from __future__ import annotations
+
+import time
+
+from textual.worker import Worker
+
+
+class TabClosedError(Exception):
+    """Raised to stop a generation whose target tab was closed."""
+
+
+class GenerationJob:
+    """One generation request and where its output goes.
+
+    `offset` is the buffer offset the next chunk is inserted at. It is
+    resolved from `location` when the job is queued, and the job is one of
+    the buffer's anchors until it finishes, so every edit before it moves
+    it. `prompt_tokens` and `context_seconds` record the estimated prompt
+    size and how long its context took to select.
+    """
+
+    __slots__ = (
+        "path",
+        "location",
+        "offset",
+        "chars",
+        "submitted",
+        "first_chunk_at",
+        "prompt_tokens",
+        "context_seconds",
+        "worker",
+    )
+
+    def __init__(self, path: str, location: tuple[int, int]) -> None:
+        self.path = path
+        self.location = location
+        self.offset: int | None = None
+        self.chars = 0
+        self.submitted = time.monotonic()
+        self.first_chunk_at: float | None = None
+        self.prompt_tokens = 0
+        self.context_seconds = 0.0
+        self.worker: Worker | None = None
+
+
+def shift_anchors(jobs: list[GenerationJob], inserted: GenerationJob, length: int) -> None:
+    """Move the jobs sharing `inserted`'s anchor that have not inserted anything yet.
+
+    The buffer moves anchors after an insertion but leaves the ones at the
+    insertion point. A job there that has not started follows the new text,
+    while one that has is left alone, as its text ends there. This keeps the
+    output of jobs sharing an anchor from interleaving. Must be called before
+    `inserted.offset` is advanced past the new text.
+    """
+    for job in jobs:
+        if job is inserted or job.path != inserted.path or job.offset is None:
+            continue
+        if job.offset == inserted.offset and not job.chars:
+            job.offset += length
@@ -0,0 +1,110 @@
+"""Tree-sitter grammars that Textual does not bundle, loaded on first use."""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from importlib import import_module, resources
+
+# Editor language name -> (grammar module, language function, highlight
+# query files). Query files are concatenated in order, which is how the
+# upstream TypeScript and JSX queries extend the JavaScript ones.
+_GRAMMARS: dict[str, tuple[str, str, tuple[tuple[str, str], ...]]] = {
+    "c": ("tree_sitter_c", "language", (("tree_sitter_c", "highlights.scm"),)),
+    "cpp": (
+        "tree_sitter_cpp",
+        "language",
+        (("tree_sitter_c", "highlights.scm"), ("tree_sitter_cpp", "highlights.scm")),
+    ),
+    "csharp": (
+        "tree_sitter_c_sharp",
+        "language",
+        (("tree_sitter_c_sharp", "highlights.scm"),),
+    ),
+    "php": ("tree_sitter_php", "language_php", (("tree_sitter_php", "highlights.scm"),)),
+    "ruby": ("tree_sitter_ruby", "language", (("tree_sitter_ruby", "highlights.scm"),)),
+    "jsx": (
+        "tree_sitter_javascript",
+        "language",
+        (
+            ("tree_sitter_javascript", "highlights.scm"),
+            ("tree_sitter_javascript", "highlights-jsx.scm"),
+        ),
+    ),
+    "typescript": (
+        "tree_sitter_typescript",
+        "language_typescript",
+        (
+            ("tree_sitter_javascript", "highlights.scm"),
+            ("tree_sitter_typescript", "highlights.scm"),
+        ),
+    ),
+    "tsx": (
+        "tree_sitter_typescript",
+        "language_tsx",
+        (
+            ("tree_sitter_javascript", "highlights.scm"),
+            ("tree_sitter_javascript", "highlights-jsx.scm"),
+            ("tree_sitter_typescript", "highlights.scm"),
+        ),
+    ),
+}
+
+
+def has_grammar(name: str) -> bool:
+    """Whether `name` is a language this registry knows how to load."""
+    return name in _GRAMMARS
+
+
+@lru_cache(maxsize=None)
+def _read_query(module_name: str, filename: str) -> str:
+    try:
+        query_path = resources.files(module_name) / "queries" / filename
+        return query_path.read_text(encoding="utf-8")
+    except (ModuleNotFoundError, OSError):
+        return ""
+
+
+@lru_cache(maxsize=None)
+def load_grammar(name: str):
+    """Return the `(Language, Query)` pair for `name`, or None.
+
+    Both the language and its compiled highlight query are cached for the
+    lifetime of the process; a grammar that is not installed is remembered
+    as missing and never imported again.
+    """
+    spec = _GRAMMARS.get(name)
+    if spec is None:
+        return None
+    module_name, function_name, query_files = spec
+    try:
+        from tree_sitter import Language, Query
+
+        module = import_module(module_name)
+        language = Language(getattr(module, function_name)())
+        highlight_query = "\n".join(
+            _read_query(query_module, filename) for query_module, filename in query_files
+        )
+        return language, Query(language, highlight_query)
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=None)
+def load_language(name: str):
+    """Return the tree-sitter Language for editor language `name`, or None.
+
+    Covers the grammars in this registry and the ones Textual bundles,
+    which live in `tree_sitter_<name>` modules.
+    """
+    if name in _GRAMMARS:
+        grammar = load_grammar(name)
+        return None if grammar is None else grammar[0]
+    # XML is the one bundled grammar without a plain `language` function.
+    function_name = "language_xml" if name == "xml" else "language"
+    try:
+        from tree_sitter import Language
+
+        module = import_module(f"tree_sitter_{name}")
+        return Language(getattr(module, function_name)())
+    except Exception:
+        return None
@@ -0,0 +1,71 @@
+"""Viewport-limited syntax highlighting for the read-only code view."""
+
+from __future__ import annotations
+
+import hashlib
+from collections import OrderedDict
+
+from textual.content import Content
+from textual.highlight import guess_language, highlight
+
+from .document import PieceTable
+
+# Lines are highlighted in blocks of this size, so a one-line edit only
+# re-tokenizes the block that contains it.
+BLOCK_LINES = 128
+# Extra lines rendered above and below the visible rows.
+VIEWPORT_MARGIN = 64
+
+
+class HighlightCache:
+    """Highlighted line blocks keyed by path and a hash of the block's text.
+
+    Blocks are tokenized independently, which trades exact highlighting of
+    constructs spanning a block boundary (such as long docstrings) for never
+    running the lexer over more than the visible part of the file.
+    """
+
+    def __init__(self, max_blocks: int = 1024) -> None:
+        self.max_blocks = max_blocks
+        self._blocks: OrderedDict[tuple[str, bytes], Content] = OrderedDict()
+        self._languages: dict[str, str] = {}
+
+    def render(self, document: PieceTable, path: str, top: int, height: int) -> Content:
+        """Highlight the lines from `top` to `top + height`, plus a margin."""
+        lines = document.lines
+        first_row = max(0, top - VIEWPORT_MARGIN)
+        last_row = min(lines.line_count, top + height + VIEWPORT_MARGIN)
+        first_block = first_row // BLOCK_LINES
+        last_block = max(first_block, (last_row - 1) // BLOCK_LINES)
+
+        language = self._languages.get(path)
+        if language is None:
+            sample = document.get_text(0, lines.line_end(min(BLOCK_LINES, lines.line_count) - 1))
+            language = self._languages[path] = guess_language(sample, path)
+
+        blocks: list[Content] = []
+        for block in range(first_block, last_block + 1):
+            start_row = block * BLOCK_LINES
+            end_row = min(start_row + BLOCK_LINES, lines.line_count) - 1
+            if start_row > end_row:
+                break
+            code = document.get_text(lines.line_start(start_row), lines.line_end(end_row))
+            blocks.append(self._highlight_block(path, language, code))
+        return Content("\n").join(blocks)
+
+    def forget(self, path: str) -> None:
+        """Drop the cached language for `path`, e.g. after it was closed."""
+        self._languages.pop(path, None)
+
+    def _highlight_block(self, path: str, language: str, code: str) -> Content:
+        digest = hashlib.blake2b(code.encode("utf-8", "surrogatepass"), digest_size=16)
+        key = (path, digest.digest())
+        cached = self._blocks.get(key)
+        if cached is not None:
+            self._blocks.move_to_end(key)
+            return cached
+        content = highlight(code, language=language, path=path)
+        self._blocks[key] = content
+        if len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+        return content
@@ -0,0 +1,147 @@
+"""Gitignore-style rules for leaving files out of project-wide views."""
+
+from __future__ import annotations
+
+import os
+import re
+from typing import NamedTuple
+
+# Never useful to browse, whatever the .gitignore files say.
+ALWAYS_IGNORED = (".git/", ".hg/", ".svn/")
+
+
+def default_exclude_patterns() -> list[str]:
+    """Extra gitignore-style patterns from CODE_BROWSER_EXCLUDE, comma separated."""
+    value = os.getenv("CODE_BROWSER_EXCLUDE", "")
+    return [pattern.strip() for pattern in value.split(",") if pattern.strip()]
+
+
+class _Rule(NamedTuple):
+    base: str
+    """Directory of the .gitignore the rule came from, relative to the root."""
+    pattern: re.Pattern
+    negate: bool
+    directory_only: bool
+
+
+def _translate(pattern: str) -> str:
+    """Regex source for one gitignore glob, matched against a relative path."""
+    out: list[str] = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith("**/", index):
+            out.append("(?:.*/)?")
+            index += 3
+            continue
+        if pattern.startswith("/**", index) and index + 3 == len(pattern):
+            out.append("/.*")
+            index += 3
+            continue
+        if pattern.startswith("**", index):
+            out.append(".*")
+            index += 2
+            continue
+        if char == "*":
+            out.append("[^/]*")
+        elif char == "?":
+            out.append("[^/]")
+        elif char == "[":
+            end = pattern.find("]", index + 2)
+            if end == -1:
+                out.append(re.escape(char))
+            else:
+                body = pattern[index + 1 : end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body.replace(chr(92), chr(92) * 2)}]")
+                index = end
+        elif char == "\\" and index + 1 < len(pattern):
+            index += 1
+            out.append(re.escape(pattern[index]))
+        else:
+            out.append(re.escape(char))
+        index += 1
+    return "".join(out)
+
+
+def parse_patterns(lines, base: str = "") -> list[_Rule]:
+    """Rules for gitignore `lines` found in the directory `base`."""
+    rules = []
+    for line in lines:
+        line = line.rstrip("\n").rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        elif line.startswith("\\"):
+            line = line[1:]
+        directory_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        anchored = "/" in line
+        source = _translate(line.lstrip("/"))
+        if not anchored:
+            source = "(?:.*/)?" + source
+        try:
+            rules.append(_Rule(base, re.compile(source + r"\Z"), negate, directory_only))
+        except re.error:
+            continue
+    return rules
+
+
+class IgnoreRules:
+    """The exclude rules in effect for one directory.
+
+    Rules from nested .gitignore files are added with `extended` while
+    walking down the tree; as in git, the last matching rule wins. Most
+    paths match no rule at all, so a single regex joining every rule is
+    tried first and the rules are only walked when it matches.
+    """
+
+    def __init__(self, rules: list[_Rule] | tuple[_Rule, ...] = ()) -> None:
+        self._rules = tuple(rules)
+        self._any = None
+        if self._rules:
+            self._any = re.compile(
+                "|".join(
+                    f"(?:{re.escape(rule.base)}/)" + f"(?:{rule.pattern.pattern})"
+                    if rule.base
+                    else f"(?:{rule.pattern.pattern})"
+                    for rule in self._rules
+                )
+            )
+
+    @classmethod
+    def for_root(cls, root: str, extra_patterns: list[str] | tuple[str, ...] = ()) -> IgnoreRules:
+        """The built-in rules, `extra_patterns`, and the root's own .gitignore."""
+        rules = parse_patterns((*ALWAYS_IGNORED, *extra_patterns))
+        return cls(rules).extended(root, "")
+
+    def extended(self, directory: str, relative: str) -> IgnoreRules:
+        """These rules plus those of `directory`'s .gitignore, if it has one."""
+        try:
+            with open(os.path.join(directory, ".gitignore"), encoding="utf-8") as file:
+                added = parse_patterns(file, relative)
+        except (OSError, UnicodeDecodeError):
+            return self
+        return IgnoreRules(self._rules + tuple(added)) if added else self
+
+    def ignored(self, relative: str, is_dir: bool) -> bool:
+        """Whether the root-relative path `relative` is excluded."""
+        if self._any is None or not self._any.match(relative):
+            return False
+        for rule in reversed(self._rules):
+            if rule.directory_only and not is_dir:
+                continue
+            if rule.base:
+                if not relative.startswith(rule.base + "/"):
+                    continue
+                subject = relative[len(rule.base) + 1 :]
+            else:
+                subject = relative
+            if rule.pattern.match(subject):
+                return not rule.negate
+        return False
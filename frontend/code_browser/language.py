@@ -1,32 +1,47 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import os
+import re
+import time
 from pathlib import Path
 
 from pygments.lexers import guess_lexer
 from pygments.util import ClassNotFound
-from textual.widgets import TextArea
+from textual import work
+from textual.worker import get_current_worker
 from textual.widgets.text_area import LanguageDoesNotExist
 
 from bot.gaggle import Gaggle
 
+from .context import PackedContext, build_code_prompt, pack_context
+from .document import PieceTable
+from .grammars import has_grammar, load_grammar
+from .retrieval import RETRIEVAL_SNIPPETS, pack_snippets
+from .widgets import CodeEditor
+
+# Content detection only looks at the start of a buffer, so edits further
+# down never trigger another guess_lexer pass.
+LANGUAGE_SAMPLE_CHARS = 4096
+
+# The Gaggle is built and connected this long after mount, then pinged on
+# this interval so its pooled connection is still open for the next request.
+GAGGLE_PREWARM_DELAY = 1.0
+GAGGLE_HEALTH_CHECK_SECONDS = 60.0
+
 
 class LanguageMixin:
-    def _register_optional_languages(self) -> None:
-        code_view = self.query_one("#code-editor", TextArea)
-        if "c" in code_view.available_languages:
+    def _register_grammar(self, code_view: CodeEditor, language: str | None) -> None:
+        """Register a non-bundled grammar with the editor the first time it is needed."""
+        if language is None or not has_grammar(language):
             return
-
-        try:
-            from tree_sitter import Language
-            import tree_sitter_c
-
-            code_view.register_language(
-                "c",
-                Language(tree_sitter_c.language()),
-                tree_sitter_c.HIGHLIGHTS_QUERY,
-            )
-        except Exception:
+        if language in code_view.available_languages:
+            return
+        grammar = load_grammar(language)
+        if grammar is None:
             return
+        code_view.register_compiled_language(language, *grammar)
 
     @staticmethod
     def _language_from_path(path: str) -> str | None:
@@ -97,6 +112,30 @@ class LanguageMixin:
             "xml": "xml",
         }.get(alias)
 
+    @staticmethod
+    def _language_from_shebang(code: str) -> str | None:
+        if not code.startswith("#!"):
+            return None
+        words = code[2:].split("\n", 1)[0].split()
+        if not words:
+            return None
+        interpreter = Path(words[0]).name
+        if interpreter == "env" and len(words) > 1:
+            interpreter = words[1]
+        match = re.match(r"[a-z]+", interpreter)
+        if match is None:
+            return None
+        return {
+            "python": "python",
+            "bash": "bash",
+            "sh": "bash",
+            "zsh": "bash",
+            "dash": "bash",
+            "node": "javascript",
+            "ruby": "ruby",
+            "php": "php",
+        }.get(match.group())
+
     def _language_from_content(self, code: str) -> str | None:
         if not code.strip():
             return None
@@ -111,32 +150,136 @@ class LanguageMixin:
                 return mapped
         return None
 
-    def _language_for_code(self, path: str, code: str) -> str | None:
+    def _language_for_code(self, path: str, code: PieceTable) -> str | None:
         by_path = self._language_from_path(path)
         if by_path is not None:
             return by_path
-        return self._language_from_content(code)
 
-    def _apply_editor_language(self, path: str | None, code: str) -> None:
+        stats = self._language_detection_stats
+        cached = self._detected_languages.get(path)
+        if cached is not None and cached[0] == code.generation:
+            stats["hits"] += 1
+            return cached[2]
+        sample = code.get_text(0, LANGUAGE_SAMPLE_CHARS)
+        fingerprint = hashlib.blake2b(
+            sample.encode("utf-8", "surrogatepass"), digest_size=16
+        ).digest()
+        if cached is not None and cached[1] == fingerprint:
+            stats["hits"] += 1
+            self._detected_languages[path] = (code.generation, fingerprint, cached[2])
+            return cached[2]
+
+        started = time.perf_counter()
+        language = self._language_from_shebang(sample)
+        if language is None:
+            language = self._language_from_content(sample)
+        elapsed = time.perf_counter() - started
+        stats["runs"] += 1
+        stats["seconds"] += elapsed
+        self.log.debug(f"language detection for {path}: {language} in {elapsed * 1000:.2f} ms")
+        self._detected_languages[path] = (code.generation, fingerprint, language)
+        return language
+
+    def _apply_editor_language(self, path: str | None, code: PieceTable) -> None:
         if path is None:
             return
         language = self._language_for_code(path, code)
-        code_view = self.query_one("#code-editor", TextArea)
+        code_view = self.query_one("#code-editor", CodeEditor)
         if hasattr(code_view, "language"):
             if code_view.language == language:
                 return
+            self._register_grammar(code_view, language)
             try:
                 code_view.language = language
             except LanguageDoesNotExist:
                 code_view.language = None
 
-    def _build_code_prompt(self, request_text: str) -> str:
-        language = self._resolved_language_for_path(self.path)
-        return (
-            f"Generate only {language} code. "
-            "Return plain code text only. "
-            f"Request: {request_text}"
+    def _pack_request_context(
+        self, path: str, code: PieceTable, location: tuple[int, int], language: str
+    ) -> PackedContext | None:
+        """Select context around `location` within the token budget, or None if disabled."""
+        if self._context_token_budget <= 0:
+            return None
+        context = pack_context(code.text, language, location, self._context_token_budget)
+        source = "syntax tree" if context.parsed else "line window"
+        self.log.debug(
+            f"context for {path}: {context.lines} lines, ~{context.tokens} tokens"
+            f" from the {source} in {context.seconds * 1000:.2f} ms"
         )
+        return context
+
+    def _related_snippets(
+        self, path: str, code: PieceTable, location: tuple[int, int], request_text: str
+    ) -> str:
+        """Code from other project files that matches the request and the lines around it."""
+        if self._retrieval_token_budget <= 0:
+            return ""
+        started = time.perf_counter()
+        row = location[0]
+        lines = code.lines
+        first, last = max(0, row - 3), min(lines.line_count - 1, row + 3)
+        nearby = code.get_text(lines.line_start(first), lines.line_end(last))
+        snippets = self._project_index.search(
+            f"{request_text}\n{nearby}", RETRIEVAL_SNIPPETS, exclude=path
+        )
+        related = pack_snippets(
+            snippets, self._snippet_lines, self.root_path, self._retrieval_token_budget
+        )
+        elapsed = time.perf_counter() - started
+        self._generation_stats["last_retrieval_seconds"] = elapsed
+        self.log.debug(
+            f"retrieval for {path}: {len(snippets)} snippets from"
+            f" {self._project_index.file_count} files in {elapsed * 1000:.2f} ms"
+        )
+        return related
+
+    def _snippet_lines(self, path: str) -> list[str] | None:
+        document = self.buffers.get(path)
+        if document is not None:
+            return document.text.split("\n")
+        try:
+            return Path(path).read_text(encoding="utf-8").split("\n")
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def _start_project_index(self) -> None:
+        if self._retrieval_token_budget > 0:
+            self._build_project_index()
+
+    @work(thread=True, exclusive=True, group="project-index")
+    def _build_project_index(self) -> None:
+        """Index the files the file index lists, for related-code retrieval."""
+        worker = get_current_worker()
+        started = time.perf_counter()
+        file_index = self._file_index
+        if not file_index.scanned and file_index.scan(lambda: worker.is_cancelled) is None:
+            return
+        index = self._project_index
+        index.build(file_index.paths, lambda: worker.is_cancelled)
+        self.log.debug(
+            f"indexed {index.file_count} files ({index.chunk_count} chunks)"
+            f" in {time.perf_counter() - started:.2f}s"
+        )
+
+    @work(thread=True, group="project-index-update")
+    def _reindex_saved(self, saved: list[tuple[str, PieceTable]]) -> None:
+        """Refresh the index entries of files just written to disk.
+
+        Files it does not hold yet are left to the next build, which checks
+        them against the ignore rules.
+        """
+        for path, snapshot in saved:
+            if self._project_index.has_file(path):
+                self._project_index.update_file(path, snapshot.text)
+
+    def _build_code_prompt(
+        self,
+        request_text: str,
+        language: str,
+        context: PackedContext | None = None,
+        related: str = "",
+    ) -> str:
+        return build_code_prompt(request_text, language, context, related)
 
     def _resolved_language_for_path(self, path: str | None) -> str:
         if not path:
@@ -148,11 +291,56 @@ class LanguageMixin:
         return suffix or "text"
 
     def _get_gaggle(self) -> Gaggle | None:
+        """Build the Gaggle for the backend named by GAGGLE_BACKEND, once."""
         if self._gaggle is not None:
             return self._gaggle
         try:
             self._gaggle = Gaggle()
-        except ValueError:
-            self.sub_title = "MISSING GEMINI_API_KEY"
+        except ValueError as error:
+            self.sub_title = f"GEN UNAVAILABLE: {str(error)[:60]}"
             return None
         return self._gaggle
+
+    def _start_gaggle_prewarm(self) -> None:
+        """Warm the generation client in the background unless GAGGLE_PREWARM=0."""
+        if os.getenv("GAGGLE_PREWARM", "1").strip().lower() in {"0", "false", "no", "off"}:
+            return
+        self._prewarm_gaggle()
+        self.set_interval(GAGGLE_HEALTH_CHECK_SECONDS, self._check_gaggle_health)
+
+    @work(exclusive=True, group="gaggle-warmup")
+    async def _prewarm_gaggle(self) -> None:
+        """Build the Gaggle and open its connection before the first request needs it."""
+        if self._gaggle is None:
+            try:
+                gaggle = await asyncio.to_thread(Gaggle)
+            except Exception as error:
+                self.log.debug(f"gaggle pre-warm skipped: {error}")
+                return
+            if self._gaggle is None:
+                self._gaggle = gaggle
+        await self._ping_gaggle(self._gaggle)
+
+    def _check_gaggle_health(self) -> None:
+        if self._gaggle is None or self._generation_jobs:
+            return
+        self._run_gaggle_health_check(self._gaggle)
+
+    @work(exclusive=True, group="gaggle-health")
+    async def _run_gaggle_health_check(self, gaggle: Gaggle) -> None:
+        await self._ping_gaggle(gaggle)
+
+    async def _ping_gaggle(self, gaggle: Gaggle) -> None:
+        health = self._gaggle_health
+        health["checked"] = time.time()
+        try:
+            health["seconds"] = await gaggle.warm_up()
+        except Exception as error:
+            health["ok"] = False
+            health["error"] = str(error).strip() or type(error).__name__
+            self.log.warning(f"gaggle health check failed: {health['error']}")
+            return
+        health["ok"] = True
+        health["error"] = None
+        self.log.debug(f"gaggle health check took {health['seconds'] * 1000:.0f} ms")
+
@@ -0,0 +1,134 @@
+"""Memory-mapped, read-only access to files too large to load into the editor."""
+
+from __future__ import annotations
+
+import mmap
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from pathlib import Path
+
+# The line index records one checkpoint per chunk of roughly this many bytes;
+# exact line offsets are only computed for chunks that are actually viewed.
+CHUNK_BYTES = 1 << 20
+_CACHED_CHUNKS = 8
+
+
+class MappedFile:
+    """Lines of a memory-mapped file, indexed lazily from the start.
+
+    Only one checkpoint per chunk (its byte offset and first line number) is
+    kept for the whole file, so the index stays small however many lines
+    there are. Line offsets inside a chunk are computed when it is viewed.
+    Reads and indexing are serialised so a background thread can finish the
+    index while the UI thread renders lines.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = str(path)
+        with open(path, "rb") as file:
+            self.size = file.seek(0, 2)
+            self._map = None
+            if self.size:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._chunk_offsets: list[int] = []
+        self._chunk_lines: list[int] = []
+        self._indexed_to = 0
+        self._newlines = 0
+        self._line_cache: OrderedDict[int, list[int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def closed(self) -> bool:
+        return self._map is None and self.size > 0
+
+    @property
+    def fully_indexed(self) -> bool:
+        return self._indexed_to >= self.size
+
+    @property
+    def line_count(self) -> int:
+        """The line count, estimated from the indexed part until indexing finishes."""
+        if self.fully_indexed:
+            return self._newlines + 1
+        if self._indexed_to == 0:
+            return max(1, self.size // 80)
+        return max(self._newlines + 1, self._newlines * self.size // self._indexed_to)
+
+    def index_chunk(self) -> bool:
+        """Index the next chunk of the file. Returns False once everything is indexed."""
+        with self._lock:
+            if self.closed:
+                return False
+            return self._index_chunk()
+
+    def _index_chunk(self) -> bool:
+        if self.fully_indexed:
+            return False
+        start = self._indexed_to
+        newline = self._map.find(b"\n", min(start + CHUNK_BYTES, self.size) - 1)
+        end = self.size if newline == -1 else newline + 1
+        self._chunk_offsets.append(start)
+        self._chunk_lines.append(self._newlines)
+        self._newlines += self._map[start:end].count(b"\n")
+        self._indexed_to = end
+        return not self.fully_indexed
+
+    def lines(self, first: int, count: int) -> list[str]:
+        """Decode up to `count` lines starting at line `first`."""
+        with self._lock:
+            if self._map is None:
+                return [""] if first == 0 and count > 0 and not self.closed else []
+            return self._lines(first, count)
+
+    def _lines(self, first: int, count: int) -> list[str]:
+        result: list[str] = []
+        for row in range(first, first + count):
+            while not self.fully_indexed and self._newlines <= row:
+                self._index_chunk()
+            if row > self._newlines or (row == self._newlines and not self.fully_indexed):
+                break
+            chunk = bisect_right(self._chunk_lines, row) - 1
+            starts = self._line_starts(chunk)
+            within = row - self._chunk_lines[chunk]
+            start = starts[within]
+            if within + 1 < len(starts):
+                end = starts[within + 1] - 1
+            else:
+                end = self._chunk_end(chunk)
+                if end < self.size or self._map[end - 1 : end] == b"\n":
+                    end -= 1
+            result.append(self._map[start:end].decode("utf-8", "replace").rstrip("\r"))
+        return result
+
+    def close(self) -> None:
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+    def _chunk_end(self, chunk: int) -> int:
+        if chunk + 1 < len(self._chunk_offsets):
+            return self._chunk_offsets[chunk + 1]
+        return self._indexed_to
+
+    def _line_starts(self, chunk: int) -> list[int]:
+        cached = self._line_cache.get(chunk)
+        if cached is not None:
+            self._line_cache.move_to_end(chunk)
+            return cached
+        start = self._chunk_offsets[chunk]
+        end = self._chunk_end(chunk)
+        starts = [start]
+        find = self._map.find
+        position = find(b"\n", start, end)
+        while position != -1:
+            starts.append(position + 1)
+            position = find(b"\n", position + 1, end)
+        if end < self.size:
+            # The last newline of a chunk starts the next chunk's first line.
+            starts.pop()
+        self._line_cache[chunk] = starts
+        if len(self._line_cache) > _CACHED_CHUNKS:
+            self._line_cache.popitem(last=False)
+        return starts
@@ -0,0 +1,115 @@
+"""Line-start offset index used to convert between locations and offsets."""
+
+from __future__ import annotations
+
+from bisect import bisect_right
+
+Location = tuple[int, int]
+
+# Line starts are kept in blocks of this many entries. An edit rewrites the
+# blocks it touches and moves the base offset of every later block, so it
+# never has to shift each following line start one by one.
+_BLOCK_SIZE = 512
+
+
+class LineIndex:
+    """Offsets of every line start, stored as blocks relative to a base.
+
+    Converting a (row, column) location to an offset, or back, is two
+    binary searches. Edits update the index in place from the edited text
+    alone, without rescanning the document.
+    """
+
+    def __init__(self, starts: list[int], length: int, newline: str = "\n") -> None:
+        self.newline = newline
+        self._length = length
+        self._blocks: list[list[int]] = []
+        self._bases: list[int] = []
+        self._rows: list[int] = []
+        self._rebuild_blocks(0, starts)
+
+    @property
+    def line_count(self) -> int:
+        return self._rows[-1] + len(self._blocks[-1])
+
+    def line_start(self, row: int) -> int:
+        """Offset of the first character of `row`."""
+        block_index = bisect_right(self._rows, row) - 1
+        return self._bases[block_index] + self._blocks[block_index][row - self._rows[block_index]]
+
+    def line_end(self, row: int) -> int:
+        """Offset just past the last character of `row`, excluding the newline."""
+        if row + 1 >= self.line_count:
+            return self._length
+        return self.line_start(row + 1) - len(self.newline)
+
+    def offset_of(self, location: Location) -> int:
+        """Convert a (row, column) location into an offset, clamped to the text."""
+        row, column = location
+        row = max(0, min(row, self.line_count - 1))
+        start = self.line_start(row)
+        return start + max(0, min(column, self.line_end(row) - start))
+
+    def location_of(self, offset: int) -> Location:
+        """Convert an offset into a (row, column) location."""
+        offset = max(0, min(offset, self._length))
+        block_index = bisect_right(self._bases, offset) - 1
+        block = self._blocks[block_index]
+        base = self._bases[block_index]
+        within = bisect_right(block, offset - base) - 1
+        return self._rows[block_index] + within, offset - base - block[within]
+
+    def replace(self, start: int, end: int, text: str) -> None:
+        """Update the index for `text` replacing the offsets `start` to `end`."""
+        first_row = self.location_of(start)[0]
+        last_row = self.location_of(end)[0]
+        first_block = bisect_right(self._rows, first_row) - 1
+        last_block = bisect_right(self._rows, last_row) - 1
+
+        region: list[int] = []
+        for block_index in range(first_block, last_block + 1):
+            base = self._bases[block_index]
+            region.extend(base + value for value in self._blocks[block_index])
+
+        keep_before = first_row - self._rows[first_block] + 1
+        drop_until = last_row - self._rows[first_block] + 1
+        delta = len(text) - (end - start)
+
+        inserted: list[int] = []
+        step = len(self.newline)
+        find = text.find
+        position = find(self.newline)
+        while position != -1:
+            inserted.append(start + position + step)
+            position = find(self.newline, position + step)
+
+        region = (
+            region[:keep_before]
+            + inserted
+            + [value + delta for value in region[drop_until:]]
+        )
+
+        del self._blocks[first_block : last_block + 1]
+        del self._bases[first_block : last_block + 1]
+        for block_index in range(first_block, len(self._bases)):
+            self._bases[block_index] += delta
+        self._length += delta
+        self._rebuild_blocks(first_block, region)
+
+    def _rebuild_blocks(self, first_block: int, starts: list[int]) -> None:
+        """Split `starts` into blocks at `first_block` and refresh the row table."""
+        new_blocks: list[list[int]] = []
+        new_bases: list[int] = []
+        for index in range(0, len(starts), _BLOCK_SIZE):
+            chunk = starts[index : index + _BLOCK_SIZE]
+            base = chunk[0]
+            new_blocks.append([value - base for value in chunk])
+            new_bases.append(base)
+        self._blocks[first_block:first_block] = new_blocks
+        self._bases[first_block:first_block] = new_bases
+
+        del self._rows[first_block:]
+        row = self._rows[-1] + len(self._blocks[first_block - 1]) if first_block else 0
+        for block in self._blocks[first_block:]:
+            self._rows.append(row)
+            row += len(block)
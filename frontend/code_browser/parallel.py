@@ -0,0 +1,82 @@
+"""A shared process pool for CPU-bound work over many project files."""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections.abc import Callable, Iterable
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def process_pool() -> Executor | None:
+    """The shared pool of worker processes, started on first use; None if unavailable."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            try:
+                # The app runs threads, which fork does not copy safely.
+                _pool = ProcessPoolExecutor(os.cpu_count() or 1, mp_context=get_context("spawn"))
+            except (OSError, ValueError, NotImplementedError):
+                return None
+        return _pool
+
+
+def _discard_pool() -> None:
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def batched(items: list, size: int) -> Iterable[list]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def run_batches(
+    func: Callable,
+    batches: list[list],
+    args: tuple,
+    on_result: Callable,
+    is_cancelled: Callable[[], bool],
+) -> bool:
+    """Run `func(*args, batch)` for every batch in the process pool.
+
+    Results are passed to `on_result` as they complete. Batches the pool
+    could not run, e.g. because a worker died, are run on the calling
+    thread instead. Returns False if cancelled.
+    """
+    remaining = list(batches)
+    pool = process_pool()
+    if pool is not None and remaining:
+        try:
+            pending: dict[Future, int] = {
+                pool.submit(func, *args, batch): number for number, batch in enumerate(batches)
+            }
+        except (BrokenProcessPool, RuntimeError):
+            _discard_pool()
+        else:
+            finished: set[int] = set()
+            try:
+                while pending:
+                    if is_cancelled():
+                        for future in pending:
+                            future.cancel()
+                        return False
+                    done, _ = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        number = pending.pop(future)
+                        on_result(future.result())
+                        finished.add(number)
+            except BrokenProcessPool:
+                _discard_pool()
+            remaining = [batch for number, batch in enumerate(batches) if number not in finished]
+    for batch in remaining:
+        if is_cancelled():
+            return False
+        on_result(func(*args, batch))
+    return True
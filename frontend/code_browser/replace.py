@@ -0,0 +1,188 @@
+"""Project-wide search and replace, computed in the process pool."""
+
+from __future__ import annotations
+
+import re
+from collections.abc import Callable
+from typing import NamedTuple
+
+from .document import text_digest
+from .parallel import batched, run_batches
+from .search import (
+    INLINE_SCAN_FILES,
+    SCAN_BATCH_FILES,
+    SearchIndex,
+    SearchQuery,
+    read_source,
+)
+
+# Files above this size are left alone; they would open read-only anyway.
+MAX_REPLACE_BYTES = 16 * 1024 * 1024
+# Changed lines kept per file for the preview. Every match is still replaced.
+MAX_PREVIEW_HUNKS = 20
+
+
+class Hunk(NamedTuple):
+    row: int
+    old: str
+    """The lines holding one or more matches."""
+    new: str
+    """The same lines after replacement."""
+
+
+class FileReplacement(NamedTuple):
+    path: str
+    """Relative to the search root."""
+    digest: bytes
+    """`text_digest` of the text the edits were computed on."""
+    edits: tuple[tuple[int, int, str], ...]
+    """`(start, end, text)` offsets into that text, in order."""
+    hunks: tuple[Hunk, ...]
+
+
+def replacement_template(text: str, replacement: str, pattern: re.Pattern) -> str:
+    """The `Match.expand` template for a replacement typed next to query `text`.
+
+    Regex queries (`/regex/`) may refer to groups as `\\1` or `\\g<name>`;
+    literal queries replace with the text as typed. Raises `re.error` for a
+    bad group reference.
+    """
+    if len(text) > 2 and text.startswith("/") and text.endswith("/"):
+        # Compiling the template does not need a match, so this checks it.
+        pattern.sub(replacement, "")
+        return replacement
+    return replacement.replace("\\", "\\\\")
+
+
+def _normalize(text: str) -> str:
+    """Line endings as `read_text_file` leaves them, so offsets fit the buffers."""
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def replace_text(
+    relative: str, text: str, pattern: re.Pattern, template: str
+) -> FileReplacement | None:
+    """The edits replacing every match of `pattern` in `text`, or None if nothing changes."""
+    edits = []
+    for match in pattern.finditer(text):
+        new = match.expand(template)
+        if new != match.group():
+            edits.append((match.start(), match.end(), new))
+    if not edits:
+        return None
+    return FileReplacement(relative, text_digest(text), tuple(edits), _hunks(text, edits))
+
+
+def _hunks(text: str, edits: list[tuple[int, int, str]]) -> tuple[Hunk, ...]:
+    """The changed lines of the first MAX_PREVIEW_HUNKS groups of edits on shared lines."""
+    groups: list[list] = []
+    for start, end, new in edits:
+        first = text.rfind("\n", 0, start) + 1
+        last = text.find("\n", end)
+        if last == -1:
+            last = len(text)
+        if groups and first <= groups[-1][1]:
+            groups[-1][1] = max(groups[-1][1], last)
+            groups[-1][2].append((start, end, new))
+            continue
+        if len(groups) == MAX_PREVIEW_HUNKS:
+            break
+        groups.append([first, last, [(start, end, new)]])
+    hunks = []
+    row, counted = 0, 0
+    for first, last, group in groups:
+        row += text.count("\n", counted, first)
+        counted = first
+        _, _, middle = apply_edits(text, group)
+        new = text[first : group[0][0]] + middle + text[group[-1][1] : last]
+        hunks.append(Hunk(row, text[first:last], new))
+    return tuple(hunks)
+
+
+def apply_edits(text: str, edits) -> tuple[int, int, str]:
+    """`(start, end, middle)`: replacing `text[start:end]` with `middle` makes every edit."""
+    parts = []
+    position = edits[0][0]
+    for start, end, new in edits:
+        parts.append(text[position:start])
+        parts.append(new)
+        position = end
+    return edits[0][0], position, "".join(parts)
+
+
+def replace_files(
+    root: str,
+    source: str,
+    flags: int,
+    needle: bytes | None,
+    template: str,
+    relatives: list[str],
+) -> list[FileReplacement]:
+    """Replacements in the files `relatives` under `root`.
+
+    Runs in the process pool, so it takes the pattern's source rather than
+    the compiled pattern. Files that are binary, too large or not valid
+    UTF-8 are left out, as the editor could not load them.
+    """
+    pattern = re.compile(source, flags)
+    ignore_case = bool(flags & re.IGNORECASE)
+    found = []
+    for relative in relatives:
+        data = read_source(root, relative, MAX_REPLACE_BYTES)
+        if data is None:
+            continue
+        if needle is not None and needle not in (data.lower() if ignore_case else data):
+            continue
+        try:
+            text = _normalize(data.decode("utf-8"))
+        except UnicodeDecodeError:
+            continue
+        replacement = replace_text(relative, text, pattern, template)
+        if replacement is not None:
+            found.append(replacement)
+    return found
+
+
+def find_replacements(
+    root: str,
+    relatives: list[str],
+    query: SearchQuery,
+    template: str,
+    on_files: Callable[[list[FileReplacement]], None],
+    is_cancelled: Callable[[], bool] = lambda: False,
+    index: SearchIndex | None = None,
+    overrides: dict[str, str] | None = None,
+) -> bool:
+    """Pass the replacements in the files `relatives` under `root` to `on_files` as found.
+
+    Candidate files are narrowed down with `index` and scanned in the
+    process pool the same way `search` does. `overrides` maps relative
+    paths to text used instead of the file on disk, e.g. for unsaved
+    buffers. With an `index`, files are only narrowed down once it has been
+    refreshed. Returns False if cancelled.
+    """
+    overrides = overrides or {}
+    found = []
+    for relative, text in overrides.items():
+        replacement = replace_text(relative, text, query.pattern, template)
+        if replacement is not None:
+            found.append(replacement)
+    if found:
+        on_files(found)
+    if index is not None and not index.wait_fresh(is_cancelled):
+        return False
+    files = index.candidates(query, relatives) if index is not None else list(relatives)
+    files = [relative for relative in files if relative not in overrides]
+    args = (root, query.pattern.pattern, query.pattern.flags, query.needle, template)
+
+    def collect(replacements: list[FileReplacement]) -> None:
+        if replacements and not is_cancelled():
+            on_files(replacements)
+
+    if len(files) < INLINE_SCAN_FILES:
+        if is_cancelled():
+            return False
+        collect(replace_files(*args, files))
+        return True
+    batches = list(batched(files, SCAN_BATCH_FILES))
+    return run_batches(replace_files, batches, args, collect, is_cancelled)
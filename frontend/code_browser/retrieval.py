@@ -0,0 +1,312 @@
+"""An in-memory BM25 index over project files, for finding related code."""
+
+from __future__ import annotations
+
+import heapq
+import math
+import os
+import re
+import threading
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple
+
+from .context import estimate_tokens, is_definition, tree_sitter_language
+from .files import SNIFF_BYTES, UnsupportedFileError, check_text_head
+
+MAX_FILE_BYTES = 512 * 1024
+# Definitions longer than this are split into windows of CHUNK_LINES, and
+# files without a grammar (or without definitions) are windowed the same way.
+MAX_CHUNK_LINES = 120
+CHUNK_LINES = 40
+# Query terms found in more than this share of chunks carry almost no
+# signal under BM25 and are skipped. Terms in more than CANDIDATE_POSTINGS
+# chunks only re-rank what rarer terms matched. Both keep queries fast on
+# large trees.
+MAX_TERM_SHARE = 0.05
+CANDIDATE_POSTINGS = 2000
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Snippets looked up per generation request.
+RETRIEVAL_SNIPPETS = 4
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_WORD_PART = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+_STOP_WORDS = frozenset(
+    "and are as def else for from if import in is it not of or return self the this to"
+    " var let const function class int void public private static new with".split()
+)
+
+
+@lru_cache(maxsize=1 << 16)
+def _word_terms(word: str) -> tuple[str, ...]:
+    terms = []
+    lowered = word.lower()
+    if len(lowered) > 1 and lowered not in _STOP_WORDS:
+        terms.append(lowered)
+    parts = _WORD_PART.findall(word)
+    if len(parts) > 1:
+        for part in parts:
+            part = part.lower()
+            if len(part) > 1 and part not in _STOP_WORDS:
+                terms.append(part)
+    return tuple(terms)
+
+
+def tokenize(text: str) -> Iterator[str]:
+    """Lower-cased identifiers and their camelCase/snake_case parts."""
+    for word in _WORD.findall(text):
+        yield from _word_terms(word)
+
+
+def term_counts(text: str) -> Counter:
+    """`Counter(tokenize(text))`, splitting each distinct word only once."""
+    counts: Counter = Counter()
+    for word, count in Counter(_WORD.findall(text)).items():
+        for term in _word_terms(word):
+            counts[term] += count
+    return counts
+
+
+def default_retrieval_budget() -> int:
+    """Token budget for related snippets, from GAGGLE_RETRIEVAL_TOKENS (0 disables the index)."""
+    try:
+        return max(0, int(os.getenv("GAGGLE_RETRIEVAL_TOKENS", "800")))
+    except ValueError:
+        return 800
+
+
+class Snippet(NamedTuple):
+    path: str
+    start: int
+    end: int
+    """Last line of the snippet, inclusive."""
+    score: float
+
+
+class _Chunk(NamedTuple):
+    path: str
+    start: int
+    end: int
+    length: int
+    terms: tuple[str, ...]
+
+
+def _windows(first: int, last: int) -> Iterator[tuple[int, int]]:
+    for start in range(first, last + 1, CHUNK_LINES):
+        yield start, min(last, start + CHUNK_LINES - 1)
+
+
+def _definition_spans(node) -> Iterator[tuple[int, int]]:
+    for child in node.named_children:
+        if not is_definition(child):
+            continue
+        first, last = child.start_point[0], child.end_point[0]
+        if last - first < MAX_CHUNK_LINES:
+            yield first, last
+            continue
+        nested = list(_definition_spans(child.child_by_field_name("body") or child))
+        if nested:
+            # The header of a large class is its own chunk; its methods follow.
+            yield first, min(last, first + CHUNK_LINES - 1, nested[0][0] - 1)
+            yield from nested
+        else:
+            yield from _windows(first, last)
+
+
+def chunk_lines(text: str, language: str | None) -> list[tuple[int, int]]:
+    """Line spans of `text` to index: its definitions, or windows of lines."""
+    line_count = text.count("\n") + 1
+    ts_language = tree_sitter_language(language)
+    if ts_language is not None:
+        from tree_sitter import Parser
+
+        tree = Parser(ts_language).parse(text.encode("utf-8"))
+        spans = [span for span in _definition_spans(tree.root_node) if span[0] <= span[1]]
+        if spans:
+            return spans
+    return list(_windows(0, line_count - 1))
+
+
+class ProjectIndex:
+    """BM25 over symbol-sized chunks of the text files listed by a `FileIndex`.
+
+    Chunks are definitions found with tree-sitter where a grammar is
+    available, and fixed windows of lines otherwise. Only term counts and
+    line spans are kept; snippet text is read back when a result is used.
+    The index is built and updated from worker threads and queried from
+    the UI thread, so every access goes through one lock, taken once per
+    file while building so a query never waits long. Snippets end up in
+    prompts sent to the model, so the files come from the same list as the
+    finder, with ignore rules applied, and hidden files such as `.env` are
+    left out as well.
+    """
+
+    def __init__(self, root: str, language_for_path: Callable[[str], str | None]) -> None:
+        self.root = root
+        self.language_for_path = language_for_path
+        self.ready = False
+        self._lock = threading.Lock()
+        self._chunks: dict[int, _Chunk] = {}
+        self._file_chunks: dict[str, list[int]] = {}
+        self._postings: dict[str, dict[int, int]] = {}
+        self._total_length = 0
+        self._next_id = 0
+
+    @property
+    def file_count(self) -> int:
+        return len(self._file_chunks)
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self._chunks)
+
+    def build(
+        self, relatives: Iterable[str], is_cancelled: Callable[[], bool] = lambda: False
+    ) -> None:
+        """Index the files `relatives` under the root that are not indexed yet, and drop the rest.
+
+        `relatives` is a `FileIndex`'s `paths`.
+        """
+        wanted = [
+            str(Path(self.root, relative))
+            for relative in relatives
+            if not any(part.startswith(".") for part in relative.split("/"))
+        ]
+        kept = set(wanted)
+        for path in [path for path in self._file_chunks if path not in kept]:
+            self.update_file(path, None)
+        for path in wanted:
+            if is_cancelled():
+                return
+            if path in self._file_chunks:
+                continue
+            text = self._read(path)
+            if text is not None:
+                self.update_file(path, text)
+        self.ready = not is_cancelled()
+
+    def has_file(self, path: str) -> bool:
+        """Whether `path` was indexed by `build`."""
+        return path in self._file_chunks
+
+    def update_file(self, path: str, text: str | None) -> None:
+        """Replace the chunks of `path` with ones from `text`, or drop them if None."""
+        entries: list[tuple[int, int, Counter]] = []
+        if text is not None:
+            lines = text.split("\n")
+            for start, end in chunk_lines(text, self.language_for_path(path)):
+                counts = term_counts("\n".join(lines[start : end + 1]))
+                counts.update(tokenize(Path(path).stem))
+                entries.append((start, end, counts))
+
+        with self._lock:
+            for chunk_id in self._file_chunks.pop(path, ()):
+                chunk = self._chunks.pop(chunk_id)
+                self._total_length -= chunk.length
+                for term in chunk.terms:
+                    postings = self._postings[term]
+                    del postings[chunk_id]
+                    if not postings:
+                        del self._postings[term]
+            if text is None:
+                return
+            ids = []
+            for start, end, counts in entries:
+                chunk_id = self._next_id
+                self._next_id += 1
+                length = sum(counts.values())
+                self._chunks[chunk_id] = _Chunk(path, start, end, length, tuple(counts))
+                self._total_length += length
+                for term, count in counts.items():
+                    self._postings.setdefault(term, {})[chunk_id] = count
+                ids.append(chunk_id)
+            self._file_chunks[path] = ids
+
+    def search(self, query: str, k: int = 5, exclude: str | None = None) -> list[Snippet]:
+        """The `k` best chunks for `query`, leaving out chunks of `exclude`."""
+        terms = set(tokenize(query))
+        with self._lock:
+            total = len(self._chunks)
+            if not terms or not total:
+                return []
+            average = self._total_length / total or 1.0
+            scores: dict[int, float] = {}
+            weighted = []
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings and len(postings) <= max(MAX_TERM_SHARE * total, CANDIDATE_POSTINGS):
+                    weighted.append((len(postings), postings))
+            # Rarest terms first. Once they have found enough candidates,
+            # common terms only re-rank those candidates instead of adding
+            # every chunk they occur in.
+            weighted.sort(key=lambda item: item[0])
+            chunks = self._chunks
+            for frequency, postings in weighted:
+                idf = math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+                if frequency > CANDIDATE_POSTINGS and len(scores) >= k:
+                    matches = [
+                        (chunk_id, postings[chunk_id]) for chunk_id in scores if chunk_id in postings
+                    ]
+                else:
+                    matches = postings.items()
+                for chunk_id, count in matches:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * chunks[chunk_id].length / average)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * count * (BM25_K1 + 1) / (
+                        count + norm
+                    )
+            wanted = k + len(self._file_chunks.get(exclude, ()))
+            ranked = heapq.nlargest(wanted, scores.items(), key=lambda item: item[1])
+            results = []
+            for chunk_id, score in ranked:
+                chunk = self._chunks[chunk_id]
+                if chunk.path == exclude:
+                    continue
+                results.append(Snippet(chunk.path, chunk.start, chunk.end, score))
+                if len(results) == k:
+                    break
+            return results
+
+    @staticmethod
+    def _read(path: str) -> str | None:
+        try:
+            if os.path.getsize(path) > MAX_FILE_BYTES:
+                return None
+            with open(path, "rb") as file:
+                data = file.read()
+            check_text_head(data[:SNIFF_BYTES])
+            return data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+        except (OSError, UnsupportedFileError, UnicodeDecodeError):
+            return None
+
+
+def pack_snippets(
+    snippets: list[Snippet], read_lines: Callable[[str], list[str] | None], root: str, budget: int
+) -> str:
+    """Render snippets as `--- path:first-last` blocks until `budget` tokens are used.
+
+    The snippet that crosses the budget is cut short and the rest are dropped.
+    """
+    blocks: list[str] = []
+    used = 0
+    for snippet in snippets:
+        lines = read_lines(snippet.path)
+        if lines is None:
+            continue
+        header = f"--- {os.path.relpath(snippet.path, root)}:{snippet.start + 1}"
+        used += estimate_tokens(header) + 1
+        body: list[str] = []
+        for line in lines[snippet.start : snippet.end + 1]:
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                break
+            body.append(line)
+            used += cost
+        if not body:
+            break
+        blocks.append(f"{header}-{snippet.start + len(body)}\n" + "\n".join(body))
+        if len(body) <= snippet.end - snippet.start:
+            break
+    return "\n".join(blocks)
@@ -0,0 +1,144 @@
+"""Atomic, parallel writing of buffers to disk."""
+
+from __future__ import annotations
+
+import os
+import stat
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+SAVE_WORKERS = 8
+
+# Read once at import time: os.umask can only be queried by setting it,
+# which is not safe to do from the save threads.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+class SaveResult(NamedTuple):
+    path: str
+    status: str
+    """One of "saved", "unchanged" or "failed"."""
+    error: str | None = None
+
+
+class _PendingWrite(NamedTuple):
+    path: str
+    target: str
+    """`path` with symlinks resolved: the file the temp file replaces."""
+    temp_path: str
+    fd: int
+
+
+def _prepare(path: str, data: bytes) -> SaveResult | _PendingWrite:
+    """Write `data` next to `path` in a temp file, unless the file already holds it.
+
+    A symlink is followed, so the file it points to is replaced rather than the link.
+    """
+    target = Path(os.path.realpath(path))
+    try:
+        current = target.stat()
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    else:
+        if current.st_size == len(data) and target.read_bytes() == data:
+            return SaveResult(path, "unchanged")
+        mode = stat.S_IMODE(current.st_mode)
+
+    fd, temp_path = tempfile.mkstemp(prefix=f".{target.name}.", suffix=".tmp", dir=target.parent)
+    try:
+        os.fchmod(fd, mode)
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+    except BaseException:
+        os.close(fd)
+        os.unlink(temp_path)
+        raise
+    return _PendingWrite(path, str(target), temp_path, fd)
+
+
+def _sync_and_close(pending: _PendingWrite) -> None:
+    try:
+        os.fsync(pending.fd)
+    finally:
+        os.close(pending.fd)
+
+
+def _sync_directory(directory: str) -> None:
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _describe(error: BaseException) -> str:
+    return str(error).strip() or type(error).__name__
+
+
+def save_texts(jobs: list[tuple[str, str]], max_workers: int = SAVE_WORKERS) -> list[SaveResult]:
+    """Save `(path, text)` pairs, returning one result per job in order.
+
+    Each file is written to a temp file in its own directory, all temp
+    files are fsynced as one parallel batch, then each is renamed over its
+    target and every touched directory is fsynced once. A crash therefore
+    leaves either the old or the new content, never a truncated file.
+    Files whose bytes already match the text are left untouched.
+    """
+    results: dict[str, SaveResult] = {}
+    pending: list[_PendingWrite] = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as pool:
+        prepared = pool.map(
+            lambda job: _attempt(job[0], _prepare, job[0], job[1].encode("utf-8")), jobs
+        )
+        for path, outcome in zip((path for path, _ in jobs), prepared):
+            if isinstance(outcome, _PendingWrite):
+                pending.append(outcome)
+            else:
+                results[path] = outcome
+
+        synced = list(pool.map(lambda item: _attempt(item.path, _sync_and_close, item), pending))
+
+    directories: set[str] = set()
+    for item, outcome in zip(pending, synced):
+        if isinstance(outcome, SaveResult):
+            _discard(item.temp_path)
+            results[item.path] = outcome
+            continue
+        try:
+            os.replace(item.temp_path, item.target)
+        except OSError as error:
+            _discard(item.temp_path)
+            results[item.path] = SaveResult(item.path, "failed", _describe(error))
+        else:
+            directories.add(os.path.dirname(item.target))
+            results[item.path] = SaveResult(item.path, "saved")
+
+    for directory in directories:
+        _sync_directory(directory)
+    return [results[path] for path, _ in jobs]
+
+
+def _attempt(path: str, func, *args):
+    """Run one pipeline step, turning an exception into a failed result."""
+    try:
+        result = func(*args)
+    except Exception as error:
+        return SaveResult(path, "failed", _describe(error))
+    return True if result is None else result
+
+
+def _discard(temp_path: str) -> None:
+    try:
+        os.unlink(temp_path)
+    except OSError:
+        pass
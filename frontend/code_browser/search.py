@@ -0,0 +1,451 @@
+"""Project-wide text search over a persistent trigram index."""
+
+from __future__ import annotations
+
+import os
+import pickle
+import re
+import tempfile
+import threading
+from array import array
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import NamedTuple
+
+from .parallel import batched, run_batches
+
+try:
+    from re import _parser as _regex_parser
+except ImportError:  # Python < 3.11
+    import sre_parse as _regex_parser
+
+_INDEX_VERSION = 2
+# Files above this size are not indexed but still scanned; files above
+# MAX_SCAN_BYTES are skipped entirely.
+MAX_INDEXED_BYTES = 4 * 1024 * 1024
+MAX_SCAN_BYTES = 64 * 1024 * 1024
+MAX_HITS_PER_FILE = 100
+# A query's rarest trigrams narrow the candidates down; intersecting the
+# posting lists of common ones costs more than scanning the few extra files.
+QUERY_TRIGRAMS = 6
+# Fewer candidate files than this are scanned on the calling thread, since
+# handing them to the process pool would take longer than reading them.
+INLINE_SCAN_FILES = 48
+SCAN_BATCH_FILES = 64
+INDEX_BATCH_FILES = 256
+# Dead entries are dropped from the posting lists once they outnumber the live ones.
+_COMPACT_RATIO = 1.0
+
+_THREE_BYTES = re.compile(rb"...", re.S)
+
+
+class SearchHit(NamedTuple):
+    path: str
+    """Relative to the search root."""
+    row: int
+    column: int
+    length: int
+    line: str
+
+
+class SearchQuery(NamedTuple):
+    pattern: re.Pattern
+    trigrams: tuple[bytes, ...]
+    """Lower-cased trigrams every matching file must contain."""
+    needle: bytes | None = None
+    """Bytes every matching file contains, lower-cased if the pattern ignores case."""
+
+
+def parse_query(text: str) -> SearchQuery:
+    """Compile a search box entry. Raises `re.error` for an invalid regex.
+
+    Text is matched literally unless it is wrapped in slashes (`/regex/`).
+    Matching ignores case unless the query contains an upper-case letter.
+    """
+    if len(text) > 2 and text.startswith("/") and text.endswith("/"):
+        source = text[1:-1]
+    else:
+        source = re.escape(text)
+    flags = re.MULTILINE
+    if not any(char.isupper() for char in text):
+        flags |= re.IGNORECASE
+    pattern = re.compile(source, flags)
+    ignore_case = bool(pattern.flags & re.IGNORECASE)
+    trigrams: set[bytes] = set()
+    needle = None
+    for run in _literal_runs(source, flags):
+        data = run.encode("utf-8")
+        # Bytes are lower-cased for ASCII only, so a case-insensitive
+        # match can differ from the query in its other bytes.
+        if ignore_case and not data.isascii():
+            continue
+        if needle is None or len(data) > len(needle):
+            needle = data.lower() if ignore_case else data
+        data = data.lower()
+        for start in range(len(data) - 2):
+            trigrams.add(data[start : start + 3])
+    return SearchQuery(pattern, tuple(sorted(trigrams)), needle)
+
+
+def _literal_runs(source: str, flags: int) -> list[str]:
+    """Literal strings every match of `source` contains, from its top-level sequence."""
+    try:
+        parsed = _regex_parser.parse(source, flags)
+    except Exception:
+        return []
+    runs: list[str] = []
+    current: list[str] = []
+    for op, value in parsed.data:
+        if op is _regex_parser.LITERAL:
+            current.append(chr(value))
+            continue
+        if current:
+            runs.append("".join(current))
+            current = []
+    if current:
+        runs.append("".join(current))
+    return runs
+
+
+def read_source(root: str, relative: str, limit: int) -> bytes | None:
+    """A file's bytes, or None if it is unreadable, larger than `limit` or binary."""
+    try:
+        with open(os.path.join(root, relative), "rb") as file:
+            data = file.read(limit + 1)
+    except OSError:
+        return None
+    if len(data) > limit or b"\0" in data[:8192]:
+        return None
+    return data
+
+
+def scan_text(relative: str, text: str, pattern: re.Pattern) -> list[SearchHit]:
+    """Hits for `pattern` in `text`, at most MAX_HITS_PER_FILE of them."""
+    hits: list[SearchHit] = []
+    row, line_start = 0, 0
+    for match in pattern.finditer(text):
+        start = match.start()
+        row += text.count("\n", line_start, start)
+        line_start = text.rfind("\n", 0, start) + 1
+        line_end = text.find("\n", start)
+        if line_end == -1:
+            line_end = len(text)
+        line = text[line_start:line_end].rstrip("\r")
+        hits.append(SearchHit(relative, row, start - line_start, match.end() - start, line))
+        if len(hits) == MAX_HITS_PER_FILE:
+            break
+    return hits
+
+
+def scan_files(
+    root: str, source: str, flags: int, needle: bytes | None, relatives: list[str]
+) -> tuple[list[SearchHit], int]:
+    """Hits in the files `relatives` under `root`, and how many files were read.
+
+    Runs in the process pool, so it takes the pattern's source rather than
+    the compiled pattern. Files without `needle` are skipped before decoding.
+    """
+    pattern = re.compile(source, flags)
+    ignore_case = bool(flags & re.IGNORECASE)
+    hits: list[SearchHit] = []
+    read = 0
+    for relative in relatives:
+        data = read_source(root, relative, MAX_SCAN_BYTES)
+        if data is None:
+            continue
+        read += 1
+        if needle is not None and needle not in (data.lower() if ignore_case else data):
+            continue
+        text = data.decode("utf-8", errors="replace")
+        if pattern.search(text) is not None:
+            hits.extend(scan_text(relative, text, pattern))
+    return hits, read
+
+
+def file_trigrams(data: bytes) -> bytes:
+    """The distinct lower-cased trigrams of `data`, joined into one bytes object."""
+    data = data.lower()
+    trigrams: set[bytes] = set()
+    for offset in range(3):
+        trigrams.update(_THREE_BYTES.findall(data, offset))
+    return b"".join(trigrams)
+
+
+def index_files(
+    root: str, relatives: list[str]
+) -> list[tuple[str, int, int, bytes | None]]:
+    """`(relative, mtime_ns, size, trigrams)` per file.
+
+    Trigrams are None for files too large to index, and empty for binary or
+    unreadable files, which searches then skip. Runs in the process pool.
+    """
+    entries = []
+    for relative in relatives:
+        try:
+            stat = os.stat(os.path.join(root, relative))
+        except OSError:
+            continue
+        trigrams = None
+        if stat.st_size <= MAX_INDEXED_BYTES:
+            data = read_source(root, relative, MAX_INDEXED_BYTES)
+            trigrams = file_trigrams(data) if data is not None else b""
+        entries.append((relative, stat.st_mtime_ns, stat.st_size, trigrams))
+    return entries
+
+
+class SearchIndex:
+    """Which files under `root` contain which trigrams, kept on disk between runs.
+
+    Each file gets an id, and every lower-cased trigram maps to an array of
+    the ids of the files containing it. A file that changes is given a new
+    id and its old one is marked dead rather than removed from every
+    posting list; the lists are compacted once dead ids outnumber live ones.
+    Files that are new to the index, were saved by the app since, or are too
+    large to index are scanned directly.
+
+    The index only knows about edits made outside the app once `refresh`
+    has compared every file's mtime and size, which takes a stat per file.
+    `expect_refresh` marks it out of date until the next refresh finishes,
+    and searches first wait for that with `wait_fresh`.
+    """
+
+    def __init__(self, root: str, cache_path: Path | None = None) -> None:
+        self.root = os.path.abspath(root)
+        self.cache_path = cache_path
+        self._files: list[tuple[str, int, int] | None] = []
+        self._ids: dict[str, int] = {}
+        self._unindexed: set[str] = set()
+        self._postings: dict[bytes, array] = {}
+        self._dead = 0
+        self._lock = threading.Lock()
+        self._fresh = threading.Event()
+
+    @property
+    def file_count(self) -> int:
+        return len(self._ids)
+
+    def load(self) -> bool:
+        """Read the index saved by an earlier run."""
+        if self.cache_path is None:
+            return False
+        try:
+            with open(self.cache_path, "rb") as file:
+                data = pickle.load(file)
+            if data.get("version") != _INDEX_VERSION or data.get("root") != self.root:
+                return False
+            files = data["files"]
+            postings = {}
+            for trigram, ids in data["postings"].items():
+                postings[trigram] = array("I")
+                postings[trigram].frombytes(ids)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, KeyError, TypeError):
+            return False
+        with self._lock:
+            self._files = files
+            self._ids = {entry[0]: file_id for file_id, entry in enumerate(files) if entry}
+            self._unindexed = set(data.get("unindexed", ()))
+            self._postings = postings
+            self._dead = files.count(None)
+        return True
+
+    def save(self) -> None:
+        if self.cache_path is None:
+            return
+        with self._lock:
+            if self._dead > _COMPACT_RATIO * max(1, len(self._ids)):
+                self._compact()
+            data = {
+                "version": _INDEX_VERSION,
+                "root": self.root,
+                "files": list(self._files),
+                "unindexed": sorted(self._unindexed),
+                "postings": {trigram: ids.tobytes() for trigram, ids in self._postings.items()},
+            }
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(
+                prefix=f".{self.cache_path.name}.", dir=self.cache_path.parent
+            )
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            return
+
+    def _compact(self) -> None:
+        """Renumber the live files and drop dead ids from every posting list."""
+        mapping: dict[int, int] = {}
+        files: list[tuple[str, int, int] | None] = []
+        for file_id, entry in enumerate(self._files):
+            if entry is not None:
+                mapping[file_id] = len(files)
+                files.append(entry)
+        postings = {}
+        for trigram, ids in self._postings.items():
+            live = array("I", [mapping[i] for i in ids if i in mapping])
+            if live:
+                postings[trigram] = live
+        self._files = files
+        self._ids = {entry[0]: file_id for file_id, entry in enumerate(files)}
+        self._postings = postings
+        self._dead = 0
+
+    def expect_refresh(self) -> None:
+        """Mark the index out of date until the next `refresh` finishes."""
+        self._fresh.clear()
+
+    def wait_fresh(self, is_cancelled: Callable[[], bool] = lambda: False) -> bool:
+        """Wait until a refresh has finished since the last `expect_refresh`.
+
+        Returns False if cancelled first.
+        """
+        while not self._fresh.wait(0.05):
+            if is_cancelled():
+                return False
+        return True
+
+    def invalidate(self, relatives: Iterable[str]) -> None:
+        """Forget the entries of files known to have changed, e.g. just saved."""
+        with self._lock:
+            for relative in relatives:
+                self._forget(relative)
+
+    def _forget(self, relative: str) -> None:
+        file_id = self._ids.pop(relative, None)
+        if file_id is not None:
+            self._files[file_id] = None
+            self._dead += 1
+        self._unindexed.discard(relative)
+
+    def refresh(
+        self, relatives: list[str], is_cancelled: Callable[[], bool] = lambda: False
+    ) -> int | None:
+        """Index every file in `relatives` that is new or changed, and forget the rest.
+
+        Returns how many files were indexed, or None if cancelled. Progress
+        made before a cancel is kept.
+        """
+        wanted = set(relatives)
+        changed = []
+        with self._lock:
+            files, ids = list(self._files), dict(self._ids)
+        for relative in relatives:
+            if is_cancelled():
+                return None
+            file_id = ids.get(relative)
+            if file_id is None:
+                changed.append(relative)
+                continue
+            try:
+                stat = os.stat(os.path.join(self.root, relative))
+            except OSError:
+                changed.append(relative)
+                continue
+            _, mtime_ns, size = files[file_id]
+            if stat.st_mtime_ns != mtime_ns or stat.st_size != size:
+                changed.append(relative)
+        with self._lock:
+            for relative in [relative for relative in self._ids if relative not in wanted]:
+                self._forget(relative)
+
+        def apply(entries: list[tuple[str, int, int, bytes | None]]) -> None:
+            with self._lock:
+                for relative, mtime_ns, size, trigrams in entries:
+                    self._forget(relative)
+                    file_id = len(self._files)
+                    self._files.append((relative, mtime_ns, size))
+                    self._ids[relative] = file_id
+                    if trigrams is None:
+                        self._unindexed.add(relative)
+                        continue
+                    postings = self._postings
+                    for start in range(0, len(trigrams), 3):
+                        trigram = trigrams[start : start + 3]
+                        ids = postings.get(trigram)
+                        if ids is None:
+                            ids = postings[trigram] = array("I")
+                        ids.append(file_id)
+
+        finished = run_batches(
+            index_files,
+            list(batched(changed, INDEX_BATCH_FILES)),
+            (self.root,),
+            apply,
+            is_cancelled,
+        )
+        if changed:
+            self.save()
+        if not finished:
+            return None
+        self._fresh.set()
+        return len(changed)
+
+    def candidates(self, query: SearchQuery, relatives: list[str]) -> list[str]:
+        """The files in `relatives` that may hold a match for `query`."""
+        if not query.trigrams:
+            return list(relatives)
+        with self._lock:
+            lists = [self._postings.get(trigram) for trigram in query.trigrams]
+            if any(posting is None for posting in lists):
+                matched: set[int] = set()
+            else:
+                lists.sort(key=len)
+                matched = set(lists[0])
+                for posting in lists[1:QUERY_TRIGRAMS]:
+                    matched.intersection_update(posting)
+                    if not matched:
+                        break
+            ids, files, unindexed = self._ids, self._files, self._unindexed
+            found = {files[file_id][0] for file_id in matched if files[file_id] is not None}
+            return [
+                relative
+                for relative in relatives
+                if relative in found or relative in unindexed or relative not in ids
+            ]
+
+
+def search(
+    root: str,
+    relatives: list[str],
+    query: SearchQuery,
+    on_hits: Callable[[list[SearchHit]], None],
+    is_cancelled: Callable[[], bool] = lambda: False,
+    index: SearchIndex | None = None,
+    overrides: dict[str, str] | None = None,
+) -> int | None:
+    """Search the files `relatives` under `root`, passing hits to `on_hits` as found.
+
+    `overrides` maps relative paths to text searched instead of the file on
+    disk, e.g. for unsaved buffers. With an `index`, the search waits for
+    it to be refreshed first. Returns how many files were read, or None if
+    cancelled.
+    """
+    overrides = overrides or {}
+    read = 0
+    for relative, text in overrides.items():
+        hits = scan_text(relative, text, query.pattern)
+        read += 1
+        if hits:
+            on_hits(hits)
+    if index is not None and not index.wait_fresh(is_cancelled):
+        return None
+    files = index.candidates(query, relatives) if index is not None else list(relatives)
+    files = [relative for relative in files if relative not in overrides]
+    args = (root, query.pattern.pattern, query.pattern.flags, query.needle)
+
+    def collect(result: tuple[list[SearchHit], int]) -> None:
+        nonlocal read
+        hits, count = result
+        read += count
+        if hits and not is_cancelled():
+            on_hits(hits)
+
+    if len(files) < INLINE_SCAN_FILES:
+        if is_cancelled():
+            return None
+        collect(scan_files(*args, files))
+        return read
+    batches = list(batched(files, SCAN_BATCH_FILES))
+    if not run_batches(scan_files, batches, args, collect, is_cancelled):
+        return None
+    return read
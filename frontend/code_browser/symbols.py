@@ -0,0 +1,364 @@
+"""A project-wide index of definitions, for go-to-definition and symbol search."""
+
+from __future__ import annotations
+
+import os
+import re
+import sqlite3
+import threading
+from collections.abc import Callable, Iterable
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple
+
+from .context import tree_sitter_language
+from .parallel import batched, run_batches
+
+_SCHEMA_VERSION = 1
+INDEX_BATCH_FILES = 64
+MAX_SYMBOL_FILE_BYTES = 1024 * 1024
+
+_KIND = re.compile(
+    r"^(function|method|class|struct|impl|interface|enum|trait|module|namespace|type)"
+    r"_(definition|declaration|item|specifier)$"
+)
+_NAME_TYPE = re.compile(r"(^|_)identifier$|^name$|^constant$")
+
+
+class Symbol(NamedTuple):
+    name: str
+    kind: str
+    path: str
+    """Relative to the index root."""
+    row: int
+    column: int
+    """Position of the symbol's name, in characters."""
+    end_row: int
+    """Last row of the whole definition."""
+    container: str
+    """Name of the enclosing definition, or an empty string."""
+
+
+def _definition_name(node):
+    """The node naming a definition: its name field, or for C-like languages its declarator."""
+    name = node.child_by_field_name("name")
+    if name is not None:
+        return name
+    current = node.child_by_field_name("declarator")
+    while current is not None:
+        if _NAME_TYPE.search(current.type):
+            return current
+        current = current.child_by_field_name("declarator") or current.child_by_field_name(
+            "name"
+        )
+    for child in node.named_children:
+        # Go wraps each name of a type declaration in a type_spec.
+        if child.type.endswith("_spec"):
+            return _definition_name(child)
+    return None
+
+
+def extract_symbols(text: str, language: str | None) -> list[tuple]:
+    """Definitions in `text` as `(name, kind, row, column, end_row, container)` tuples."""
+    ts_language = tree_sitter_language(language)
+    if ts_language is None:
+        return []
+    from tree_sitter import Parser
+
+    data = text.encode("utf-8")
+    tree = Parser(ts_language).parse(data)
+    lines = data.split(b"\n")
+    symbols = []
+    stack = [(tree.root_node, "", "")]
+    while stack:
+        node, container, container_kind = stack.pop()
+        for child in reversed(node.named_children):
+            match = _KIND.match(child.type)
+            name_node = _definition_name(child) if match else None
+            if child.type == "impl_item" and child.child_by_field_name("type") is not None:
+                # A Rust impl block defines nothing itself but contains methods.
+                implemented = child.child_by_field_name("type").text.decode("utf-8", "replace")
+                stack.append((child, implemented, "impl"))
+                continue
+            if name_node is None:
+                if child.named_child_count:
+                    stack.append((child, container, container_kind))
+                continue
+            kind = match.group(1)
+            if kind == "function" and container_kind in {"class", "struct", "impl", "trait"}:
+                kind = "method"
+            name = name_node.text.decode("utf-8", errors="replace")
+            row, byte_column = name_node.start_point
+            column = len(lines[row][:byte_column].decode("utf-8", errors="replace"))
+            symbols.append((name, kind, row, column, child.end_point[0], container))
+            stack.append((child, name, kind))
+    symbols.sort(key=lambda symbol: (symbol[2], symbol[3]))
+    return symbols
+
+
+def parse_files(root: str, files: list[tuple[str, str]]) -> list[tuple]:
+    """`(relative, mtime_ns, size, symbols)` for each `(relative, language)` pair.
+
+    Runs in the process pool.
+    """
+    results = []
+    for relative, language in files:
+        path = os.path.join(root, relative)
+        try:
+            stat = os.stat(path)
+            symbols = []
+            if stat.st_size <= MAX_SYMBOL_FILE_BYTES:
+                with open(path, "rb") as file:
+                    text = file.read().decode("utf-8", errors="replace")
+                symbols = extract_symbols(text, language)
+        except OSError:
+            continue
+        results.append((relative, stat.st_mtime_ns, stat.st_size, symbols))
+    return results
+
+
+@lru_cache(maxsize=None)
+def _has_parser(language: str | None) -> bool:
+    return tree_sitter_language(language) is not None
+
+
+class SymbolIndex:
+    """Definitions found with tree-sitter in every project file, kept in sqlite.
+
+    Files are parsed in the shared process pool and re-parsed when their
+    mtime or size changes, or straight away when the app saves them.
+    Lookups run on the UI thread: exact names and prefixes use an index on
+    the names, and longer queries also match inside names through an FTS5
+    trigram table, so each stays within a few milliseconds.
+
+    The database is opened by `open`, off the UI thread. Until it is open,
+    and for good if opening fails, lookups find nothing and updates are
+    dropped; `error` then says why.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        path: str | Path,
+        language_for_path: Callable[[str], str | None],
+    ) -> None:
+        self.root = os.path.abspath(root)
+        self.path = path
+        self.language_for_path = language_for_path
+        self.error: str | None = None
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+
+    def open(self) -> bool:
+        """Open the database, creating it if needed. Returns whether it is usable."""
+        with self._lock:
+            if self._db is not None or self.error is not None:
+                return self._db is not None
+            try:
+                self._db = self._connect()
+            except (sqlite3.Error, OSError) as error:
+                self.error = str(error).strip() or type(error).__name__
+            return self._db is not None
+
+    def _connect(self) -> sqlite3.Connection:
+        if str(self.path) != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            (version,) = db.execute("PRAGMA user_version").fetchone()
+            if version != _SCHEMA_VERSION:
+                db.executescript(
+                    "DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS symbols;"
+                    " DROP TABLE IF EXISTS symbol_names;"
+                )
+            db.executescript(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL,"
+                " mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS symbols ("
+                " id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL, name TEXT NOT NULL,"
+                " folded TEXT NOT NULL, kind TEXT NOT NULL, row INTEGER NOT NULL,"
+                " column INTEGER NOT NULL, end_row INTEGER NOT NULL, container TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name);"
+                "CREATE INDEX IF NOT EXISTS symbols_folded ON symbols (folded);"
+                "CREATE INDEX IF NOT EXISTS symbols_file ON symbols (file_id);"
+                "CREATE VIRTUAL TABLE IF NOT EXISTS symbol_names"
+                " USING fts5(folded, content='', tokenize='trigram');"
+                f"PRAGMA user_version = {_SCHEMA_VERSION};"
+            )
+        except BaseException:
+            db.close()
+            raise
+        return db
+
+    @property
+    def symbol_count(self) -> int:
+        with self._lock:
+            if self._db is None:
+                return 0
+            return self._db.execute("SELECT COUNT(*) FROM symbols").fetchone()[0]
+
+    def refresh(
+        self, relatives: list[str], is_cancelled: Callable[[], bool] = lambda: False
+    ) -> int | None:
+        """Parse every file in `relatives` that is new or changed, and drop the rest.
+
+        Returns how many files were parsed, or None if cancelled or the
+        database cannot be opened. Progress made before a cancel is kept.
+        """
+        if not self.open():
+            return None
+        try:
+            return self._refresh(relatives, is_cancelled)
+        except sqlite3.Error as error:
+            self.error = str(error).strip() or type(error).__name__
+            self.close()
+            return None
+
+    def _refresh(self, relatives: list[str], is_cancelled: Callable[[], bool]) -> int | None:
+        with self._lock:
+            known = {
+                path: (mtime_ns, size)
+                for path, mtime_ns, size in self._db.execute(
+                    "SELECT path, mtime_ns, size FROM files"
+                )
+            }
+        changed = []
+        wanted = set()
+        for relative in relatives:
+            language = self.language_for_path(relative)
+            if not _has_parser(language):
+                continue
+            if is_cancelled():
+                return None
+            wanted.add(relative)
+            stamp = known.get(relative)
+            if stamp is not None:
+                try:
+                    stat = os.stat(os.path.join(self.root, relative))
+                except OSError:
+                    continue
+                if (stat.st_mtime_ns, stat.st_size) == stamp:
+                    continue
+            changed.append((relative, language))
+        gone = [path for path in known if path not in wanted]
+        if gone:
+            with self._lock, self._db:
+                self._db.execute("BEGIN")
+                for path in gone:
+                    self._forget(path)
+        finished = run_batches(
+            parse_files,
+            list(batched(changed, INDEX_BATCH_FILES)),
+            (self.root,),
+            self._store,
+            is_cancelled,
+        )
+        return len(changed) if finished else None
+
+    def update_file(self, relative: str, text: str) -> None:
+        """Re-parse a file from text just written to it."""
+        if self._db is None:
+            return
+        language = self.language_for_path(relative)
+        if not _has_parser(language):
+            return
+        try:
+            stat = os.stat(os.path.join(self.root, relative))
+        except OSError:
+            return
+        symbols = extract_symbols(text, language)
+        try:
+            self._store([(relative, stat.st_mtime_ns, stat.st_size, symbols)])
+        except sqlite3.Error:
+            # The next refresh sees the new mtime and parses the file again.
+            pass
+
+    def _forget(self, relative: str) -> None:
+        row = self._db.execute("SELECT id FROM files WHERE path = ?", (relative,)).fetchone()
+        if row is None:
+            return
+        # A contentless FTS table needs each deleted row's values back.
+        self._db.execute(
+            "INSERT INTO symbol_names (symbol_names, rowid, folded)"
+            " SELECT 'delete', id, folded FROM symbols WHERE file_id = ?",
+            row,
+        )
+        self._db.execute("DELETE FROM symbols WHERE file_id = ?", row)
+        self._db.execute("DELETE FROM files WHERE id = ?", row)
+
+    def _store(self, results: Iterable[tuple]) -> None:
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            for relative, mtime_ns, size, symbols in results:
+                self._forget(relative)
+                file_id = self._db.execute(
+                    "INSERT INTO files (path, mtime_ns, size) VALUES (?, ?, ?)",
+                    (relative, mtime_ns, size),
+                ).lastrowid
+                for name, kind, row, column, end_row, container in symbols:
+                    symbol_id = self._db.execute(
+                        "INSERT INTO symbols (file_id, name, folded, kind, row, column,"
+                        " end_row, container) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (file_id, name, name.lower(), kind, row, column, end_row, container),
+                    ).lastrowid
+                    self._db.execute(
+                        "INSERT INTO symbol_names (rowid, folded) VALUES (?, ?)",
+                        (symbol_id, name.lower()),
+                    )
+
+    def _select(self, where: str, parameters: tuple, limit: int) -> list[Symbol]:
+        if self._db is None:
+            return []
+        rows = self._db.execute(
+            "SELECT s.name, s.kind, f.path, s.row, s.column, s.end_row, s.container"
+            f" FROM symbols s JOIN files f ON f.id = s.file_id WHERE {where} LIMIT ?",
+            (*parameters, limit),
+        )
+        return [Symbol(*row) for row in rows]
+
+    def definitions(self, name: str, limit: int = 50) -> list[Symbol]:
+        """Symbols named exactly `name`."""
+        with self._lock:
+            return self._select("s.name = ?", (name,), limit)
+
+    def lookup(self, query: str, limit: int = 50) -> list[Symbol]:
+        """Symbols matching `query`, ignoring case: exact names, then prefixes, then substrings."""
+        folded = query.strip().lower()
+        if not folded or self._db is None:
+            return []
+        results: list[Symbol] = []
+        seen: set[tuple] = set()
+
+        def add(symbols: list[Symbol]) -> None:
+            for symbol in symbols:
+                key = (symbol.path, symbol.row, symbol.column)
+                if key not in seen and len(results) < limit:
+                    seen.add(key)
+                    results.append(symbol)
+
+        with self._lock:
+            add(self._select("s.folded = ?", (folded,), limit))
+            if len(results) < limit:
+                add(
+                    self._select(
+                        "s.folded > ? AND s.folded < ?", (folded, folded + "\U0010ffff"), limit
+                    )
+                )
+            if len(results) < limit and len(folded) >= 3:
+                phrase = '"' + folded.replace('"', '""') + '"'
+                add(
+                    self._select(
+                        "s.id IN (SELECT rowid FROM symbol_names WHERE symbol_names MATCH ?)",
+                        (phrase,),
+                        limit + len(results),
+                    )
+                )
+        return results
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -1,13 +1,82 @@
 from __future__ import annotations
 
+import os
+import re
+import time
 from pathlib import Path
 
+from rich.text import Text
 from rich.traceback import Traceback
-from textual.highlight import highlight
-from textual.widgets import Input, Static, Tabs, TextArea
-from textual.widgets.text_area import Selection
+from textual import work
+from textual.widgets import DirectoryTree, Input, OptionList, Static, Tabs, TextArea
+from textual.widgets.option_list import Option
+from textual.widgets.text_area import LanguageDoesNotExist, Selection
+from textual.worker import get_current_worker
 
-from .widgets import path_to_tab_id
+from .document import PieceTable
+from .files import UnsupportedFileError, read_text_file, sniff_text_file
+from .fuzzy import FuzzyMatcher
+from .highlighting import VIEWPORT_MARGIN
+from .large_file import MappedFile
+from .replace import FileReplacement, Hunk, find_replacements, replacement_template
+from .search import SearchHit, SearchQuery, parse_query, search
+from .symbols import Symbol
+from .widgets import CodeEditor, LargeFileView, path_to_tab_id
+
+# Paths listed by the file finder for a query.
+FINDER_RESULTS = 50
+# Project search starts once the query is this long and typing pauses this
+# many seconds, and lists at most MAX_SEARCH_HITS hits.
+MIN_SEARCH_CHARS = 2
+SEARCH_DELAY = 0.15
+MAX_SEARCH_HITS = 2000
+# Symbols listed by the symbol panel for a query.
+SYMBOL_RESULTS = 50
+# Changed lines shown in the replace preview. Further files get a header only.
+MAX_PREVIEW_LINES = 2000
+# Lines of a hunk spanning several lines that are shown before it is cut off.
+HUNK_PREVIEW_LINES = 4
+
+
+def _hit_option(hit: SearchHit, option_id: str) -> Option:
+    line = hit.line.expandtabs(4)
+    indent = len(line) - len(line.lstrip())
+    start = len(hit.line[: hit.column].expandtabs(4)) - indent
+    text = Text(f"{hit.path}:{hit.row + 1}: ", style="dim")
+    body = Text(line.strip()[:200])
+    body.stylize("bold reverse", start, start + hit.length)
+    text.append_text(body)
+    return Option(text, id=option_id)
+
+
+def _replacement_header(replacement: FileReplacement, accepted: bool) -> Text:
+    count = len(replacement.edits)
+    text = Text("[x] " if accepted else "[ ] ", style="bold")
+    text.append(replacement.path, style="bold" if accepted else "dim strike")
+    text.append(f"  {count} replacement{'s' if count != 1 else ''}", style="dim")
+    return text
+
+
+def _hunk_options(hunk: Hunk) -> list[Option]:
+    options = []
+    for sign, body, style in (("-", hunk.old, "red"), ("+", hunk.new, "green")):
+        lines = body.split("\n")
+        for offset, line in enumerate(lines[:HUNK_PREVIEW_LINES]):
+            text = Text(f"{hunk.row + offset + 1:>6} {sign} ", style="dim")
+            text.append(line.expandtabs(4)[:200], style=style)
+            options.append(Option(text, disabled=True))
+        if len(lines) > HUNK_PREVIEW_LINES:
+            options.append(Option(Text(f"       {sign} ...", style="dim"), disabled=True))
+    return options
+
+
+def _symbol_option(symbol: Symbol, option_id: str) -> Option:
+    text = Text(symbol.name, style="bold")
+    text.append(f"  {symbol.kind}", style="italic")
+    if symbol.container:
+        text.append(f" in {symbol.container}", style="italic")
+    text.append(f"  {symbol.path}:{symbol.row + 1}", style="dim")
+    return Option(text, id=option_id)
 
 
 class WatchersMixin:
@@ -23,12 +92,8 @@ class WatchersMixin:
         if insert_mode:
             code_view.focus()
         else:
-            if self.path is not None:
-                current_text = code_view.text
-                self.buffers[self.path] = current_text
-                self.query_one("#code-static", Static).update(
-                    highlight(current_text, path=self.path)
-                )
+            self._record_editor_edits()
+            self._render_code_static()
             code_view.focus()
 
     def watch_request_mode(self, request_mode: bool) -> None:
@@ -41,6 +106,397 @@ class WatchersMixin:
             request_input.value = ""
             self.query_one("#code-editor", TextArea).focus()
 
+    def watch_finder_mode(self, finder_mode: bool) -> None:
+        """Called when finder_mode is modified."""
+        self.set_class(finder_mode, "-finder-mode")
+        finder_input = self.query_one("#finder-input", Input)
+        if finder_mode:
+            self._show_finder_results(finder_input.value)
+            finder_input.focus()
+            self._scan_files()
+        else:
+            finder_input.value = ""
+            if self.path is not None:
+                self.query_one("#code-editor", TextArea).focus()
+            else:
+                self.query_one("#tree-view", DirectoryTree).focus()
+
+    @work(thread=True, exclusive=True, group="file-index")
+    def _scan_files(self) -> None:
+        """Bring the file index up to date and rebuild the finder's matcher.
+
+        The first run publishes the cached list before rescanning, so the
+        finder works straight away on a large tree.
+        """
+        worker = get_current_worker()
+        index = self._file_index
+        if not index.scanned and self._file_matcher is None and index.load():
+            matcher = FuzzyMatcher(index.paths)
+            if worker.is_cancelled:
+                return
+            self.call_from_thread(self._file_matcher_ready, matcher, index.generation)
+        generation = index.generation
+        stats = index.scan(lambda: worker.is_cancelled)
+        if stats is None:
+            return
+        self.log.debug(
+            f"file index: {stats.files} files in {stats.directories} directories,"
+            f" {stats.listed} listed, in {stats.seconds:.2f}s"
+        )
+        if index.generation != generation or self._file_matcher is None:
+            matcher = FuzzyMatcher(index.paths)
+            if worker.is_cancelled:
+                return
+            self.call_from_thread(self._file_matcher_ready, matcher, index.generation)
+        if not worker.is_cancelled:
+            self.call_from_thread(self._refresh_search_index)
+            self.call_from_thread(self._refresh_symbol_index)
+            self.call_from_thread(self._start_project_index)
+
+    def _file_matcher_ready(self, matcher: FuzzyMatcher, generation: int) -> None:
+        if generation < self._file_matcher_generation:
+            return
+        self._file_matcher = matcher
+        self._file_matcher_generation = generation
+        if self.finder_mode:
+            self._show_finder_results(self.query_one("#finder-input", Input).value)
+
+    def _show_finder_results(self, query: str) -> None:
+        results = self.query_one("#finder-results", OptionList)
+        results.clear_options()
+        if self._file_matcher is None:
+            self.sub_title = "INDEXING FILES..."
+            return
+        started = time.perf_counter()
+        paths = self._file_matcher.match(query, FINDER_RESULTS)
+        results.add_options([Option(path, id=path) for path in paths])
+        if paths:
+            results.highlighted = 0
+        self.sub_title = (
+            f"{len(paths)} OF {len(self._file_matcher)} FILES"
+            f" ({(time.perf_counter() - started) * 1000:.0f} ms)"
+        )
+
+    def watch_search_mode(self, search_mode: bool) -> None:
+        """Called when search_mode is modified."""
+        self.set_class(search_mode, "-search-mode")
+        search_input = self.query_one("#search-input", Input)
+        if search_mode:
+            search_input.focus()
+            # Searches wait for the refresh that follows the scan, so they
+            # see files edited outside the app.
+            self._search_index.expect_refresh()
+            self._scan_files()
+        else:
+            self._cancel_search()
+            search_input.value = ""
+            if self.path is not None:
+                self.query_one("#code-editor", TextArea).focus()
+            else:
+                self.query_one("#tree-view", DirectoryTree).focus()
+
+    @work(thread=True, exclusive=True, group="search-index")
+    def _refresh_search_index(self) -> None:
+        """Bring the trigram index in line with the file index, reading changed files."""
+        worker = get_current_worker()
+        index = self._search_index
+        started = time.perf_counter()
+        if not index.file_count:
+            index.load()
+        indexed = index.refresh(self._file_index.paths, lambda: worker.is_cancelled)
+        if indexed is not None:
+            self.log.debug(
+                f"search index: {indexed} files indexed, {index.file_count} in total,"
+                f" in {time.perf_counter() - started:.2f}s"
+            )
+
+    def _schedule_search(self, query: str) -> None:
+        """Search for `query` once typing pauses, cancelling any running search."""
+        self._cancel_search()
+        results = self.query_one("#search-results", OptionList)
+        results.clear_options()
+        self._search_hits = []
+        if len(query) < MIN_SEARCH_CHARS:
+            self.sub_title = "SEARCH"
+            return
+        self._search_timer = self.set_timer(SEARCH_DELAY, lambda: self._start_search(query))
+
+    def _cancel_search(self) -> None:
+        if self._search_timer is not None:
+            self._search_timer.stop()
+            self._search_timer = None
+        self.workers.cancel_group(self, "search")
+
+    def _start_search(self, query: str) -> None:
+        self._search_timer = None
+        try:
+            parsed = parse_query(query)
+        except re.error as error:
+            self.sub_title = f"BAD PATTERN: {str(error)[:40]}"
+            return
+        self._record_editor_edits()
+        root = os.path.abspath(self.root_path)
+        unsaved = {
+            os.path.relpath(path, root): self.buffers[path].snapshot()
+            for path in self.dirty_buffers
+            if path in self.buffers and os.path.abspath(path).startswith(root + os.sep)
+        }
+        self.sub_title = "SEARCHING..."
+        self._run_search(parsed, unsaved)
+
+    @work(thread=True, exclusive=True, group="search")
+    def _run_search(self, query: SearchQuery, unsaved: dict[str, PieceTable]) -> None:
+        """Search the project, streaming hits to the results list as they are found."""
+        worker = get_current_worker()
+        started = time.perf_counter()
+        files = self._file_index
+        if not files.scanned and not files.paths:
+            files.scan(lambda: worker.is_cancelled)
+        overrides = {relative: snapshot.text for relative, snapshot in unsaved.items()}
+        read = search(
+            files.root,
+            files.paths,
+            query,
+            lambda hits: self.call_from_thread(self._add_search_hits, worker, hits),
+            lambda: worker.is_cancelled,
+            self._search_index,
+            overrides,
+        )
+        if read is not None and not worker.is_cancelled:
+            self.call_from_thread(
+                self._search_finished, worker, read, time.perf_counter() - started
+            )
+
+    def _add_search_hits(self, worker, hits: list[SearchHit]) -> None:
+        if worker.is_cancelled or not self.search_mode:
+            return
+        room = MAX_SEARCH_HITS - len(self._search_hits)
+        if room <= 0:
+            return
+        hits = hits[:room]
+        start = len(self._search_hits)
+        self._search_hits.extend(hits)
+        results = self.query_one("#search-results", OptionList)
+        results.add_options(
+            [_hit_option(hit, str(start + offset)) for offset, hit in enumerate(hits)]
+        )
+        if results.highlighted is None:
+            results.highlighted = 0
+        self.sub_title = f"SEARCHING... {len(self._search_hits)} HITS"
+
+    def _search_finished(self, worker, read: int, seconds: float) -> None:
+        if worker.is_cancelled or not self.search_mode:
+            return
+        shown = len(self._search_hits)
+        more = "+" if shown >= MAX_SEARCH_HITS else ""
+        self.sub_title = f"{shown}{more} HITS, {read} FILES READ ({seconds * 1000:.0f} ms)"
+
+    def watch_symbol_mode(self, symbol_mode: bool) -> None:
+        """Called when symbol_mode is modified."""
+        self.set_class(symbol_mode, "-symbol-mode")
+        symbol_input = self.query_one("#symbol-input", Input)
+        if symbol_mode:
+            self._show_symbol_results(symbol_input.value)
+            symbol_input.focus()
+            self._scan_files()
+        else:
+            symbol_input.value = ""
+            self._symbol_results = []
+            self.query_one("#symbol-results", OptionList).clear_options()
+            if self.path is not None:
+                self.query_one("#code-editor", TextArea).focus()
+            else:
+                self.query_one("#tree-view", DirectoryTree).focus()
+
+    @work(thread=True, exclusive=True, group="symbol-index")
+    def _refresh_symbol_index(self) -> None:
+        """Parse the files that are new or changed since the symbol index last saw them."""
+        worker = get_current_worker()
+        index = self._symbol_index
+        started = time.perf_counter()
+        parsed = index.refresh(self._file_index.paths, lambda: worker.is_cancelled)
+        if parsed is None:
+            if index.error is not None and not worker.is_cancelled:
+                self.call_from_thread(self._symbol_index_failed, index.error)
+            return
+        self.log.debug(
+            f"symbol index: {parsed} files parsed, {index.symbol_count} symbols,"
+            f" in {time.perf_counter() - started:.2f}s"
+        )
+        if parsed and not worker.is_cancelled:
+            self.call_from_thread(self._symbol_index_refreshed)
+
+    def _symbol_index_failed(self, error: str) -> None:
+        self.symbol_mode = False
+        self.sub_title = f"SYMBOLS UNAVAILABLE: {error[:60]}"
+        self.refresh_bindings()
+
+    def _symbol_index_refreshed(self) -> None:
+        if self.symbol_mode:
+            self._show_symbol_results(self.query_one("#symbol-input", Input).value)
+
+    @work(thread=True, group="symbol-index-update")
+    def _update_saved_symbols(self, saved: list[tuple[str, PieceTable]]) -> None:
+        """Re-parse the symbols of files just written to disk."""
+        for relative, snapshot in saved:
+            self._symbol_index.update_file(relative, snapshot.text)
+
+    def _show_symbol_results(self, query: str) -> None:
+        results = self.query_one("#symbol-results", OptionList)
+        results.clear_options()
+        if not query.strip():
+            self._symbol_results = []
+            self.sub_title = "GO TO SYMBOL"
+            return
+        started = time.perf_counter()
+        symbols = self._symbol_results = self._symbol_index.lookup(query, SYMBOL_RESULTS)
+        results.add_options(
+            [_symbol_option(symbol, str(index)) for index, symbol in enumerate(symbols)]
+        )
+        if symbols:
+            results.highlighted = 0
+        self.sub_title = (
+            f"{len(symbols)} SYMBOLS"
+            f" ({(time.perf_counter() - started) * 1000:.0f} ms)"
+        )
+
+    def watch_replace_mode(self, replace_mode: bool) -> None:
+        """Called when replace_mode is modified."""
+        self.set_class(replace_mode, "-replace-mode")
+        replace_input = self.query_one("#replace-input", Input)
+        if replace_mode:
+            replace_input.focus()
+            # Searches wait for the refresh that follows the scan, so they
+            # see files edited outside the app.
+            self._search_index.expect_refresh()
+            self._scan_files()
+        else:
+            self._cancel_replace_preview()
+            self._replacements = []
+            self._replacement_options = []
+            self._rejected_replacements = set()
+            self.query_one("#replace-results", OptionList).clear_options()
+            replace_input.value = ""
+            self.query_one("#replace-with", Input).value = ""
+            if self.path is not None:
+                self.query_one("#code-editor", TextArea).focus()
+            else:
+                self.query_one("#tree-view", DirectoryTree).focus()
+
+    def _schedule_replace_preview(self) -> None:
+        """Preview the replacement once typing pauses, cancelling any running preview."""
+        self._cancel_replace_preview()
+        self.query_one("#replace-results", OptionList).clear_options()
+        self._replacements = []
+        self._replacement_options = []
+        self._rejected_replacements = set()
+        self._replace_preview_lines = 0
+        query = self.query_one("#replace-input", Input).value
+        if len(query) < MIN_SEARCH_CHARS:
+            self.sub_title = "REPLACE"
+            return
+        replacement = self.query_one("#replace-with", Input).value
+        self._replace_timer = self.set_timer(
+            SEARCH_DELAY, lambda: self._start_replace_preview(query, replacement)
+        )
+
+    def _cancel_replace_preview(self) -> None:
+        if self._replace_timer is not None:
+            self._replace_timer.stop()
+            self._replace_timer = None
+        self.workers.cancel_group(self, "replace-preview")
+        self._replace_previewing = False
+
+    def _start_replace_preview(self, query: str, replacement: str) -> None:
+        self._replace_timer = None
+        try:
+            parsed = parse_query(query)
+            template = replacement_template(query, replacement, parsed.pattern)
+        except re.error as error:
+            self.sub_title = f"BAD PATTERN: {str(error)[:40]}"
+            return
+        self._record_editor_edits()
+        root = os.path.abspath(self.root_path)
+        unsaved = {
+            os.path.relpath(path, root): self.buffers[path].snapshot()
+            for path in self.dirty_buffers
+            if path in self.buffers and os.path.abspath(path).startswith(root + os.sep)
+        }
+        self._replace_previewing = True
+        self.sub_title = "FINDING REPLACEMENTS..."
+        self._run_replace_preview(parsed, template, unsaved)
+
+    @work(thread=True, exclusive=True, group="replace-preview")
+    def _run_replace_preview(
+        self, query: SearchQuery, template: str, unsaved: dict[str, PieceTable]
+    ) -> None:
+        """Compute the replacements, streaming each file's preview as it is ready."""
+        worker = get_current_worker()
+        started = time.perf_counter()
+        files = self._file_index
+        if not files.scanned and not files.paths:
+            files.scan(lambda: worker.is_cancelled)
+        overrides = {relative: snapshot.text for relative, snapshot in unsaved.items()}
+        finished = find_replacements(
+            files.root,
+            files.paths,
+            query,
+            template,
+            lambda found: self.call_from_thread(self._add_replacements, worker, found),
+            lambda: worker.is_cancelled,
+            self._search_index,
+            overrides,
+        )
+        if finished and not worker.is_cancelled:
+            self.call_from_thread(
+                self._replace_preview_finished, worker, time.perf_counter() - started
+            )
+
+    def _add_replacements(self, worker, found: list[FileReplacement]) -> None:
+        if worker.is_cancelled or not self.replace_mode:
+            return
+        results = self.query_one("#replace-results", OptionList)
+        options = []
+        start = results.option_count
+        for replacement in found:
+            number = len(self._replacements)
+            self._replacements.append(replacement)
+            self._replacement_options.append(start + len(options))
+            options.append(Option(_replacement_header(replacement, True), id=f"file-{number}"))
+            if self._replace_preview_lines < MAX_PREVIEW_LINES:
+                hunk_options = [
+                    option for hunk in replacement.hunks for option in _hunk_options(hunk)
+                ]
+                self._replace_preview_lines += len(hunk_options)
+                options.extend(hunk_options)
+        results.add_options(options)
+        if results.highlighted is None:
+            results.highlighted = 0
+        self.sub_title = f"FINDING REPLACEMENTS... {len(self._replacements)} FILES"
+
+    def _replace_preview_finished(self, worker, seconds: float) -> None:
+        if worker.is_cancelled or not self.replace_mode:
+            return
+        self._replace_previewing = False
+        edits = sum(len(replacement.edits) for replacement in self._replacements)
+        self.sub_title = (
+            f"{edits} REPLACEMENTS IN {len(self._replacements)} FILES"
+            f" ({seconds * 1000:.0f} ms): ENTER APPLIES"
+        )
+
+    def _toggle_replacement(self, number: int) -> None:
+        """Include or leave out one file's replacements."""
+        if number in self._rejected_replacements:
+            self._rejected_replacements.discard(number)
+        else:
+            self._rejected_replacements.add(number)
+        self.query_one("#replace-results", OptionList).replace_option_prompt_at_index(
+            self._replacement_options[number],
+            _replacement_header(
+                self._replacements[number], number not in self._rejected_replacements
+            ),
+        )
+
     def watch_selection_mode(self, selection_mode: bool) -> None:
         """Called when selection mode is modified."""
         self.set_class(selection_mode, "-selection-mode")
@@ -55,43 +511,156 @@ class WatchersMixin:
     def watch_path(self, path: str | None) -> None:
         """Called when path changes."""
         self.selection_mode = False
+        self.workers.cancel_group(self, "file-load")
         code_view = self.query_one("#code-editor", TextArea)
         static_view = self.query_one("#code-static", Static)
+        self.set_class(path in self._large_files, "-large-file")
         if path is None:
             self._loading_buffer = True
             code_view.text = ""
             self._loading_buffer = False
             static_view.update("")
+            self._static_window = None
             return
 
-        if path in self.buffers:
-            code = self.buffers[path]
-        else:
-            try:
-                code = Path(path).read_text(encoding="utf-8")
-            except Exception:
-                self._loading_buffer = True
-                code_view.text = "Unable to read file"
-                self._loading_buffer = False
-                static_view.update(Traceback(theme="github-dark", width=None))
-                self.sub_title = "ERROR"
+        self._activate_tab(path)
+        mapped = self._large_files.get(path)
+        if mapped is not None:
+            self._show_large_file(path, mapped)
+            return
+        if path not in self.buffers:
+            self._start_file_load(path)
+            return
+        self._show_buffer(path)
+
+    def _start_file_load(self, path: str, full: bool = False) -> None:
+        """Show a placeholder for `path` and read it in the background."""
+        code_view = self.query_one("#code-editor", TextArea)
+        self._loading_buffer = True
+        code_view.text = ""
+        self._loading_buffer = False
+        self.query_one("#code-static", Static).update(f"Loading {Path(path).name}...")
+        self._static_window = None
+        self.sub_title = f"LOADING {path}"
+        self._load_file(path, full)
+
+    @work(thread=True, exclusive=True, group="file-load")
+    def _load_file(self, path: str, full: bool = False) -> None:
+        """Read a file in a worker thread; a newer load cancels this one.
+
+        Files above `large_file_threshold` are memory-mapped for read-only
+        viewing instead, unless `full` asks for them to be loaded for editing.
+        """
+        worker = get_current_worker()
+        try:
+            if not full and Path(path).stat().st_size > self.large_file_threshold:
+                sniff_text_file(path)
+                mapped = MappedFile(path)
+                if worker.is_cancelled:
+                    mapped.close()
+                else:
+                    self.call_from_thread(self._large_file_opened, path, mapped)
                 return
-            self.buffers[path] = code
-            self.saved_buffers[path] = code
+            code = read_text_file(path, lambda: worker.is_cancelled)
+        except Exception as error:
+            if not worker.is_cancelled:
+                self.call_from_thread(self._file_load_failed, path, error)
+            return
+        if code is not None and not worker.is_cancelled:
+            self.call_from_thread(self._file_loaded, path, code)
+
+    def _large_file_opened(self, path: str, mapped: MappedFile) -> None:
+        if path != self.path or path not in self.open_tabs or path in self._large_files:
+            mapped.close()
+            return
+        self._large_files[path] = mapped
+        self._index_large_file(mapped)
+        self._show_large_file(path, mapped)
+
+    @work(thread=True, group="large-file-index")
+    def _index_large_file(self, mapped: MappedFile) -> None:
+        """Finish the line index so the scrollbar reflects the real line count."""
+        worker = get_current_worker()
+        view = self.query_one("#large-file-view", LargeFileView)
+        chunks = 0
+        while not worker.is_cancelled and mapped.index_chunk():
+            chunks += 1
+            if chunks % 64 == 0:
+                self.call_from_thread(view.refresh_line_count)
+        if not worker.is_cancelled:
+            self.call_from_thread(view.refresh_line_count)
+
+    def _show_large_file(self, path: str, mapped: MappedFile) -> None:
+        """Show a memory-mapped file in the paged read-only view."""
+        self.set_class(True, "-large-file")
+        self.query_one("#code-static", Static).update("")
+        self._static_window = None
+        view = self.query_one("#large-file-view", LargeFileView)
+        view.show(mapped)
+        view.focus()
+        self.sub_title = f"{path} [LARGE FILE, READ-ONLY: e TO EDIT]"
+
+    def _file_loaded(self, path: str, code: str) -> None:
+        if path != self.path or path in self.buffers:
+            return
+        self._show_buffer(path, code)
 
+    def _file_load_failed(self, path: str, error: Exception) -> None:
+        if path != self.path:
+            return
+        code_view = self.query_one("#code-editor", TextArea)
+        static_view = self.query_one("#code-static", Static)
         self._loading_buffer = True
-        code_view.text = code
+        code_view.text = "Unable to read file"
         self._loading_buffer = False
-        static_view.update(highlight(code, path=path))
-        self._apply_editor_language(path, code)
-        saved_cursor = self.cursor_positions.get(path, (0, 0))
-        code_view.cursor_location = saved_cursor
-        if path not in self.cursor_positions:
-            code_view.scroll_home(animate=False)
+        if isinstance(error, UnsupportedFileError):
+            static_view.update(f"Unable to read file: {error}")
+            self.sub_title = f"ERROR: {str(error).upper()}"
+        else:
+            static_view.update(
+                Traceback.from_exception(
+                    type(error), error, error.__traceback__, theme="github-dark", width=None
+                )
+            )
+            self.sub_title = "ERROR"
+        self._static_window = None
+
+    def _show_buffer(self, path: str, code: str | None = None) -> None:
+        """Make `path` the editor's active buffer, loading `code` if it is new.
+
+        The editor keeps one document per open tab, so switching back to a
+        tab restores its parse tree, highlights, undo history and scroll
+        position instead of re-parsing its text.
+        """
+        code_view = self.query_one("#code-editor", CodeEditor)
+        document = self.buffers.get(path)
+        if document is not None and code_view.show_document(path):
+            self._apply_editor_language(path, document)
+        else:
+            if code is None:
+                code = document.text if document is not None else ""
+            language = self._language_for_code(path, document or PieceTable(code))
+            self._register_grammar(code_view, language)
+            if language not in code_view.available_languages:
+                language = None
+            try:
+                code_view.open_document(path, code, language)
+            except LanguageDoesNotExist:
+                code_view.open_document(path, code, None)
+            if document is None:
+                # Keep the buffer in the editor's line-ending normalised form so
+                # recorded edit locations map onto it exactly.
+                document = PieceTable(code_view.text, code_view.document.newline)
+                self.buffers[path] = document
+            code_view.cursor_location = self.cursor_positions.get(path, (0, 0))
+            if path not in self.cursor_positions:
+                code_view.scroll_home(animate=False)
         code_view.focus()
         self.sub_title = path
+        self.call_after_refresh(self._render_code_static)
 
-        # Activate the corresponding tab
+    def _activate_tab(self, path: str) -> None:
+        """Activate the tab for `path` without re-triggering a file switch."""
         tab_id = path_to_tab_id(path)
         try:
             tabs = self.query_one("#file-tabs", Tabs)
@@ -103,3 +672,28 @@ class WatchersMixin:
                     self._switching_tab = False
         except Exception:
             pass
+
+    def _render_code_static(self) -> None:
+        """Highlight the part of the active buffer around the editor viewport."""
+        static_view = self.query_one("#code-static", Static)
+        document = self.buffers.get(self.path) if self.path is not None else None
+        if document is None:
+            self._static_window = None
+            static_view.update("")
+            return
+        code_view = self.query_one("#code-editor", TextArea)
+        top = code_view.scroll_offset.y
+        height = max(code_view.size.height, 1)
+        static_view.update(self._highlights.render(document, self.path, top, height))
+        self._static_window = (self.path, top - VIEWPORT_MARGIN, top + height + VIEWPORT_MARGIN)
+
+    def _watch_editor_scroll(self, _scroll_y: float) -> None:
+        """Re-render the highlighted view once the viewport leaves its margin."""
+        if self._static_window is None:
+            return
+        path, first_row, last_row = self._static_window
+        code_view = self.query_one("#code-editor", TextArea)
+        top = code_view.scroll_offset.y
+        if path == self.path and first_row <= top and top + code_view.size.height <= last_row:
+            return
+        self._render_code_static()
@@ -2,12 +2,34 @@
 
 from __future__ import annotations
 
+import dataclasses
 import hashlib
+import os
+from collections import defaultdict
 from pathlib import Path
+from typing import NamedTuple
 
+from rich.segment import Segment
+from rich.text import Text
+from textual import work
 from textual.containers import Horizontal, Vertical
+from textual.geometry import Offset, Size
 from textual.screen import ModalScreen
-from textual.widgets import Button, Label, Tab
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+from textual.widgets import Button, DirectoryTree, Label, Tab, TextArea, Tree
+from textual.widgets.directory_tree import DirEntry
+from textual.widgets.text_area import DocumentNavigator, Selection, WrappedDocument
+from textual.widgets.tree import TreeNode
+from textual.worker import get_current_worker
+
+from .document import normalize_newlines
+from .ignore import IgnoreRules
+from .large_file import MappedFile
+
+
+# Entries a folder shows when expanded, and how many more each "more" node adds.
+TREE_PAGE_SIZE = 200
 
 
 def path_to_tab_id(path: str) -> str:
@@ -74,3 +96,398 @@ class FileTab(Tab):
         prefix = "● " if dirty else ""
         super().__init__(f"{prefix}{name}", id=path_to_tab_id(file_path))
         self.file_path = file_path
+
+
+class _WrappedDocument(WrappedDocument):
+    """A WrappedDocument whose height does not walk every line.
+
+    TextArea asks for the height once per rendered row; the stock property
+    sums the wrap offsets of the whole document each time, which makes every
+    repaint of a large file linear in its length. There is exactly one line
+    info entry per visual line, so its length is the height.
+
+    `_offset_to_line_info` is internal to WrappedDocument; see the
+    compatibility notes on `CodeEditor`.
+    """
+
+    @property
+    def height(self) -> int:
+        return len(self._offset_to_line_info)
+
+
+class _DocumentState(NamedTuple):
+    """Everything a CodeEditor needs to show a document again without rebuilding it."""
+
+    document: object
+    wrapped_document: object
+    navigator: object
+    highlight_query: object
+    highlights: dict
+    history: object
+    language: str | None
+    selection: Selection
+    scroll: Offset
+    virtual_size: Size
+    pending_edits: list
+
+
+class CodeEditor(TextArea):
+    """A TextArea that records every document edit as a replace operation.
+
+    All edits, including undo and redo, reach the document through
+    `replace_range`, so the editor wraps that method on each new document
+    and queues `(start, end, text)` operations for the app to replay into
+    its own buffer model.
+
+    Documents opened with `open_document` are kept per key when another one
+    is shown, together with their syntax tree, highlights, undo history,
+    selection and scroll position, so switching back is a swap rather than
+    a re-parse.
+
+    While editing, the highlight map is rebuilt once per refresh instead of
+    after every edit, so a burst of keystrokes costs one tree query.
+
+    TextArea has no public API for any of this, so the editor relies on a
+    few of its internals. They are all used in the compatibility section at
+    the end of the class and nowhere else, against the Textual version
+    pinned in requirements.txt; check that section when upgrading.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        self._pending_edits: list[tuple[tuple[int, int], tuple[int, int], str]] = []
+        self._compiled_queries: dict[str, object] = {}
+        self._documents: dict[str, _DocumentState] = {}
+        self._active_key: str | None = None
+        self._setting_document = False
+        self._highlights_stale = False
+        super().__init__(*args, **kwargs)
+
+    def register_compiled_language(self, name: str, language, highlight_query) -> None:
+        """Register a language whose highlight query is already compiled.
+
+        TextArea compiles the query string again for every new document, so
+        the language is registered with an empty query and the shared
+        compiled one is swapped in after each document is built.
+        """
+        self.register_language(name, language, "")
+        self._compiled_queries[name] = highlight_query
+
+    def _flush_highlight_map(self) -> None:
+        """Rebuild the highlight map if edits have made it stale."""
+        if self._highlights_stale:
+            self._highlights_stale = False
+            self._rebuild_highlight_map()
+            self.refresh()
+
+    def load_text(self, text: str) -> None:
+        """Replace the text with a document that is not kept for any key."""
+        if self._stash_active_document():
+            self.history = dataclasses.replace(self.history)
+        super().load_text(text)
+        self._pending_edits.clear()
+
+    @property
+    def active_key(self) -> str | None:
+        return self._active_key
+
+    def open_document(self, key: str, text: str, language: str | None) -> None:
+        """Show a new document for `key`, parsed once with `language`."""
+        self._stash_active_document()
+        self._documents.pop(key, None)
+        self.history = dataclasses.replace(self.history)
+        self.set_reactive(CodeEditor.language, language)
+        self._set_document(text, language)
+        self._pending_edits = []
+        self._active_key = key
+
+    def show_document(self, key: str) -> bool:
+        """Show the kept document for `key`. Returns False if there is none."""
+        if key == self._active_key:
+            return True
+        state = self._documents.get(key)
+        if state is None:
+            return False
+        self._stash_active_document()
+        del self._documents[key]
+        self._restore_document(state)
+        self.history = state.history
+        self._pending_edits = state.pending_edits
+        self.set_reactive(CodeEditor.language, state.language)
+        self._active_key = key
+        self.selection = state.selection
+        self.scroll_to(state.scroll.x, state.scroll.y, animate=False, immediate=True)
+        self.refresh()
+        return True
+
+    def forget_document(self, key: str) -> None:
+        """Drop the document kept for `key`, e.g. when its tab is closed."""
+        self._documents.pop(key, None)
+        if key == self._active_key:
+            self._active_key = None
+
+    def _stash_active_document(self) -> bool:
+        key = self._active_key
+        if key is None:
+            return False
+        self._flush_highlight_map()
+        highlight_query, highlights = self._highlight_state()
+        self._documents[key] = _DocumentState(
+            self.document,
+            self.wrapped_document,
+            self.navigator,
+            highlight_query,
+            highlights,
+            self.history,
+            self.language,
+            self.selection,
+            self.scroll_offset,
+            self.virtual_size,
+            self._pending_edits,
+        )
+        self._pending_edits = []
+        self._active_key = None
+        return True
+
+    def take_edits(self) -> list[tuple[tuple[int, int], tuple[int, int], str]]:
+        """Return and clear the edits recorded since the last call."""
+        edits = self._pending_edits
+        self._pending_edits = []
+        return edits
+
+    # Compatibility with TextArea internals (Textual 8.2.8).
+    #
+    # Overrides: `_set_document` builds every document, `_build_highlight_map`
+    # runs after every edit. Attributes: `_highlight_query`, `_highlights`,
+    # `_line_cache`. Methods: `_rewrap_and_refresh_virtual_size`,
+    # `_refresh_scrollbars`. WrappedDocument attributes: `_width`,
+    # `_tab_width`, and `_offset_to_line_info` in `_WrappedDocument`.
+
+    def _set_document(self, text: str, language: str | None) -> None:
+        # A stashed document keeps its highlight map, which TextArea would
+        # otherwise clear in place.
+        self._highlights = defaultdict(list)
+        self._setting_document = True
+        try:
+            super()._set_document(text, language)
+            self.wrapped_document = _WrappedDocument(self.document, tab_width=self.indent_width)
+            self.navigator = DocumentNavigator(self.wrapped_document)
+            self._rewrap_and_refresh_virtual_size()
+            compiled_query = self._compiled_queries.get(language)
+            if compiled_query is not None and self._highlight_query is not None:
+                self._highlight_query = compiled_query
+                self._build_highlight_map()
+        finally:
+            self._setting_document = False
+        document = self.document
+        replace_range = document.replace_range
+
+        def recording_replace_range(start, end, text):
+            top, bottom = sorted((start, end))
+            self._pending_edits.append((top, bottom, normalize_newlines(text, document.newline)))
+            return replace_range(start, end, text)
+
+        document.replace_range = recording_replace_range
+
+    def _build_highlight_map(self) -> None:
+        if self._setting_document or not self.is_mounted:
+            self._highlights_stale = False
+            self._rebuild_highlight_map()
+            return
+        if not self._highlights_stale:
+            self._highlights_stale = True
+            self.call_after_refresh(self._flush_highlight_map)
+
+    def _rebuild_highlight_map(self) -> None:
+        super()._build_highlight_map()
+
+    def _highlight_state(self) -> tuple[object, dict]:
+        return self._highlight_query, self._highlights
+
+    def _restore_document(self, state: _DocumentState) -> None:
+        self.document = state.document
+        self.wrapped_document = state.wrapped_document
+        self.navigator = state.navigator
+        self._highlight_query = state.highlight_query
+        self._highlights = state.highlights
+        self._line_cache.clear()
+        if (
+            self.wrapped_document._width == self.wrap_width
+            and self.wrapped_document._tab_width == self.indent_width
+        ):
+            self.virtual_size = state.virtual_size
+            self._refresh_scrollbars()
+        else:
+            self._rewrap_and_refresh_virtual_size()
+
+
+class LargeFileView(ScrollView, can_focus=True):
+    """Read-only view that only decodes the lines currently on screen."""
+
+    def __init__(self, *, id: str | None = None) -> None:
+        super().__init__(id=id)
+        self._file: MappedFile | None = None
+        self._widest = 0
+
+    def show(self, mapped: MappedFile | None) -> None:
+        """Display `mapped`, keeping the scroll position if it is already shown."""
+        if mapped is not self._file:
+            self._file = mapped
+            self._widest = 0
+            self.scroll_to(0, 0, animate=False)
+        self.refresh_line_count()
+
+    def refresh_line_count(self) -> None:
+        """Resize the scrollable area, e.g. after more of the file was indexed."""
+        lines = self._file.line_count if self._file is not None else 0
+        self.virtual_size = Size(self._widest, lines)
+        self.refresh()
+
+    def render_line(self, y: int) -> Strip:
+        scroll_x, scroll_y = self.scroll_offset
+        width = self.size.width
+        style = self.rich_style
+        lines = self._file.lines(scroll_y + y, 1) if self._file is not None else []
+        if not lines:
+            return Strip.blank(width, style)
+        strip = Strip([Segment(lines[0].expandtabs(4), style)])
+        if strip.cell_length > self._widest:
+            self._widest = strip.cell_length
+            self.call_later(self.refresh_line_count)
+        return strip.crop_extend(scroll_x, scroll_x + width, style)
+
+
+@dataclasses.dataclass
+class _MoreEntries(DirEntry):
+    """Data of the node standing in for the entries of a folder not shown yet."""
+
+    label: str = ""
+    remaining: list[tuple[Path, bool]] = dataclasses.field(default_factory=list)
+
+
+class ProjectTree(DirectoryTree):
+    """A DirectoryTree that hides ignored entries and pages large folders.
+
+    Entries matched by .gitignore files or by `exclude` are left out. Each
+    folder is read with one scandir in the loader thread, which also says
+    which entries are folders, so expanding one never stats its entries on
+    the UI thread. Listings are cached with the folder's mtime and reused
+    while it is unchanged. A folder first shows TREE_PAGE_SIZE entries;
+    the rest sit behind a "more" node that adds the next page when selected.
+
+    DirectoryTree has no public hook for any of this, so `_load_directory`,
+    `_populate_node` and `_on_tree_node_selected` override its private
+    methods as of Textual 8.2 (pinned in requirements.txt). Its loader only
+    passes what `_load_directory` returns on to `_populate_node`, which is
+    why the two can trade `(path, is_dir)` pairs instead of bare paths.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        exclude: list[str] | tuple[str, ...] = (),
+        id: str | None = None,
+    ) -> None:
+        self._exclude = tuple(exclude)
+        self._rules: dict[str, IgnoreRules] = {}
+        self._listings: dict[str, tuple[int, list[tuple[str, bool]]]] = {}
+        super().__init__(path, id=id)
+
+    async def watch_path(self) -> None:
+        self._rules.clear()
+        self._listings.clear()
+        await super().watch_path()
+
+    def _relative(self, directory: str) -> str:
+        relative = os.path.relpath(directory, os.path.abspath(self.path))
+        return "" if relative == "." else relative.replace(os.sep, "/")
+
+    def _rules_for(self, directory: str) -> IgnoreRules:
+        """The ignore rules in effect in `directory`, an absolute path."""
+        rules = self._rules.get(directory)
+        if rules is None:
+            relative = self._relative(directory)
+            if not relative or relative.startswith(".."):
+                rules = IgnoreRules.for_root(directory, self._exclude)
+            else:
+                parent = self._rules_for(os.path.dirname(directory))
+                rules = parent.extended(directory, relative)
+            self._rules[directory] = rules
+        return rules
+
+    @work(thread=True, exit_on_error=False)
+    def _load_directory(self, node: TreeNode[DirEntry]) -> list[tuple[Path, bool]]:
+        """List a folder's visible entries, folders first, as (path, is_dir) pairs."""
+        assert node.data is not None
+        worker = get_current_worker()
+        location = node.data.path
+        directory = os.path.abspath(location.expanduser())
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return []
+        cached = self._listings.get(directory)
+        if cached is None or cached[0] != mtime_ns:
+            entries: list[tuple[str, bool]] = []
+            try:
+                with os.scandir(directory) as scan:
+                    for entry in scan:
+                        if worker.is_cancelled:
+                            return []
+                        try:
+                            is_dir = entry.is_dir()
+                        except OSError:
+                            is_dir = False
+                        entries.append((entry.name, is_dir))
+            except OSError:
+                return []
+            entries.sort(key=lambda item: (not item[1], item[0].lower()))
+            cached = self._listings[directory] = (mtime_ns, entries)
+        rules = self._rules_for(directory)
+        prefix = self._relative(directory)
+        prefix = f"{prefix}/" if prefix else ""
+        return [
+            (location / name, is_dir)
+            for name, is_dir in cached[1]
+            if not rules.ignored(prefix + name, is_dir)
+        ]
+
+    def _populate_node(
+        self, node: TreeNode[DirEntry], content: list[tuple[Path, bool]]
+    ) -> None:
+        node.remove_children()
+        self._add_entries(node, content)
+        node.expand()
+
+    def _add_entries(self, node: TreeNode[DirEntry], entries: list[tuple[Path, bool]]) -> None:
+        for path, is_dir in entries[:TREE_PAGE_SIZE]:
+            node.add(path.name, data=DirEntry(path), allow_expand=is_dir)
+        remaining = entries[TREE_PAGE_SIZE:]
+        if remaining:
+            assert node.data is not None
+            label = f"... {len(remaining)} more"
+            node.add_leaf(
+                label, data=_MoreEntries(node.data.path, label=label, remaining=remaining)
+            )
+
+    def render_label(self, node: TreeNode[DirEntry], base_style, style) -> Text:
+        if isinstance(node.data, _MoreEntries):
+            label = Text(node.data.label)
+            label.stylize(style)
+            label.stylize_before("italic")
+            label.stylize_before(
+                self.get_component_rich_style("directory-tree--hidden", partial=True)
+            )
+            return label
+        return super().render_label(node, base_style, style)
+
+    async def _on_tree_node_selected(self, event: Tree.NodeSelected[DirEntry]) -> None:
+        more = event.node.data
+        if not isinstance(more, _MoreEntries):
+            return
+        event.stop()
+        event.prevent_default()
+        parent = event.node.parent
+        event.node.remove()
+        if parent is not None:
+            self._add_entries(parent, more.remaining)
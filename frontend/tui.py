@@ -32,6 +32,26 @@ def _parse_args() -> argparse.Namespace:
         default=Path.cwd(),
         help="Directory to open (defaults to the current working directory).",
     )
+    parser.add_argument(
+        "--large-file-mb",
+        type=float,
+        default=None,
+        help=(
+            "Open files larger than this many MB read-only in large-file mode "
+            "(defaults to CODE_BROWSER_LARGE_FILE_MB or 16)."
+        ),
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=None,
+        metavar="PATTERN",
+        help=(
+            "Hide paths matching this gitignore-style pattern from the tree, file "
+            "finder, search and related-code retrieval; may be repeated (defaults to "
+            "CODE_BROWSER_EXCLUDE, comma separated)."
+        ),
+    )
     return parser.parse_args()
 
 
@@ -39,4 +59,9 @@ if __name__ == "__main__":
     args = _parse_args()
     from code_browser import CodeBrowser
 
-    CodeBrowser(root_path=args.path).run()
+    threshold = None
+    if args.large_file_mb is not None:
+        threshold = int(args.large_file_mb * 1024 * 1024)
+    CodeBrowser(
+        root_path=args.path, large_file_threshold=threshold, exclude=args.exclude
+    ).run()